@@ -282,6 +282,28 @@ class Component(ParameterGroup, util.CompatibilityPatch):
         """
         pass
 
+    def gradient(self, param):
+        """
+        The derivative of :func:`~peri.comp.comp.Component.get` on the
+        current tile with respect to the parameter `param`. Components whose
+        output has a simple analytic form (such as the fields which are
+        linear in their coefficients) should implement this so that states
+        can skip finite differences for their parameters.
+
+        Parameters
+        -----------
+        param : string
+            The name of a parameter of this component
+
+        Returns
+        -------
+        grad : ndarray, number or None
+            An object which can stand in for the output of `get` in the
+            model's difference equation, or None if there is no analytic
+            derivative available.
+        """
+        return None
+
     # functions that allow better handling of component collections
     def exports(self):
         """ Which methods a class wants to expose to parent classes """
@@ -295,10 +317,19 @@ class Component(ParameterGroup, util.CompatibilityPatch):
         """ Registery a parent object so that communication maybe happen upwards """
         self._parent = obj
 
-    def trigger_parameter_change(self):
-        """ Notify parents of a parameter change """
-        if self._parent:
+    def trigger_parameter_change(self, added=None, removed=None):
+        """
+        Notify parents of a parameter change. If the names of the parameters
+        which were `added` and `removed` are given, parents only update the
+        entries for those parameters.
+        """
+        if not self._parent:
+            return
+        if added is None and removed is None:
             self._parent.trigger_parameter_change()
+        else:
+            self._parent.trigger_parameter_change(comp=self,
+                    added=added or [], removed=removed or [])
 
     def trigger_update(self, params, values):
         """ Notify parent of a parameter change """
@@ -326,6 +357,9 @@ class GlobalScalar(Component):
     def get(self):
         return self.values[0]
 
+    def gradient(self, param):
+        return 1.0
+
     def get_update_tile(self, params, values):
         return self.shape
 
@@ -408,6 +442,7 @@ class ComponentCollection(Component):
 
         self.pmap = pmap
         self.lmap = lmap
+        self.cmap = {c: i for i, c in enumerate(self.comps)}
         self.sync_params()
 
     def split_params(self, params, values=None):
@@ -420,24 +455,21 @@ class ComponentCollection(Component):
                 (slab) [slab params] [slab vals]
             ]
         """
-        pc, vc = [], []
+        pc = [[] for c in self.comps]
+        vc = [[] for c in self.comps]
 
         returnvalues = values is not None
         if values is None:
             values = [0]*len(util.listify(params))
 
-        for c in self.comps:
-            tp, tv = [], []
-            for p,v in zip(util.listify(params), util.listify(values)):
-                if not p in self.lmap:
-                    raise NotAParameterError("%r does not belong to %r" % (p, self))
-
-                if c in self.pmap[p]:
-                    tp.append(p)
-                    tv.append(v)
+        for p, v in zip(util.listify(params), util.listify(values)):
+            comps = self.lmap.get(p)
+            if not comps:
+                raise NotAParameterError("%r does not belong to %r" % (p, self))
 
-            pc.append(tp)
-            vc.append(tv)
+            for c in comps:
+                pc[self.cmap[c]].append(p)
+                vc[self.cmap[c]].append(v)
 
         if returnvalues:
             return pc, vc
@@ -459,11 +491,19 @@ class ComponentCollection(Component):
         return True
 
     def get_values(self, params):
-        vals = []
-        for p in util.listify(params):
-            if not p in self.lmap:
+        # ask each component for all of its values at once
+        plist = util.listify(params)
+        groups = OrderedDict()
+        for i, p in enumerate(plist):
+            comps = self.lmap.get(p)
+            if not comps:
                 raise NotAParameterError("%r does not belong to %r" % (p, self))
-            vals.append(self.lmap[p][0].get_values(p))
+            groups.setdefault(comps[0], []).append(i)
+
+        vals = [None]*len(plist)
+        for c, inds in iteritems(groups):
+            for i, v in zip(inds, c.get_values([plist[i] for i in inds])):
+                vals[i] = v
         return util.delistify(vals, params)
 
     def set_values(self, params, values):
@@ -524,6 +564,20 @@ class ComponentCollection(Component):
         fields = [c.get() for c in self.comps]
         return self.field_reduce_func(fields)
 
+    def gradient(self, param):
+        """
+        Derivative of the combined field, only available when the fields
+        are added together and each component affected by `param` has an
+        analytic derivative.
+        """
+        if self.field_reduce_func is not reduce_add:
+            return None
+
+        grads = [c.gradient(param) for c in self.lmap.get(param, [])]
+        if len(grads) == 0 or any(g is None for g in grads):
+            return None
+        return reduce_add(grads)
+
     def set_tile(self, tile):
         """ Set the current working tile for components """
         for c in self.comps:
@@ -534,8 +588,30 @@ class ComponentCollection(Component):
         for c in self.comps:
             c.set_shape(shape, inner)
 
-    def sync_params(self):
-        """ Ensure that shared parameters are the same value everywhere """
+    def update_params(self, comp, added=(), removed=()):
+        """
+        Update the parameter maps for the parameter names `added` to and
+        `removed` from the component `comp`, rather than rebuilding them for
+        every parameter as in `setup_params`.
+        """
+        for p in removed:
+            self.pmap[p].discard(comp)
+            if len(self.pmap[p]) == 0:
+                del self.pmap[p]
+                self.lmap.pop(p, None)
+            else:
+                self.lmap[p] = [c for c in self.lmap[p] if c is not comp]
+
+        for p in added:
+            self.pmap[p].add(comp)
+            self.lmap[p] = [c for c in self.comps if c in self.pmap[p]]
+        self.sync_params(added)
+
+    def sync_params(self, params=None):
+        """
+        Ensure that shared parameters are the same value everywhere. By
+        default all parameters are checked, otherwise only those in `params`.
+        """
         def _normalize(comps, param):
             vals = [c.get_values(param) for c in comps]
             diff = any([vals[i] != vals[i+1] for i in range(len(vals)-1)])
@@ -544,16 +620,34 @@ class ComponentCollection(Component):
                 for c in comps:
                     c.set_values(param, vals[0])
 
-        for param, comps in iteritems(self.lmap):
+        if params is None:
+            params = list(self.lmap.keys())
+
+        for param in params:
+            comps = self.lmap.get(param)
             if isinstance(comps, list) and len(comps) > 1:
                 _normalize(comps, param)
 
-    def trigger_parameter_change(self):
-        self.setup_params()
-        self.setup_passthroughs()
+    def trigger_parameter_change(self, comp=None, added=None, removed=None):
+        """
+        Rebuild the parameter maps and passthroughs after the parameters of
+        our components change. If a component `comp` lists the parameter names
+        it `added` and `removed`, only those entries are updated.
+        """
+        if comp is None:
+            self.setup_params()
+            self.setup_passthroughs()
+        else:
+            added, removed = added or [], removed or []
+            self.update_params(comp, added=added, removed=removed)
 
-        if self._parent:
+        if not self._parent:
+            return
+        if comp is None:
             self._parent.trigger_parameter_change()
+        else:
+            self._parent.trigger_parameter_change(comp=self, added=added,
+                    removed=removed)
 
     def setup_passthroughs(self):
         """
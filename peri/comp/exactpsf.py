@@ -1,15 +1,114 @@
 from builtins import range
 from future.utils import iteritems
 
+import hashlib
 import warnings
 import numpy as np
 import scipy.ndimage as nd
 
 from collections import OrderedDict
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
-from peri import util, interpolation
+from peri import util, interpolation, conf
 from peri.comp import psfs, psfcalc
-from peri.fft import fft, fftkwargs
+from peri.fft import plans
+from peri.logger import log
+log = log.getChild('exactpsf')
+
+# The exact psfs are expensive to calculate, so the real-space slices and
+# their k-space transforms are kept in a cache shared by every instance and
+# keyed on a hash of the psf configuration. The cache of a state's psf can
+# be saved alongside it (see :func:`peri.states.save`).
+EXACTPSF_CACHE_BYTES = 2**30
+PSF_CACHE_SUFFIX = '.psfcache'
+PSF_CACHE = util.LRUCache(max_bytes=EXACTPSF_CACHE_BYTES)
+
+# memory budget in bytes of the stacks of Chebyshev coefficient transforms
+# (and their convolutions) which ChebyshevPSF.execute works on at once
+CHEB_EXECUTE_BYTES = 2**28
+
+# the slices of a psf at different z are independent, so are calculated in a
+# pool of threads. The psfcalc integrals spend their time in numpy, which
+# releases the GIL.
+PSF_THREADS = int(conf.load_conf()['psf-threads'])
+PSF_THREADS = PSF_THREADS if PSF_THREADS > 0 else cpu_count()
+
+def save_cache(filename, psf):
+    """ Save the entries of the shared psf cache which belong to ``psf`` """
+    keys = [k for k in PSF_CACHE.keys() if k[0] == psf._cache_hash]
+    PSF_CACHE.save(filename, keys=keys)
+
+def load_cache(filename):
+    """ Restore psf cache entries saved by :func:`save_cache` """
+    PSF_CACHE.load(filename)
+
+def separable_decomposition(kernel, tol=1e-3, norm=None):
+    """
+    Approximates a 3D `kernel` as a sum of separable terms
+    ``a[i](z) * b[i][j](y) * c[i][j](x)`` by two successive SVDs, first of
+    the kernel as a (z, yx) matrix and then of each of its (y, x) singular
+    vectors. The fewest terms are kept for which the Frobenius error of the
+    approximation is at most `tol` * `norm`.
+
+    Parameters
+    ----------
+    kernel : ndarray
+        The 3D kernel, e.g. a psf or a coefficient of a ChebyshevPSF
+
+    tol : float
+        Maximum relative error of the approximation
+
+    norm : float or None
+        The norm the error is relative to. Default is the Frobenius norm of
+        `kernel`.
+
+    Returns
+    -------
+    terms : list
+        List of ``(a, [(b, c), ...])`` of the 1D kernels along z, y, x
+
+    error : float
+        The Frobenius error of the approximation relative to `norm`
+    """
+    sz, sy, sx = kernel.shape
+    norm2 = (kernel**2).sum() if norm is None else norm**2
+    if norm2 == 0:
+        return [], 0.
+
+    u, s, vt = np.linalg.svd(kernel.reshape(sz, sy*sx), full_matrices=False)
+
+    # the errors of the two truncations are orthogonal, so half of the
+    # error budget goes to each
+    tail = np.cumsum((s**2)[::-1])[::-1]
+    r1 = int((tail > 0.5*tol**2*norm2).sum())
+    err2 = tail[r1] if r1 < s.size else 0.
+    budget = (tol**2*norm2 - err2) / max(r1, 1)
+
+    terms = []
+    for i in range(r1):
+        ub, sb, vbt = np.linalg.svd((s[i]*vt[i]).reshape(sy, sx))
+        tailb = np.cumsum((sb**2)[::-1])[::-1]
+        r2 = int((tailb > budget).sum())
+        err2 += tailb[r2] if r2 < sb.size else 0.
+
+        planes = [(ub[:,j]*sb[j], vbt[j]) for j in range(r2)]
+        terms.append((u[:,i], planes))
+    return terms, np.sqrt(err2 / norm2)
+
+def separable_convolve(field, terms):
+    """
+    Periodic convolution of `field` with the separable kernel `terms` from
+    :func:`~peri.comp.exactpsf.separable_decomposition`, centered as in the
+    Fourier convolutions of the psfs.
+    """
+    out = np.zeros(field.shape)
+    for a, planes in terms:
+        fz = nd.convolve1d(field, a, axis=0, mode='wrap')
+        for b, c in planes:
+            fy = nd.convolve1d(fz, b, axis=1, mode='wrap')
+            out += nd.convolve1d(fy, c, axis=2, mode='wrap')
+    return out
 
 def moment(p, v, order=1):
     """ Calculates the moments of the probability distribution p with vector v """
@@ -22,6 +121,15 @@ def moment(p, v, order=1):
 # The actual interfaces that can be used in the peri system
 #=============================================================================
 class ExactPSF(psfs.PSF):
+    # attributes, besides the parameters, which change the calculated psf
+    cache_attrs = (
+        'pxsize', 'polar_angle', 'support_factor', 'normalize',
+        'measurement_iterations', 'global_zscale', 'polychromatic', 'nkpts',
+        'cutoffval', 'cutbyval', 'cutfallrate', 'cutedgeval', 'k_dist',
+        'use_J1', 'do_pinhole', 'num_line_pts', 'zrange'
+    )
+    _kpsf_execute = False
+
     def __init__(self, shape=None, zrange=None, laser_wavelength=0.488,
             zslab=0., zscale=1.0, kfki=0.889, n2n1=1.44/1.518, alpha=1.173,
             polar_angle=0., pxsize=0.125, support_factor=2, normalize=False,
@@ -308,6 +416,28 @@ class ExactPSF(psfs.PSF):
 
         return psf, vec
 
+    def psf_slices(self, z, size=11):
+        """
+        Calculates the psf slices at the z pixel heights `z`, each offset by
+        the drift at that height, in a pool of `PSF_THREADS` threads.
+
+        Returns
+        -------
+        list of numpy.ndarray
+            The psf from `psf_slice` for each of `z`
+        """
+        func = lambda i: self.psf_slice(i, size=size, zoffset=self.drift(i))[0]
+
+        nthreads = min(PSF_THREADS, len(z))
+        if nthreads <= 1:
+            return [func(i) for i in z]
+
+        pool = ThreadPool(nthreads)
+        try:
+            return pool.map(func, z)
+        finally:
+            pool.terminate()
+
     def todict(self):
         return {k:self.params[i] for i,k in enumerate(self.params)}
 
@@ -365,17 +495,30 @@ class ExactPSF(psfs.PSF):
     def get_padding_size(self, tile, z=None):
         return util.Tile(self.support)
 
+    def _calc_cache_hash(self):
+        """ Hash of the parameters and configuration which define the psf """
+        ident = [
+            self.__class__.__name__, self.params,
+            np.array(self.values, dtype='float').tobytes()
+        ]
+        ident += [repr(getattr(self, a, None)) for a in self.cache_attrs]
+        return hashlib.sha1(repr(ident).encode('utf-8')).hexdigest()
+
     def update(self, params, values):
         self.update_values(params, values)
-        self.characterize_psf()
+        self._cache_hash = self._calc_cache_hash()
 
-        self.slices = []
-        for i in range(self.zrange[0], self.zrange[1]+1):
-            zdrift = self.drift(i)
-            psf, vec = self.psf_slice(i, size=self.support, zoffset=zdrift)
-            self.slices.append(psf)
+        key = (self._cache_hash, 'slices')
+        cached = PSF_CACHE.get(key)
+        if cached is not None:
+            self.support, self.drift_poly, self.slices = cached
+            return True
+
+        self.characterize_psf()
 
-        self.slices = np.array(self.slices)
+        z = range(self.zrange[0], self.zrange[1]+1)
+        self.slices = np.array(self.psf_slices(z, size=self.support))
+        PSF_CACHE.put(key, (self.support, self.drift_poly, self.slices))
         return True
 
     def update_values(self, params, values):
@@ -425,51 +568,83 @@ class ExactPSF(psfs.PSF):
         pad = tuple((d[i]+o[i],d[i]) for i in [0,1,2])
         rpsf = np.pad(field, pad, mode='constant', constant_values=0)
         rpsf = np.fft.ifftshift(rpsf, axes=axes)
-        kpsf = fft.rfftn(rpsf, **fftkwargs)
+        kpsf = plans.rfftn(rpsf)
 
         if norm:
             kpsf /= kpsf[0,0,0]
         return kpsf
 
-    def execute(self, field):
-        if any(field.shape != self.tile.shape):
-            raise AttributeError("Field passed to PSF incorrect shape")
-
-        outfield = np.zeros_like(field, dtype='float')
-        zc,yc,xc = self.tile.coords(form='flat')
+    def _kslice(self, zslice, shape):
+        """
+        The xy Fourier transform of the psf slice ``zslice``, padded to the
+        (y,x) tile ``shape`` and normalized to the 3D psf. The planes are
+        returned in reverse z order so that they can be applied directly as
+        a correlation over the field planes in `execute`.
+        """
+        key = (self._cache_hash, 'kslice', zslice, shape)
+        kpsf = PSF_CACHE.get(key)
+        if kpsf is None:
+            kpsf = self._calc_kslice(zslice, shape)
+            PSF_CACHE.put(key, kpsf)
+        return kpsf
 
-        # here's the plan. we are going to rotate the field so that the current
-        # plane of interest is in the center. we then crop the image to the
-        # size of the support so that we are only convolving a small region.
-        # finally, take the mid plane back out as the solution.
-        for i,z in enumerate(zc):
-            # pad the psf slice for the convolution
-            fs = np.array(self.tile.shape)
-            fs[0] = self.support[0]
+    def _calc_kslice(self, zslice, shape):
+        field = self.slices[zslice]
+        currshape = np.array(field.shape[1:])
+        finalshape = np.array(shape)
 
-            if z < self.zrange[0] or z > self.zrange[1]:
-                continue
+        if any(finalshape < currshape):
+            raise IndexError("PSF tile size is less than minimum support size")
 
-            zslice = int(np.clip(z, *self.zrange) - self.zrange[0])
-            middle = field.shape[0]//2
+        # fix off-by-one issues when going odd to even tile sizes
+        d = finalshape - currshape
+        o = d % 2
+        d = np.floor_divide(d, 2)
 
-            subpsf = self._kpad(self.slices[zslice], fs, norm=True)
-            subfield = np.roll(field, middle - i, axis=0)
-            subfield = subfield[middle-fs[0]//2:middle+fs[0]//2+1]
+        pad = ((0,0),) + tuple((d[i]+o[i],d[i]) for i in [0,1])
+        rpsf = np.pad(field, pad, mode='constant', constant_values=0)
+        rpsf = np.fft.ifftshift(rpsf, axes=(1,2))
+        kpsf = plans.rfftn_batch(rpsf)
+        kpsf /= kpsf[:,0,0].sum()
+        return kpsf[::-1].copy()
 
-            kshape = subfield.shape
-            kfield = fft.rfftn(subfield, **fftkwargs)
+    def execute(self, field):
+        if any(field.shape != self.tile.shape):
+            raise AttributeError("Field passed to PSF incorrect shape")
 
-            outfield[i] = np.real(fft.irfftn(kfield * subpsf, s=kshape, **fftkwargs))[self.support[0]//2]
+        outfield = np.zeros_like(field, dtype='float')
+        zc,yc,xc = self.tile.coords(form='flat')
 
+        # each output plane is the xy convolution of the psf slice for that
+        # plane with the neighboring (periodically wrapped) field planes.
+        # rather than doing a 3D transform of a rolled sub-field for every
+        # plane, transform every plane in xy at once, wrap-pad the result in
+        # z and sum the planes against the cached k-space psf slices.
+        zmask = (zc >= self.zrange[0]) & (zc <= self.zrange[1])
+        if not zmask.any():
+            return outfield
+
+        nz = field.shape[0]
+        half = int(self.support[0])//2
+        kshape = tuple(field.shape[1:])
+
+        kfield = plans.rfftn_batch(field, copy=False)
+        kfield = kfield[np.arange(-half, nz+half) % nz]
+
+        kout = np.zeros((zmask.sum(),) + kfield.shape[1:], dtype=kfield.dtype)
+        for j, i in enumerate(np.arange(nz)[zmask]):
+            zslice = int(zc[i] - self.zrange[0])
+            kpsf = self._kslice(zslice, kshape)
+            np.einsum('ijk,ijk->jk', kfield[i:i+2*half+1], kpsf, out=kout[j])
+
+        outfield[zmask] = plans.irfftn_batch(kout, s=kshape, copy=False)
         return outfield
 
     def nopickle(self):
         return super(ExactPSF, self).nopickle() + [
             '_rx', '_ry', '_rz', '_rlen',
-            '_memoize_clear', '_memoize_caches',
             'rpsf', 'kpsf',
-            'cheb', 'slices'
+            'cheb', 'slices', '_cache_hash'
         ]
 
     def __getstate__(self):
@@ -827,7 +1002,10 @@ class ExactPinholeConfocalPSF(ExactPSF):
         return vls / vls.sum()
 
 class ChebyshevPSF(ExactPSF):
-    def __init__(self, cheb_degree=6, cheb_evals=8, *args, **kwargs):
+    cache_attrs = ExactPSF.cache_attrs + ('cheb_degree', 'cheb_evals')
+
+    def __init__(self, cheb_degree=6, cheb_evals=8, separable_tol=None,
+            *args, **kwargs):
         """
         Same as ExactPSF, except that the convolution is performed in
         the 4th dimension by employing fast Chebyshev approximates to
@@ -842,52 +1020,157 @@ class ChebyshevPSF(ExactPSF):
         cheb_evals : integer
             number of interpolation points used to create the coefficient matrix
 
+        separable_tol : float or None
+            If not None, each Chebyshev coefficient is approximated by a sum
+            of separable terms to this relative error, and the convolutions
+            are done as 1D convolutions along each axis rather than by FFT.
+            The error, relative to the norm of all of the coefficients, is
+            stored as `separable_error` when the psf is updated. This only
+            pays off for psfs which are close to separable; the confocal
+            psfs need tens of terms and are much faster with the FFT.
+
         See also
         --------
         :class:`peri.comp.exactpsf.ExactPSF`
         """
         self.cheb_degree = cheb_degree
         self.cheb_evals = cheb_evals
+        self.separable_tol = separable_tol
 
         super(ChebyshevPSF, self).__init__(*args, **kwargs)
 
     def update(self, params, values):
         self.update_values(params, values)
-        self.characterize_psf()
+        self._cache_hash = self._calc_cache_hash()
+
+        key = (self._cache_hash, 'cheb')
+        cached = PSF_CACHE.get(key)
+        if cached is not None:
+            self.support, self.drift_poly, coeffs = cached
+        else:
+            self.characterize_psf()
+            coeffs = None
 
         self.cheb = interpolation.ChebyshevInterpolation1D(self.psf, window=self.zrange,
-                        degree=self.cheb_degree, evalpts=self.cheb_evals)
+                        degree=self.cheb_degree, evalpts=self.cheb_evals,
+                        coeffs=coeffs)
+
+        if cached is None:
+            PSF_CACHE.put(key, (self.support, self.drift_poly, self.cheb.coefficients))
+
+        if self.separable_tol is not None:
+            self._separable, self.separable_error = self._calc_separable()
         return True
 
+    def _calc_separable(self):
+        """
+        The separable decompositions of the Chebyshev coefficients and the
+        error of the approximation relative to the norm of the coefficients
+        """
+        key = (self._cache_hash, 'separable', self.separable_tol)
+        cached = PSF_CACHE.get(key)
+        if cached is None:
+            # the higher coefficients are small, so the error budget is
+            # shared evenly in absolute rather than relative terms
+            coeffs = self.cheb.coefficients
+            norm = np.sqrt((coeffs**2).sum() / len(coeffs))
+            out = [separable_decomposition(c, tol=self.separable_tol, norm=norm)
+                    for c in coeffs]
+            terms = [o[0] for o in out]
+            error = np.sqrt(np.mean([o[1]**2 for o in out]))
+
+            nterms = [sum(len(p) for a, p in t) for t in terms]
+            log.info('separable psf with {} terms per coefficient, error '
+                    '{:.3g} (tolerance {:.3g})'.format(nterms, error,
+                        self.separable_tol))
+            cached = (terms, error)
+            PSF_CACHE.put(key, cached)
+        return cached
+
     def psf(self, z):
-        psf = []
-        for i in z:
-            p, _ = self.psf_slice(i, size=self.support, zoffset=self.drift(i))
-            psf.append(p)
+        psf = self.psf_slices(z, size=self.support)
         return np.rollaxis(np.array(psf), 0, 4)
 
+    def _kcheb(self, shape, start=0, stop=None):
+        """
+        The Fourier transforms of the Chebyshev coefficients `start` to
+        `stop` of the psf, padded to the tile ``shape`` and stacked along the
+        first axis. They only change with the psf parameters, so are cached
+        by the psf hash.
+        """
+        key = (self._cache_hash, 'kcheb', tuple(shape), start, stop)
+        kcheb = PSF_CACHE.get(key)
+        if kcheb is None:
+            kcheb = np.array([
+                self._kpad(c, finalshape=np.array(shape), zpad=True, norm=False)
+                for c in self.cheb.coefficients[start:stop]
+            ])
+            PSF_CACHE.put(key, kcheb)
+        return kcheb
+
+    def _cheb_chunk(self, shape):
+        """
+        The number of Chebyshev coefficients convolved at once for a tile
+        of ``shape``, so that their stacks fit in CHEB_EXECUTE_BYTES
+        """
+        kvolume = np.prod(shape[:-1]) * (shape[-1]//2 + 1)
+        # the complex transforms and their product with the field, and the
+        # real convolutions
+        nbytes = 2*16*kvolume + 8*np.prod(shape)
+        return max(int(CHEB_EXECUTE_BYTES // nbytes), 1)
+
     def execute(self, field):
         if any(field.shape != self.tile.shape):
             raise AttributeError("Field passed to PSF incorrect shape")
 
-        outfield = np.zeros_like(field, dtype='float')
         zc,yc,xc = self.tile.coords(form='flat')
-
         kshape = field.shape
-        kfield = fft.rfftn(field, **fftkwargs)
-        for k,c in enumerate(self.cheb.coefficients):
-            pad = self._kpad(c, finalshape=self.tile.shape, zpad=True, norm=False)
-            cov = np.real(fft.irfftn(kfield * pad, s=kshape, **fftkwargs))
 
-            outfield += self.cheb.tk(k, zc)[:,None,None] * cov
+        if self.separable_tol is not None:
+            return self._execute_separable(field, zc)
+
+        # convolve with chunks of the coefficients in batched transforms,
+        # summing the convolutions weighted by the polynomials in z. The
+        # transform of the field is copied out of the plan's buffer, which
+        # computing the coefficient transforms would overwrite
+        kfield = plans.rfftn(field)
+        ncoeffs = len(self.cheb.coefficients)
+        chunk = self._cheb_chunk(kshape)
+
+        outfield = np.zeros(kshape)
+        for start in range(0, ncoeffs, chunk):
+            stop = min(start + chunk, ncoeffs)
+            kcheb = self._kcheb(kshape, start, stop)
+            cov = plans.irfftn_batch(kcheb * kfield, s=kshape, copy=False)
+
+            tk = np.array([self.cheb.tk(k, zc) for k in range(start, stop)])
+            outfield += np.einsum('kz,kzyx->zyx', tk, cov)
+        return outfield
 
+    def _execute_separable(self, field, zc):
+        if any(np.array(field.shape) < self.support):
+            raise IndexError("PSF tile size is less than minimum support size")
+
+        outfield = np.zeros(field.shape)
+        for k, terms in enumerate(self._separable):
+            cov = separable_convolve(field, terms)
+            outfield += self.cheb.tk(k, zc)[:,None,None] * cov
         return outfield
 
+    def nopickle(self):
+        return super(ChebyshevPSF, self).nopickle() + ['_separable']
+
+    def __setstate__(self, idict):
+        self.separable_tol = None
+        super(ChebyshevPSF, self).__setstate__(idict)
+
     def __str__(self):
         return "{} {}".format(self.__class__.__name__, [self.cheb_degree,
                 self.cheb_evals])
 
 class FixedSSChebPSF(ChebyshevPSF):
+    cache_attrs = ChebyshevPSF.cache_attrs + ('support',)
+
     def __init__(self, support_size=[35,17,25], *args, **kwargs):
         """
         ChebyshevPSF with a fixed support size
@@ -6,6 +6,7 @@ from numpy.polynomial.polynomial import polyval3d
 from numpy.polynomial.legendre import legval
 from numpy.polynomial.chebyshev import chebval
 import scipy.optimize as opt
+from scipy.linalg.blas import dger, sger
 
 from collections import OrderedDict
 from operator import add, mul
@@ -15,6 +16,33 @@ from peri import util
 from peri.comp import Component
 from peri.interpolation import BarnesInterpolation1D,BarnesInterpolationND
 
+# BLAS rank-1 updates for the float precisions that support them
+_GER = {np.dtype(np.float64): dger, np.dtype(np.float32): sger}
+
+def _add_outer(field, vec, plane):
+    """
+    Add the outer product of `vec` (along z) and `plane` (along y,x) to the
+    3D array `field` in place, using a BLAS rank-1 update where possible.
+    """
+    vec, plane = np.ravel(vec), np.ravel(plane)
+    ger = _GER.get(field.dtype)
+
+    if ger is not None and field.flags.c_contiguous:
+        # the transpose of the (z, y*x) view is fortran ordered, which lets
+        # BLAS overwrite the field instead of returning a copy. That is not
+        # guaranteed, so a copy is written back to the field
+        a = field.reshape(vec.size, -1).T
+        out = ger(1.0, plane.astype(field.dtype), vec.astype(field.dtype),
+                a=a, overwrite_a=True)
+        if not np.shares_memory(out, a):
+            a[...] = out
+    else:
+        field += vec.reshape(-1,1,1) * plane.reshape((1,)+field.shape[1:])
+
+def _on_tile(field, shape, tile):
+    """ The part of a `field` broadcastable to `shape` which lies in `tile` """
+    return np.broadcast_to(field, shape.shape)[tile.slicer]
+
 #=============================================================================
 # Pure 3d functional representations of ILMs
 #=============================================================================
@@ -79,6 +107,7 @@ class Polynomial3D(Component):
 
     def initialize(self):
         self.r = self.rvecs()
+        self._basis = {}
         self.set_tile(self.shape)
         self.field = np.zeros(self.shape.shape, dtype=self.float_precision)
         self.update(self.params, self.values)
@@ -94,9 +123,24 @@ class Polynomial3D(Component):
             vecs = self.shape.coords(norm=self.shape.shape)
         return vecs
 
+    def poly1d(self, x, n):
+        """ The degree `n` polynomial of the basis evaluated at `x` """
+        return x**n
+
+    def basis(self, axis, n):
+        """
+        The degree `n` basis polynomial along `axis` evaluated on the field
+        coordinates. These 1D vectors are cached until the next `initialize`
+        so that every term is a product of precomputed vectors.
+        """
+        key = (axis, n)
+        if key not in self._basis:
+            self._basis[key] = self.poly1d(self.r[axis], n)
+        return self._basis[key]
+
     def term_ijk(self, index):
         i,j,k = index
-        return self.r[0]**i * self.r[1]**j * self.r[2]**k
+        return self.basis(0, i) * self.basis(1, j) * self.basis(2, k)
 
     def term(self, index):
         if self.__dict__.get('_last_index') and index == self._last_index:
@@ -115,22 +159,41 @@ class Polynomial3D(Component):
         values = util.listify(values)
 
         if len(params) < len(self.params)//2:
+            # each term is separable, so a single coefficient change is a
+            # rank-1 update of the field
             for p,v1 in zip(params, values):
                 v0 = self.get_values(p)
-                tm = self.param_term[p]
-
-                self.field -= v0 * self.term(tm)
+                i,j,k = self.param_term[p]
                 self.set_values(p, v1)
-                self.field += v1 * self.term(tm)
+
+                _add_outer(self.field, (v1 - v0)*self.basis(0, i),
+                        self.basis(1, j) * self.basis(2, k))
         else:
             self.set_values(params, values)
-            self.field = np.zeros(self.shape.shape, dtype=self.float_precision)
-            for p,v in zip(self.params, self.values):
-                self.field += v * self.term(self.param_term[p])
+            self.field = self.calc_field()
+
+    def calc_field(self):
+        """
+        Evaluate the full field as a contraction of the coefficient tensor
+        with the 1D basis of each axis
+        """
+        coeffs = np.zeros(self.order)
+        for p,v in zip(self.params, self.values):
+            coeffs[self.param_term[p]] = v
+
+        vecs = [
+            np.array([np.ravel(self.basis(a, n)) for n in range(o)])
+            for a, o in enumerate(self.order)
+        ]
+        field = np.einsum('ijk,iz,jy,kx->zyx', coeffs, *vecs, optimize=True)
+        return field.reshape(self.shape.shape).astype(self.float_precision)
 
     def get(self):
         return self.field[self.tile.slicer]
 
+    def gradient(self, param):
+        return _on_tile(self.term(self.param_term[param]), self.shape, self.tile)
+
     def get_params(self):
         return self.params
 
@@ -139,7 +202,7 @@ class Polynomial3D(Component):
 
     def nopickle(self):
         return super(Polynomial3D, self).nopickle() + [
-            'r', 'field', '_last_term', '_last_index'
+            'r', 'field', '_last_term', '_last_index', '_basis'
         ]
 
     def __str__(self):
@@ -173,13 +236,10 @@ class LegendrePoly3D(Polynomial3D):
         vecs = [2*v - 1 for v in vecs]
         return vecs
 
-    def term_ijk(self, index):
-        i,j,k = index
-        ci = np.zeros(i+1)
-        cj = np.zeros(j+1)
-        ck = np.zeros(k+1)
-        ci[-1] = cj[-1] = ck[-1] = 1
-        return legval(self.r[0], ci) * legval(self.r[1], cj) * legval(self.r[2], ck)
+    def poly1d(self, x, n):
+        c = np.zeros(n+1)
+        c[-1] = 1
+        return legval(x, c)
 
 #=============================================================================
 # 2+1d functional representations of ILMs, p(x,y)+q(z)
@@ -263,6 +323,7 @@ class Polynomial2P1D(Polynomial3D):
 
     def initialize(self):
         self.r = self.rvecs()
+        self._basis = {}
         self.field_xy = 0*self.term_ijk((0,0))
         self.field_z = 0*self.term_ijk((0,))
         super(Polynomial2P1D, self).initialize()
@@ -288,40 +349,58 @@ class Polynomial2P1D(Polynomial3D):
     def term_ijk(self, index):
         if len(index) == 2:
             i,j = index
-            return self.r[2]**i * self.r[1]**j
+            return self.basis(2, i) * self.basis(1, j)
 
         elif len(index) == 1:
             k = index[0]
-            return self.r[0]**k
+            return self.basis(0, k)
 
     def update(self, params, values):
         params = util.listify(params)
         values = util.listify(values)
 
         if len(params) < len(self.params)//2:
+            # changing one of the two factors only adds a rank-1 term to the
+            # field, so there is no need to recombine them everywhere
+            multiply = self.operation == '*'
             for p,v1 in zip(params, values):
-                if p in self.xy_param:
-                    order = self.xy_param[p]
-                    term = self.field_xy
-                else:
-                    order = self.z_param[p]
-                    term = self.field_z
-
                 v0 = self.get_values(p)
-                term -= v0 * self.term(order)
-                self.set_values(p,v1)
-                term += v1 * self.term(order)
+                self.set_values(p, v1)
 
-            op = {'*': mul, '+': add}[self.operation]
-            self.field[:] = op(self.field_xy, 1.0 + self.field_z)
+                if p in self.xy_param:
+                    delta = (v1 - v0) * self.term(self.xy_param[p])
+                    if multiply:
+                        _add_outer(self.field, 1.0 + self.field_z, delta)
+                    else:
+                        self.field += delta
+                    self.field_xy += delta
+                else:
+                    delta = (v1 - v0) * self.term(self.z_param[p])
+                    if multiply:
+                        _add_outer(self.field, delta, self.field_xy)
+                    else:
+                        self.field += delta
+                    self.field_z += delta
         else:
             self.set_values(params, values)
             self.field[:] = self.calc_field()
 
+    def gradient(self, param):
+        multiply = self.operation == '*'
+        if param in self.xy_param:
+            grad = self.term(self.xy_param[param])
+            if multiply:
+                grad = grad * (1.0 + self.field_z)
+        else:
+            grad = self.term(self.z_param[param])
+            if multiply:
+                grad = self.field_xy * grad
+        return _on_tile(grad, self.shape, self.tile)
+
     def nopickle(self):
         return super(Polynomial2P1D, self).nopickle() + [
             'r', 'field', 'field_xy', 'field_z',
-            '_last_term', '_last_index'
+            '_last_term', '_last_index', '_basis'
         ]
 
 class LegendrePoly2P1D(Polynomial2P1D):
@@ -333,33 +412,17 @@ class LegendrePoly2P1D(Polynomial2P1D):
         vecs = [2*v - 1 for v in vecs]
         return vecs
 
-    def term_ijk(self, index):
-        if len(index) == 2:
-            i,j = index
-            ci = np.diag(np.ones(i+1))[i]
-            cj = np.diag(np.ones(j+1))[j]
-            return legval(self.r[2], ci) * legval(self.r[1], cj)
-
-        elif len(index) == 1:
-            k = index[0]
-            ck = np.diag(np.ones(k+1))[k]
-            return legval(self.r[0], ck)
+    def poly1d(self, x, n):
+        c = np.diag(np.ones(n+1))[n]
+        return legval(x, c)
 
 class ChebyshevPoly2P1D(Polynomial2P1D):
     def __init__(self, order=(1,1,1), **kwargs):
         super(ChebyshevPoly2P1D, self).__init__(order=order, **kwargs)
 
-    def term_ijk(self, index):
-        if len(index) == 2:
-            i,j = index
-            ci = np.diag(np.ones(i+1))[i]
-            cj = np.diag(np.ones(j+1))[j]
-            return chebval(self.r[2], ci) * chebval(self.r[1], cj)
-
-        elif len(index) == 1:
-            k = index[0]
-            ck = np.diag(np.ones(k+1))[k]
-            return chebval(self.r[0], ck)
+    def poly1d(self, x, n):
+        c = np.diag(np.ones(n+1))[n]
+        return chebval(x, c)
 
 #=============================================================================
 # a complex hidden variable representation of the ILM
@@ -454,6 +517,9 @@ class BarnesPoly(Component, util.CompatibilityPatch):
     def _barnes_full(self):
         raise NotImplementedError('Implement in subclass')
 
+    def _barnes_grad(self, param):
+        raise NotImplementedError('Implement in subclass')
+
     def get_update_tile(self, params, values):
         raise NotImplementedError('Implement in subclass')
 
@@ -544,10 +610,30 @@ class BarnesPoly(Component, util.CompatibilityPatch):
     def get(self):
         return self.field[self.tile.slicer]
 
+    def gradient(self, param):
+        # the barnes interpolants are linear in their control points, so
+        # every parameter other than the scale enters the field linearly
+        c = self.category
+        op = {'*': mul, '+': add}[self.op]
+
+        if param == c+'-off':
+            return 1.0
+        elif param == c+'-scale':
+            grad = op(1.0 + self._barnes_full(), 1.0 + self.poly)
+        elif param in self.poly_params:
+            grad = self.scale * self._term(self.poly_params[param])
+            if self.op == '*':
+                grad = grad * (1.0 + self._barnes_full())
+        else:
+            grad = self.scale * self._barnes_grad(param)
+            if self.op == '*':
+                grad = grad * (1.0 + self.poly)
+        return _on_tile(grad, self.shape, self.tile)
+
     def nopickle(self):
         return super(BarnesPoly, self).nopickle() + [
             'poly', 'b_in', 'b_out', 'r', 'field',
-            '_last_term', '_last_index'
+            '_last_term', '_last_index', '_interps'
         ]
 
     def __str__(self):
@@ -647,17 +733,24 @@ class BarnesStreakLegPoly2P1D(BarnesPoly):
             np.linspace(self.b_out.min(), self.b_out.max(), q)
             for q in self.npts
         ]
-
-    def _barnes(self, y, n=0):
-        b_in = self.b_in[n]
-        fdst = (b_in[1] - b_in[0])*1.0/self.barnes_dist
-        coeffs = self.get_values(self.barnes_params[n])
-
-        b = BarnesInterpolation1D(
-            b_in, coeffs, filter_size=fdst, damp=0.9, iterations=3,
-            clip=self.local_updates, clipsize=self.barnes_clip_size,
-            donorm=self.donorm
-        )
+        self._interps = {}
+
+    def _barnes(self, y, n=0, coeffs=None):
+        if coeffs is None:
+            coeffs = self.get_values(self.barnes_params[n])
+
+        # the interpolants keep their weights for the same output points, so
+        # they are reused with new coefficients
+        if n not in self._interps:
+            b_in = self.b_in[n]
+            fdst = (b_in[1] - b_in[0])*1.0/self.barnes_dist
+            self._interps[n] = BarnesInterpolation1D(
+                b_in, coeffs, filter_size=fdst, damp=0.9, iterations=3,
+                clip=self.local_updates, clipsize=self.barnes_clip_size,
+                donorm=self.donorm
+            )
+        b = self._interps[n]
+        b.d = np.array(coeffs)
         return b(y)
 
     def _barnes_val(self, n=0):
@@ -670,6 +763,14 @@ class BarnesStreakLegPoly2P1D(BarnesPoly):
         ])
         return barnes.sum(axis=0)[None,:,:]
 
+    def _barnes_grad(self, param):
+        for n, grp in enumerate(self.barnes_params):
+            if param in grp:
+                unit = np.zeros(len(grp))
+                unit[grp.index(param)] = 1
+                val = self._barnes(self.b_out, n=n, coeffs=unit)[None,:]
+                return (val * self._barnes_poly(n))[None,:,:]
+
     def get_update_tile(self, params, values):
         if not self.local_updates:
             return self.shape.copy()
@@ -820,20 +921,25 @@ class BarnesXYLegPolyZ(BarnesPoly):
         return barnes_params, barnes_params, barnes_values
 
 
-    def _barnes(self, pos):
+    def _barnes(self, pos, coeffs=None):
         """Creates a barnes interpolant & calculates its values"""
         b_in = self.b_in
         dist = lambda x: np.sqrt(np.dot(x,x))
         #we take a filter size as the max distance between the grids along
         #x or y:
         sz = self.npts[1]
-        coeffs = self.get_values(self.barnes_params)
-
-        b = BarnesInterpolationND(
-            b_in, coeffs, filter_size=self.filtsize, damp=0.9, iterations=3,
-            clip=self.local_updates, clipsize=self.barnes_clip_size,
-            blocksize=100  # FIXME magic blocksize
-        )
+        if coeffs is None:
+            coeffs = self.get_values(self.barnes_params)
+
+        if 0 not in self._interps:
+            self._interps[0] = BarnesInterpolationND(
+                b_in, coeffs, filter_size=self.filtsize, damp=0.9,
+                iterations=3, clip=self.local_updates,
+                clipsize=self.barnes_clip_size,
+                blocksize=100  # FIXME magic blocksize
+            )
+        b = self._interps[0]
+        b.d = np.array(coeffs)
         return b(pos)  # (N,) shape
 
     def _barnes_val(self):
@@ -853,11 +959,18 @@ class BarnesXYLegPolyZ(BarnesPoly):
         self.b_in = np.array([[y,x] for y in _b_in[0] for x in _b_in[1]])
         dxs = [b[1] - b[0] for b in _b_in]
         self.filtsize = np.sqrt(np.dot(dxs, dxs))
+        self._interps = {}
 
     def _barnes_full(self):
         """Returns the shaped values of the barnes on the (x,y)"""
         return np.reshape(self._barnes_val(), self.shape.shape[1:])[None, :, :]
 
+    def _barnes_grad(self, param):
+        unit = np.zeros(len(self.barnes_params))
+        unit[self.barnes_params.index(param)] = 1
+        val = self._barnes(self.b_out, coeffs=unit)
+        return np.reshape(val, self.shape.shape[1:])[None, :, :]
+
     def get_update_tile(self, params, values):
         #a lot of this is duplicated from parent to here
         if not self.local_updates:
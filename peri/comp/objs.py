@@ -1,7 +1,7 @@
 from builtins import range, str
 
 import numpy as np
-from scipy.special import erf
+from scipy.special import erf, erfcinv
 
 try:
     from scipy.weave import inline
@@ -18,12 +18,41 @@ from peri.util import Tile, cdd, listify, delistify
 # maximum number of iterations to get an exact volume
 MAX_VOLUME_ITERATIONS = 10
 
+# maximum number of voxels of particle tiles drawn in one vectorized pass
+MAX_DRAW_VOXELS = 2**16
+
+# fewest particles drawn in one vectorized pass; smaller updates are faster
+# drawn one particle at a time
+MIN_BATCH_DRAW = 3
+
 
 #=============================================================================
 # Superclass for collections of particles
 #=============================================================================
+def _particle_array(name):
+    """
+    A property for the per-particle array `name`, stored in the buffer
+    ``'_' + name`` whose first axis may have spare capacity for new particles
+    (see `PlatonicParticlesCollection._append_particles`).
+    """
+    key = '_' + name
+
+    def fget(self):
+        return getattr(self, key)[:self._n]
+
+    def fset(self, value):
+        value = np.array(value, dtype='float')
+        setattr(self, key, value)
+        self._n = value.shape[0]
+
+    return property(fget, fset, doc='Per-particle array `{}`'.format(name))
+
 
 class PlatonicParticlesCollection(Component):
+    # the per-particle arrays, grown together by _append_particles
+    _particle_arrays = ['pos']
+    pos = _particle_array('pos')
+
     def __init__(self, pos, shape=None, param_prefix='sph', category='obj',
                 support_pad=4, float_precision=np.float64):
         """
@@ -56,6 +85,11 @@ class PlatonicParticlesCollection(Component):
         If you have a few objects to group, like 2 or 3 slabs, group them
         with a `peri.comp.ComponentCollection` instead.
 
+        The per-particle arrays such as ``.pos`` are views of buffers with
+        spare capacity, which removing particles shifts down in place. Keep
+        a copy (e.g. from `get_positions`) rather than ``.pos`` itself when
+        the old values are needed after adding or removing particles.
+
         Parameters
         ----------
         pos : ndarray [N,d]
@@ -113,6 +147,17 @@ class PlatonicParticlesCollection(Component):
         """
         raise NotImplementedError('Implement in subclasss')
 
+    def _draw_particles(self, pos, args, sign=1):
+        """
+        Draws (or un-draws if ``sign`` is -1) the particles at positions
+        ``pos`` with the additional arguments ``args`` for each, in the same
+        format as returned by _drawargs. Subclasses may override this with a
+        faster version, which must give the same result as drawing the
+        particles one at a time in order.
+        """
+        for p0, arg0 in zip(pos, args):
+            self._draw_particle(p0, *listify(arg0), sign=sign)
+
     def _update_type(self, params):
         """
         Given a list of parameters, returns a bool of whether or not any of
@@ -149,6 +194,43 @@ class PlatonicParticlesCollection(Component):
         raise NotImplementedError('Implement in subclasss')
 
 
+    def _append_particles(self, **arrays):
+        """
+        Append new particles, given as keyword arrays for each name in
+        `_particle_arrays`, to the end of the particle arrays. The buffers
+        double their capacity when full, so that adding particles one at a
+        time takes amortized constant time. Returns the new indices.
+        """
+        first = self._particle_arrays[0]
+        n = self._n
+        k = np.size(arrays[first]) // int(np.prod(getattr(self, '_' + first).shape[1:]))
+        for name in self._particle_arrays:
+            key = '_' + name
+            buf = getattr(self, key)
+            value = np.reshape(arrays[name], (k,) + buf.shape[1:])
+            if buf.shape[0] < n + k:
+                grown = np.zeros((max(2*buf.shape[0], n+k),) + buf.shape[1:],
+                        dtype=buf.dtype)
+                grown[:n] = buf[:n]
+                setattr(self, key, grown)
+                buf = grown
+            buf[n:n+k] = value
+        self._n = n + k
+        return np.arange(n, n+k)
+
+    def _delete_particles(self, inds):
+        """
+        Remove the particles `inds` from the particle arrays, shifting the
+        later particles down in place so that the indices stay contiguous.
+        """
+        keep = np.ones(self._n, dtype='bool')
+        keep[inds] = False
+        n = int(keep.sum())
+        for name in self._particle_arrays:
+            buf = getattr(self, '_' + name)
+            buf[:n] = buf[:self._n][keep]
+        self._n = n
+
     def _drawargs(self):
         """
         Returns a list of arguments for self._draw_particle, of the same
@@ -186,9 +268,7 @@ class PlatonicParticlesCollection(Component):
     def initialize(self):
         """Start from scratch and initialize all objects / draw self.particles"""
         self.particles = np.zeros(self.shape.shape, dtype=self.float_precision)
-
-        for p0, arg0 in zip(self.pos, self._drawargs()):
-            self._draw_particle(p0, *listify(arg0))
+        self._draw_particles(self.pos, self._drawargs())
 
     def get(self):
         return self.particles[self.tile.slicer]
@@ -270,15 +350,16 @@ class PlatonicParticlesCollection(Component):
         # otherwise, update individual particles. delete the current versions
         # of the particles update the particles, and redraw them anew at the
         # places given by (params, values)
+        particles = list(particles)
         oldargs = self._drawargs()
-        for n in particles:
-            self._draw_particle(self.pos[n], *listify(oldargs[n]), sign=-1)
+        self._draw_particles(self.pos[particles],
+                [oldargs[n] for n in particles], sign=-1)
 
         self.set_values(params, values)
 
         newargs = self._drawargs()
-        for n in particles:
-            self._draw_particle(self.pos[n], *listify(newargs[n]), sign=+1)
+        self._draw_particles(self.pos[particles],
+                [newargs[n] for n in particles], sign=+1)
 
     def __str__(self):
         return "{} N={}".format(self.__class__.__name__, self.N)
@@ -294,11 +375,13 @@ def inner(r, p, a, zscale=1.0):
     eps = np.array([1,1,1])*1e-8
     s = np.array([zscale, 1.0, 1.0])
 
-    d = (r-p-eps)*s
-    n = norm(d)
-    dhat = d / n[...,None]
+    # work on each component separately rather than on the short last axis of
+    # the vectors, which is faster and rounds identically to norm(d) etc.
+    p, a = np.asarray(p), np.asarray(a)
+    d = [(r[...,i] - p[...,i] - eps[i])*s[i] for i in range(len(s))]
+    n = np.sqrt(sum(di**2 for di in d))
 
-    o = norm((d - a*dhat)/s)
+    o = np.sqrt(sum(((di - a*(di/n))/si)**2 for di, si in zip(d, s)))
     return o * np.sign(n - a)
 
 def sphere_bool(dr, a, alpha):
@@ -343,8 +426,9 @@ def sphere_analytical_gaussian_trim(dr, a, alpha=0.2765, cut=1.6):
 
     # only compute on the relevant scales
     rr = dr[m]
+    aa = np.broadcast_to(a, dr.shape)[m]
     t = -rr/(alpha*np.sqrt(2))
-    q = 0.5*(1 + erf(t)) - np.sqrt(0.5/np.pi)*(alpha/(rr+a+1e-10)) * np.exp(-t*t)
+    q = 0.5*(1 + erf(t)) - np.sqrt(0.5/np.pi)*(alpha/(rr+aa+1e-10)) * np.exp(-t*t)
 
     # fill in the grid, inside the interpolation and outside where values are constant
     ans = 0*dr
@@ -406,41 +490,198 @@ try:
 except Exception as e:
     sphere_analytical_gaussian_fast = sphere_analytical_gaussian_trim
 
+# sphere functions which accept an array of radii broadcast against `dr`, and
+# so can draw many particles in one call
+BATCH_SPHERE_FUNCTIONS = (
+    sphere_bool, sphere_lerp, sphere_logistic, sphere_triangle_cdf,
+    sphere_analytical_gaussian, sphere_analytical_gaussian_trim,
+    sphere_constrained_cubic
+)
+
+def inner_geometry(r, p, zscale=1.0):
+    """
+    The parts of `inner` which do not depend on the radius: returns (n, k)
+    such that ``inner(r, p, a, zscale)`` is ``(n - a)*k`` up to rounding.
+    """
+    eps = np.array([1,1,1])*1e-8
+    s = np.array([zscale, 1.0, 1.0])
+
+    p = np.asarray(p)
+    d = [(r[...,i] - p[...,i] - eps[i]) for i in range(len(s))]
+    n = np.sqrt(sum((di*si)**2 for di, si in zip(d, s)))
+    k = np.sqrt(sum(di**2 for di in d)) / n
+    return n, k
+
 def exact_volume_sphere(rvec, pos, radius, zscale=1.0, volume_error=1e-5,
-        function=sphere_analytical_gaussian, max_radius_change=1e-2, args=()):
+        function=sphere_analytical_gaussian, max_radius_change=1e-2, args=(),
+        geometry=None):
     """
     Perform an iterative method to calculate the effective sphere that perfectly
     (up to the volume_error) conserves volume.  Return the resulting image
-    """
-    vol_goal = 4./3*np.pi*radius**3 / zscale
-    rprime = radius
 
-    dr = inner(rvec, pos, rprime, zscale=zscale)
-    t = function(dr, rprime, *args)
+    If `radius` is an array of N radii, then `rvec` and `pos` must have a
+    leading dimension of N as well, and the N images are iterated separately
+    (but each exactly as it would be on its own) and returned together.
+
+    If `geometry` is given as the (n, k) of `inner_geometry`, the distances
+    to the edge of the sphere are calculated from it at each iteration
+    rather than from `rvec`, which is faster but rounds differently.
+    """
+    batch = np.ndim(radius) > 0
+    radius = np.array(radius, dtype='float', ndmin=1)
+    if not batch:
+        rvec, pos = rvec[None], np.asarray(pos)[None]
+        if geometry is not None:
+            geometry = [g[None] for g in geometry]
+    # broadcasts per-particle values against the particle images
+    bc = (slice(None),) + (None,)*(rvec.ndim - 2)
+
+    def edge_distance(sel, rp):
+        if geometry is not None:
+            return (geometry[0][sel] - rp[bc])*geometry[1][sel]
+        return inner(rvec[sel], pos[sel][bc], rp[bc], zscale=zscale)
+
+    # the powers are taken of each scalar radius, as array powers can round
+    # differently and the images must not depend on how many are drawn
+    vol_goal = np.array([4./3*np.pi*r**3 / zscale for r in radius])
+    rprime = radius.copy()
+
+    dr = edge_distance(slice(None), rprime)
+    t = function(dr, rprime[bc], *args)
+
+    active = np.ones(radius.shape, dtype='bool')
+    axes = tuple(range(1, t.ndim))
     for i in range(MAX_VOLUME_ITERATIONS):
-        vol_curr = np.abs(t.sum())
-        if np.abs(vol_goal - vol_curr)/vol_goal < volume_error:
-            break
+        vol_curr = np.abs(t.sum(axis=axes))
+        active &= ~(np.abs(vol_goal - vol_curr)/vol_goal < volume_error)
 
-        rprime = rprime + 1.0*(vol_goal - vol_curr) / (4*np.pi*rprime**2)
+        rprime[active] += 1.0*(vol_goal - vol_curr)[active] / np.array(
+                [4*np.pi*r**2 for r in rprime[active]])
 
-        if np.abs(rprime - radius)/radius > max_radius_change:
+        active &= ~(np.abs(rprime - radius)/radius > max_radius_change)
+        if not active.any():
             break
 
-        dr = inner(rvec, pos, rprime, zscale=zscale)
-        t = function(dr, rprime, *args)
+        if active.all():
+            dr = edge_distance(slice(None), rprime)
+            t = function(dr, rprime[bc], *args)
+        else:
+            rp = rprime[active]
+            dr = edge_distance(active, rp)
+            t[active] = function(dr, rp[bc], *args)
+
+    return t if batch else t[0]
+
+class SphereProfileTable(object):
+    def __init__(self, alpha, tol=1e-8):
+        """
+        Interpolated lookup table for the exact-gaussian sphere functions,
+        which avoids evaluating erf and exp at every voxel of every draw.
+
+        The exact-gaussian profiles are built from two functions of a single
+        distance x, ``E(x) = erf(x/(alpha*sqrt(2)))/2`` and ``G(x) =
+        sqrt(1/(2*pi))*alpha*exp(-x**2/(2*alpha**2))``, e.g. the trimmed
+        profile is ``1/2 - E(dr) - G(dr)/(dr+a)``. These are tabulated once
+        per alpha on a uniform grid fine enough that linear interpolation
+        is accurate to within `tol`, while the dependence on the radius `a`
+        is kept exact. The error of a profile is therefore bounded by
+        ``2*tol*(1 + 1/|dr + a|)``.
+
+        Parameters
+        ----------
+        alpha : float
+            The width of the gaussian, as in the sphere functions.
 
-    return t
+        tol : float, optional
+            Maximum absolute interpolation error of E and G. Default is 1e-8
+        """
+        self.alpha = alpha
+        self.tol = tol
+
+        # beyond xmax the tails of E and G are well within tol of their limits
+        self.xmax = alpha*np.sqrt(2)*erfcinv(0.2*tol)
+
+        # linear interpolation error is h**2/8 * max|f''|
+        d2 = max(np.exp(-0.5)/(alpha**2*np.sqrt(2*np.pi)),
+                1.0/(alpha*np.sqrt(2*np.pi)))
+
+        # E is odd and G even, so only x >= 0 is tabulated; this also keeps
+        # the symmetry about the center of the sphere exact
+        self.npts = int(np.ceil(self.xmax / np.sqrt(8*tol/d2))) + 1
+        self.h = self.xmax / (self.npts - 1)
+
+        x = np.linspace(0, self.xmax, self.npts)
+        self._erf = self._slopes(0.5*erf(x/(alpha*np.sqrt(2))))
+        self._gauss = self._slopes(
+                np.sqrt(0.5/np.pi)*alpha*np.exp(-0.5*x**2/alpha**2))
+
+    @staticmethod
+    def _slopes(values):
+        return values, np.append(np.diff(values), 0)
+
+    def _interp(self, table, x):
+        u = np.minimum(np.abs(x), self.xmax) / self.h
+        i = u.astype('int')
+        values, slopes = table
+        return values[i] + (u - i)*slopes[i]
+
+    def erf(self, x):
+        """E(x), erf(x/(alpha*sqrt(2)))/2"""
+        return np.sign(x)*self._interp(self._erf, x)
+
+    def gauss(self, x):
+        """G(x), sqrt(1/(2*pi))*alpha*exp(-x**2/(2*alpha**2))"""
+        return self._interp(self._gauss, x)
+
+    def gaussian(self, dr, a):
+        """Tabulated `sphere_analytical_gaussian`"""
+        u = dr + 2*a
+        return (self.erf(u) - self.erf(dr) -
+                (self.gauss(dr) - self.gauss(u)) / (dr + a + 1e-10))
+
+    def trim(self, dr, a, cut=1.6):
+        """Tabulated `sphere_analytical_gaussian_trim`"""
+        m = np.abs(dr) <= cut
+        rr = dr[m]
+        aa = np.broadcast_to(a, dr.shape)[m]
+
+        ans = 1.0*(dr < -cut)
+        ans[m] = 0.5 - self.erf(rr) - self.gauss(rr) / (rr + aa + 1e-10)
+        return ans
+
+    def fast(self, dr, a):
+        """Tabulated `sphere_analytical_gaussian_fast`"""
+        return self.trim(dr, a, cut=1.2)
+
+    def profile(self, function):
+        """The tabulated equivalent of the sphere function `function`"""
+        if function is sphere_analytical_gaussian:
+            return self.gaussian
+        if function is sphere_analytical_gaussian_trim:
+            return self.trim
+        if function is sphere_analytical_gaussian_fast:
+            return self.fast
+        raise ValueError('No tabulated form of {}'.format(function))
+
+# sphere functions which may be evaluated with a SphereProfileTable
+TABLE_SPHERE_FUNCTIONS = (
+    sphere_analytical_gaussian, sphere_analytical_gaussian_trim,
+    sphere_analytical_gaussian_fast
+)
 
 #=============================================================================
 # Actual sphere collection (and slab)
 #=============================================================================
 class PlatonicSpheresCollection(PlatonicParticlesCollection):
+    _particle_arrays = ['pos', 'rad']
+    _coords = ['z', 'y', 'x', 'a']
+    rad = _particle_array('rad')
+
     def __init__(self, pos, rad, shape=None, zscale=1.0, support_pad=4,
             method='exact-gaussian-fast', alpha=None, user_method=None,
             exact_volume=True, volume_error=1e-5, max_radius_change=1e-2,
             param_prefix='sph', grouping='particle', category='obj',
-            float_precision=np.float64):
+            float_precision=np.float64, profile_tol=None):
         """
         A collection of spheres in real-space with positions and radii, drawn
         not necessarily on a uniform grid (i.e. scale factor associated with
@@ -505,6 +746,12 @@ class PlatonicSpheresCollection(PlatonicParticlesCollection):
             for precomputed arrays. Default is np.float64; make it 16 or 32
             to save memory.
 
+        profile_tol : float or None
+            If not None, the 'exact-gaussian' methods are evaluated from an
+            interpolated `SphereProfileTable` with interpolation errors below
+            profile_tol (e.g. 1e-8), which is considerably faster. Default is
+            None, evaluating the sphere functions directly.
+
         """
         if isinstance(rad, (float, int)):
             rad = rad*np.ones(pos.shape[0])
@@ -520,6 +767,8 @@ class PlatonicSpheresCollection(PlatonicParticlesCollection):
         self.max_radius_change = max_radius_change
         self.user_method = user_method
         self.grouping = grouping
+        self.profile_tol = profile_tol
+        self._profile_table = None
 
         self.set_draw_method(method=method, alpha=alpha, user_method=user_method)
 
@@ -530,47 +779,105 @@ class PlatonicSpheresCollection(PlatonicParticlesCollection):
     def _drawargs(self):
         return self.rad
 
+    def _param_blocks(self):
+        """
+        The parameter suffixes of each particle, grouped into the blocks in
+        which they are listed in self._params (before 'zscale')
+        """
+        if self.grouping == 'parameter':
+            return [['z','y','x'], ['a']]
+        return [['z','y','x','a']]
+
     def setup_variables(self):
         self._params = []
-        if self.grouping == 'parameter':
-            for i, p0 in enumerate(self.pos):
-                self._params.extend([self._i2p(i, c) for c in ['z','y','x']])
-            for i, r0 in enumerate(self.rad):
-                self._params.extend([self._i2p(i, c) for c in ['a']])
-        else:
-            for i, (p0, r0) in enumerate(zip(self.pos, self.rad)):
-                self._params.extend([self._i2p(i, c) for c in ['z','y','x','a']])
+        for block in self._param_blocks():
+            for i in range(self.N):
+                self._params.extend([self._i2p(i, c) for c in block])
         self._params += ['zscale']
+        self._pindex = {p: self._flat_index(*self._p2i(p)) for p in self._params}
+
+    def _resize_variables(self, n0, n1):
+        """
+        Change self._params in place from `n0` to `n1` particles. Since the
+        parameter names follow the particle indices, this only adds or removes
+        the names of the particles between `n0` and `n1`. Returns the lists
+        of the added and removed names.
+        """
+        lo, hi = min(n0, n1), max(n0, n1)
+        splices, start = [], 0
+        for block in self._param_blocks():
+            names = [self._i2p(i, c) for i in range(lo, hi) for c in block]
+            splices.append((start + len(block)*lo, names))
+            start += len(block)*n0
+
+        # splice from the last block so that the earlier offsets stay valid
+        for at, names in reversed(splices):
+            if n1 > n0:
+                self._params[at:at] = names
+            else:
+                del self._params[at:at+len(names)]
+
+        changed = [p for _, names in splices for p in names]
+        for p in changed:
+            if n1 > n0:
+                self._pindex[p] = self._flat_index(*self._p2i(p))
+            else:
+                del self._pindex[p]
+        return (changed, []) if n1 > n0 else ([], changed)
+
+    def _flat_index(self, typ, ind):
+        """ The flat index of coordinate `typ` of particle `ind`, see
+        `param_indices` """
+        if typ == 'zscale':
+            return -1
+        return len(self._coords)*ind + self._coords.index(typ)
+
+    def param_indices(self, params):
+        """
+        Flat indices of the parameters `params`, ``4*n + c`` for coordinate
+        ``c`` in (z, y, x, a) of particle ``n``, and -1 for the zscale. They
+        can be used with `get_values_at` and `set_values_at` in place of the
+        parameter names.
+        """
+        try:
+            return np.array([self._pindex[p] for p in listify(params)],
+                    dtype='int')
+        except KeyError as e:
+            raise ValueError('%r is not a parameter of %r' % (e.args[0], self))
+
+    def get_values_at(self, inds):
+        """ Vectorized `get_values` for an array of `param_indices` """
+        inds = np.asarray(inds, dtype='int')
+        values = np.full(inds.shape, self.zscale, dtype='float')
+        part = inds >= 0
+        n, c = np.divmod(inds[part], len(self._coords))
+        ispos = c < 3
+        values[part] = np.where(ispos, self.pos[n, np.minimum(c, 2)], self.rad[n])
+        return values
+
+    def set_values_at(self, inds, values):
+        """ Vectorized `set_values` for an array of `param_indices` """
+        inds = np.asarray(inds, dtype='int')
+        values = np.asarray(values, dtype='float').reshape(inds.shape)
+        part = inds >= 0
+        if not part.all():
+            self.zscale = float(values[~part][-1])
+        n, c = np.divmod(inds[part], len(self._coords))
+        values = values[part]
+        ispos = c < 3
+        self.pos[n[ispos], c[ispos]] = values[ispos]
+        self.rad[n[~ispos]] = values[~ispos]
 
     def get_values(self, params):
-        values = []
-        for p in listify(params):
-            typ, ind = self._p2i(p)
-            if typ == 'zscale':
-                values.append(self.zscale)
-            elif typ == 'x':
-                values.append(self.pos[ind][2])
-            elif typ == 'y':
-                values.append(self.pos[ind][1])
-            elif typ == 'z':
-                values.append(self.pos[ind][0])
-            elif typ == 'a':
-                values.append(self.rad[ind])
-        return delistify(values, params)
+        """
+        The values of `params`, delistified. They are python floats rather
+        than numpy scalars; use `get_values_at` for an array.
+        """
+        values = self.get_values_at(self.param_indices(params))
+        return delistify(values.tolist(), params)
 
     def set_values(self, params, values):
-        for p,v in zip(listify(params), listify(values)):
-            typ, ind = self._p2i(p)
-            if typ == 'zscale':
-                self.zscale = v
-            elif typ == 'x':
-                self.pos[ind][2] = v
-            elif typ == 'y':
-                self.pos[ind][1] = v
-            elif typ == 'z':
-                self.pos[ind][0] = v
-            elif typ == 'a':
-                self.rad[ind] = v
+        self.set_values_at(self.param_indices(params), listify(values))
 
     def set_draw_method(self, method, alpha=None, user_method=None):
         self.methods = [
@@ -625,20 +932,119 @@ class PlatonicSpheresCollection(PlatonicParticlesCollection):
         tile = Tile(p-r, p+r, 0, self.shape.shape)
         rvec = tile.coords(form='vector')
 
+        t = sign*self._sphere_image(rvec, pos, rad)
+        self.particles[tile.slicer] += t
+
+    def _sphere_image(self, rvec, pos, rad):
+        """
+        The anti-aliased image of the sphere(s) at `pos` with radius `rad`
+        over the coordinates `rvec`. As in `exact_volume_sphere`, `rad` may
+        be an array of radii with `rvec` and `pos` having a matching leading
+        dimension.
+        """
+        function = self.sphere_functions[self.method]
+        args, geometry = self.alpha, None
+        bpos, brad = pos, rad
+        if np.ndim(rad) > 0:
+            bc = (slice(None),) + (None,)*(rvec.ndim - 2)
+            bpos, brad = pos[bc], rad[bc]
+
+        table = self._get_profile_table()
+        if table is not None:
+            function, args = table.profile(function), ()
+            geometry = inner_geometry(rvec, bpos, zscale=self.zscale)
+
         # if required, do an iteration to find the best radius to produce
         # the goal volume as given by the particular goal radius
         if self.exact_volume:
-            t = sign*exact_volume_sphere(
+            return exact_volume_sphere(
                 rvec, pos, rad, zscale=self.zscale, volume_error=self.volume_error,
-                function=self.sphere_functions[self.method], args=self.alpha,
+                function=function, args=args, geometry=geometry,
                 max_radius_change=self.max_radius_change
             )
+
+        # calculate the anti-aliasing according to the interpolation type
+        if geometry is not None:
+            dr = (geometry[0] - brad)*geometry[1]
         else:
-            # calculate the anti-aliasing according to the interpolation type
-            dr = inner(rvec, pos, rad, zscale=self.zscale)
-            t = sign*self.sphere_functions[self.method](dr, rad, *self.alpha)
+            dr = inner(rvec, bpos, brad, zscale=self.zscale)
+        return function(dr, brad, *args)
 
-        self.particles[tile.slicer] += t
+    def _get_profile_table(self):
+        """
+        The SphereProfileTable for the current alpha, or None if profiles
+        are not tabulated. The table is rebuilt whenever alpha changes.
+        """
+        if (self.profile_tol is None or self.sphere_functions[self.method]
+                not in TABLE_SPHERE_FUNCTIONS):
+            return None
+        table = self._profile_table
+        if (table is None or table.alpha != self.alpha[0] or
+                table.tol != self.profile_tol):
+            self._profile_table = SphereProfileTable(self.alpha[0],
+                    tol=self.profile_tol)
+        return self._profile_table
+
+    def _draw_particles(self, pos, rad, sign=1):
+        """
+        Draws many particles as in ``_draw_particle``. The images of the
+        particles which lie entirely inside the field are calculated together
+        (grouped by tile size) and all the images are added to
+        ``self.particles`` in order, so that the result is identical to
+        drawing the particles one at a time. Fewer than MIN_BATCH_DRAW
+        particles are drawn one at a time.
+        """
+        if (len(rad) < MIN_BATCH_DRAW or
+                self.sphere_functions[self.method] not in BATCH_SPHERE_FUNCTIONS):
+            return super(PlatonicSpheresCollection, self)._draw_particles(
+                    pos, rad, sign=sign)
+
+        rad = np.array(rad, dtype='float').reshape(-1)
+        pos = self._trans(np.reshape(pos, (-1, 3)))
+        shape = self.shape.shape
+        strides = np.cumprod([1] + list(shape[:0:-1]))[::-1]
+
+        p = np.round(pos)
+        r = np.round(np.array([1.0/self.zscale,1,1])*np.ceil(rad)[:,None] +
+                self.support_pad)
+        inside = ((p - r >= 0) & (p + r <= shape)).all(axis=1)
+
+        # split the particles into consecutive chunks of limited total size
+        nvox = np.prod(2*r, axis=1)
+        chunks = (np.cumsum(nvox) - nvox) // MAX_DRAW_VOXELS
+
+        for c in np.unique(chunks):
+            inds = np.nonzero((chunks == c) & (rad != 0))[0]
+            flat, vals = {}, {}
+
+            # particles entirely inside the field, vectorized over tile shape
+            insiders = inds[inside[inds]]
+            rs, groups = np.unique(r[insiders], axis=0, return_inverse=True)
+            for g, rg in enumerate(rs):
+                batch = insiders[groups.ravel() == g]
+                offsets = Tile(-rg, rg).coords(form='vector')
+                rvec = offsets[None] + p[batch][:,None,None,None,:]
+                t = sign*self._sphere_image(rvec, pos[batch], rad[batch])
+
+                oflat = np.dot(offsets, strides).astype('int').ravel()
+                pflat = np.dot(p[batch], strides).astype('int')
+                for n, pf, tn in zip(batch, pflat, t):
+                    flat[n], vals[n] = pf + oflat, tn.ravel()
+
+            # particles on the edge of the field, one at a time
+            for n in inds[~inside[inds]]:
+                tile = Tile(p[n]-r[n], p[n]+r[n], 0, shape)
+                rvec = tile.coords(form='vector')
+                vals[n] = (sign*self._sphere_image(rvec, pos[n], rad[n])).ravel()
+                flat[n] = np.ravel_multi_index(np.ix_(*[np.arange(l, rr)
+                        for l, rr in zip(tile.l, tile.r)]), shape).ravel()
+
+            if len(inds) > 0:
+                # a view of the (contiguous) particle field to scatter into
+                field = self.particles.ravel()
+                assert np.shares_memory(field, self.particles)
+                np.add.at(field, np.hstack([flat[n] for n in inds]),
+                        np.hstack([vals[n] for n in inds]))
 
     def param_radii(self):
         """ Return params of all radii """
@@ -680,17 +1086,15 @@ class PlatonicSpheresCollection(PlatonicParticlesCollection):
         rad = listify(rad)
         # add some zero mass particles to the list (same as not having these
         # particles in the image, which is true at this moment)
-        inds = np.arange(self.N, self.N+len(rad))
-        self.pos = np.vstack([self.pos, pos])
-        self.rad = np.hstack([self.rad, np.zeros(len(rad))])
+        n0 = self.N
+        inds = self._append_particles(pos=pos, rad=np.zeros(len(rad)))
 
-        # update the parameters globally
-        self.setup_variables()
-        self.trigger_parameter_change()
+        # update the parameters of the new particles
+        added, _ = self._resize_variables(n0, self.N)
+        self.trigger_parameter_change(added=added)
 
         # now request a drawing of the particle plz
-        params = self.param_particle_rad(inds)
-        self.trigger_update(params, rad)
+        self._trigger_rad_update(inds, rad)
         return inds
 
     def remove_particle(self, inds):
@@ -708,21 +1112,41 @@ class PlatonicSpheresCollection(PlatonicParticlesCollection):
         #      removing (to return to user)
         #   2. redraw those particles to 0.0 radius
         #   3. remove the particles and trigger changes
-        # However, there is an issue -- if there are two particles at opposite
-        # ends of the image, it will be significantly slower than usual
+        # particles at opposite ends of the image are redrawn separately, see
+        # _trigger_rad_update
         pos = self.pos[inds].copy()
         rad = self.rad[inds].copy()
 
-        self.trigger_update(self.param_particle_rad(inds), np.zeros(len(inds)))
+        self._trigger_rad_update(inds, np.zeros(len(inds)))
 
-        self.pos = np.delete(self.pos, inds, axis=0)
-        self.rad = np.delete(self.rad, inds, axis=0)
+        n0 = self.N
+        self._delete_particles(inds)
 
-        # update the parameters globally
-        self.setup_variables()
-        self.trigger_parameter_change()
+        # the later particles were renumbered, so only the last names go
+        _, removed = self._resize_variables(n0, self.N)
+        self.trigger_parameter_change(removed=removed)
         return np.array(pos).reshape(-1,3), np.array(rad).reshape(-1)
 
+    def _trigger_rad_update(self, inds, rad):
+        """
+        Redraw the particles `inds` with radii `rad`. When the particles are
+        spread out, so that their tiles cover less than their bounding tile,
+        they are updated one at a time rather than in one large update.
+        """
+        inds, rad = listify(inds), listify(rad)
+        zsc = np.array([1.0/self.zscale, 1, 1])
+        tiles = []
+        for i, r in zip(inds, rad):
+            pos, r = self._trans(self.pos[i]), max(r, self.rad[i])
+            tiles.append(Tile(pos - zsc*r, pos + zsc*r).pad(self.support_pad))
+
+        volume = np.sum([t.volume for t in tiles])
+        if len(tiles) > 1 and volume < Tile.boundingtile(tiles).volume:
+            for i, r in zip(inds, rad):
+                self.trigger_update(self.param_particle_rad(i), r)
+        else:
+            self.trigger_update(self.param_particle_rad(inds), rad)
+
     def get_radii(self):
         return self.rad.copy()
 
@@ -737,6 +1161,13 @@ class PlatonicSpheresCollection(PlatonicParticlesCollection):
         rad    : ('a', 100)
         zscale : ('zscale, None)
         """
+        flat = getattr(self, '_pindex', {}).get(param)
+        if flat is not None:
+            if flat < 0:
+                return 'zscale', None
+            n, c = divmod(flat, len(self._coords))
+            return self._coords[c], n
+
         g = param.split('-')
         if len(g) == 1:
             return 'zscale', None
@@ -745,13 +1176,9 @@ class PlatonicSpheresCollection(PlatonicParticlesCollection):
 
     def _update_type(self, params):
         """ Returns dozscale and particle list of update """
-        dozscale = False
-        particles = []
-        for p in listify(params):
-            typ, ind = self._p2i(p)
-            particles.append(ind)
-            dozscale = dozscale or typ == 'zscale'
-        particles = set(particles)
+        inds = self.param_indices(params)
+        dozscale = bool((inds < 0).any())
+        particles = set((inds[inds >= 0] // len(self._coords)).tolist())
         return dozscale, particles
 
     def _tile(self, n):
@@ -782,13 +1209,22 @@ class PlatonicSpheresCollection(PlatonicParticlesCollection):
     def __getstate__(self):
         odict = self.__dict__.copy()
         cdd(odict, super(PlatonicSpheresCollection, self).nopickle())
-        cdd(odict, ['rvecs', 'particles', '_params'])
+        cdd(odict, ['rvecs', 'particles', '_params', '_pindex', '_profile_table',
+                '_n'])
+        for name in self._particle_arrays:
+            cdd(odict, '_' + name)
+            odict[name] = getattr(self, name).copy()
         return odict
 
     def __setstate__(self, idict):
+        idict = idict.copy()
+        for name in self._particle_arrays:
+            setattr(self, name, idict.pop(name))
         self.__dict__.update(idict)
         ##Compatibility patches...
         self.float_precision = self.__dict__.get('float_precision', np.float64)
+        self.profile_tol = self.__dict__.get('profile_tol', None)
+        self._profile_table = None
         ##end compatibility patch
         self.setup_variables()
         if self.shape:
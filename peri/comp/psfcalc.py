@@ -9,17 +9,40 @@ from peri import util
 from peri import interpolation
 from peri.comp import psfs
 
+# Approximate bytes of the complex temporaries in get_K per voxel and
+# quadrature point, used to bound the memory of the direct calculation
+K_BYTES_PER_POINT = 96
+
 def j2(x):
     """ A fast j2 defined in terms of other special functions """
     to_return = 2./(x+1e-15)*j1(x) - j0(x)
     to_return[x==0] = 0
     return to_return
 
+# quadrature points and weights by rule and number of points, which are the
+# same for every psf calculation
+_QUADRATURE = {}
+
+def gauss_quadrature(rule, npts):
+    """
+    Returns the Gaussian quadrature points and weights for one of the
+    numpy.polynomial `rule`s {'legendre', 'hermite', 'laguerre'}, e.g.
+    numpy.polynomial.legendre.leggauss(npts), caching the calculation.
+    """
+    key = (rule, npts)
+    if key not in _QUADRATURE:
+        name = {'legendre': 'leggauss', 'hermite': 'hermgauss',
+                'laguerre': 'laggauss'}[rule]
+        func = getattr(getattr(np.polynomial, rule), name)
+        _QUADRATURE[key] = func(npts)
+    pts, wts = _QUADRATURE[key]
+    return pts.copy(), wts.copy()
+
 #Two methods for calculating quadrature points for integration over the
 #illuminating line:
 def calc_pts_hg(npts=20):
     """Returns Hermite-Gauss quadrature points for even functions"""
-    pts_hg, wts_hg = np.polynomial.hermite.hermgauss(npts*2)
+    pts_hg, wts_hg = gauss_quadrature('hermite', npts*2)
     pts_hg = pts_hg[npts:]
     wts_hg = wts_hg[npts:] * np.exp(pts_hg*pts_hg)
     return pts_hg, wts_hg
@@ -49,7 +72,7 @@ def calc_pts_lag(npts=20):
     scl = { 15:0.072144,
             20:0.051532,
             25:0.043266}[npts]
-    pts0, wts0 = np.polynomial.laguerre.laggauss(npts)
+    pts0, wts0 = gauss_quadrature('laguerre', npts)
     pts = np.sinh(pts0*scl)
     wts = scl*wts0*np.cosh(pts0*scl)*np.exp(pts0)
     return pts, wts
@@ -181,7 +204,7 @@ def get_Kprefactor(z, cos_theta, zint=100.0, n2n1=0.95, get_hdet=False,
     phase = f_theta(cos_theta, zint, z, n2n1=n2n1, **kwargs)
     to_return = np.exp(-1j*phase)
     if not get_hdet:
-        to_return *= np.outer(np.ones_like(z),np.sqrt(cos_theta))
+        to_return *= np.sqrt(cos_theta)
 
     return to_return
 
@@ -253,8 +276,7 @@ def get_K(rho, z, alpha=1.0, zint=100.0, n2n1=0.95, get_hdet=False, K=1,
     if type(rho) != np.ndarray or type(z) != np.ndarray or (rho.shape != z.shape):
         raise ValueError('rho and z must be np.arrays of same shape.')
 
-    pts, wts = np.polynomial.legendre.leggauss(npts)
-    n1n2 = 1.0/n2n1
+    pts, wts = gauss_quadrature('legendre', npts)
 
     rr = np.ravel(rho)
     zr = np.ravel(z)
@@ -267,37 +289,190 @@ def get_K(rho, z, alpha=1.0, zint=100.0, n2n1=0.95, get_hdet=False, K=1,
         Kprefactor = get_Kprefactor(z, cos_theta, zint=zint, \
             n2n1=n2n1,get_hdet=get_hdet, **kwargs)
 
+    integrand = Kprefactor * get_Kradial(rr, cos_theta, n2n1=n2n1, K=K)
+
+    kint = (wts*integrand).sum(axis=1) * 0.5*(1-np.cos(alpha))
+
+    if return_Kprefactor:
+        return kint.reshape(rho.shape), Kprefactor
+    else:
+        return kint.reshape(rho.shape)
+
+def get_Kradial(rho, cos_theta, n2n1=0.95, K=1):
+    """
+    Returns the rho-dependent part of the integrand of one of the three
+    electric field integrals.
+
+    This is an internal function called by get_K and get_K_table. The
+    integrand of K_i is the product of this and the z-dependent
+    Kprefactor.
+
+    Parameters
+    ----------
+        rho : numpy.ndarray
+            1D array of the values of rho at which to calculate the
+            integrand, in units of 1/k.
+        cos_theta : numpy.ndarray
+            The values of cos(theta) at which to calculate the integrand.
+        n2n1 : Float, optional
+            The ratio n2/n1 of the index mismatch. Default is 0.95
+        K : {1, 2, 3}, optional
+            Which of the 3 integrals to evaluate. Default is 1
+
+    Returns
+    -------
+        numpy.ndarray
+            The integrand, of size [`rho.size`, `cos_theta.size`]
+    """
+    n1n2 = 1.0/n2n1
     if K==1:
-        part_1 = j0(np.outer(rr,np.sqrt(1-cos_theta**2)))*\
-            np.outer(np.ones_like(rr), 0.5*(get_taus(cos_theta,n2n1=n2n1)+\
+        part_1 = j0(np.outer(rho,np.sqrt(1-cos_theta**2)))*\
+            (0.5*(get_taus(cos_theta,n2n1=n2n1)+\
             get_taup(cos_theta,n2n1=n2n1)*csqrt(1-n1n2**2*(1-cos_theta**2))))
-        integrand = Kprefactor * part_1
+        return part_1
     elif K==2:
-        part_2=j2(np.outer(rr,np.sqrt(1-cos_theta**2)))*\
-            np.outer(np.ones_like(rr),0.5*(get_taus(cos_theta,n2n1=n2n1)-\
+        part_2=j2(np.outer(rho,np.sqrt(1-cos_theta**2)))*\
+            (0.5*(get_taus(cos_theta,n2n1=n2n1)-\
             get_taup(cos_theta,n2n1=n2n1)*csqrt(1-n1n2**2*(1-cos_theta**2))))
-        integrand = Kprefactor * part_2
+        return part_2
     elif K==3:
         part_3=j1(np.outer(rho,np.sqrt(1-cos_theta**2)))*\
-            np.outer(np.ones_like(rr), n1n2*get_taup(cos_theta,n2n1=n2n1)*\
-            np.sqrt(1-cos_theta**2))
-        integrand = Kprefactor * part_3
+            (n1n2*get_taup(cos_theta,n2n1=n2n1)*np.sqrt(1-cos_theta**2))
+        return part_3
     else:
         raise ValueError('K=1,2,3 only...')
 
-    big_wts=np.outer(np.ones_like(rr), wts)
-    kint = (big_wts*integrand).sum(axis=1) * 0.5*(1-np.cos(alpha))
+def get_chunks(size, npts=20, max_mem=1e9, **kwargs):
+    """
+    Splits `size` voxels into chunks whose get_K temporaries, of size
+    [chunk, `npts`], use at most about `max_mem` bytes.
+
+    Returns
+    -------
+        list of slice
+    """
+    chunk = max(int(max_mem // (K_BYTES_PER_POINT * npts)), 1)
+    return [slice(i, i+chunk) for i in range(0, size, chunk)]
 
-    if return_Kprefactor:
-        return kint.reshape(rho.shape), Kprefactor
-    else:
-        return kint.reshape(rho.shape)
+#######~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#######
+#                          Radial Lookup Tables
+#######~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#######
+# The integrand of K_i(rho, z) is a product of a z-dependent prefactor and a
+# rho-dependent Bessel function, so on a table of rho and z values the
+# integrals are a single matrix product. Since the psfs are calculated on
+# grids, the voxels share only a few distinct values of z and rho.
+
+# Spacing of the rho grid for interpolated tables, in units of
+# 1/(k*sin(alpha)). The interpolation is 4-point Lagrange, with a relative
+# error of about 0.023 * K_TABLE_STEP**4
+K_TABLE_STEP = 0.05
+
+def get_K_table(rho, z, alpha=1.0, zint=100.0, n2n1=0.95, get_hdet=False,
+        Ks=(1,2,3), npts=20, **kwargs):
+    """
+    Calculates electric field integrals on a table of rho and z values.
+
+    Parameters
+    ----------
+        rho : numpy.ndarray
+            1D array of the rho values of the table, in units of 1/k.
+        z : numpy.ndarray
+            1D array of the z values of the table, in units of 1/k.
+        Ks : list of {1, 2, 3}, optional
+            Which of the 3 integrals to evaluate. Default is all.
+
+    Other Parameters
+    ----------------
+        alpha, zint, n2n1, get_hdet, npts : see get_K
+
+    Returns
+    -------
+        list of numpy.ndarray
+            The integrals K_i, each of shape [`z.size`, `rho.size`]
+    """
+    pts, wts = gauss_quadrature('legendre', npts)
+    cos_theta = 0.5*(1-np.cos(alpha))*pts+0.5*(1+np.cos(alpha))
+
+    Kprefactor = get_Kprefactor(z, cos_theta, zint=zint, n2n1=n2n1,
+            get_hdet=get_hdet, **kwargs)
+    Kprefactor = Kprefactor * (wts * 0.5*(1-np.cos(alpha)))
+
+    return [np.dot(Kprefactor, get_Kradial(rho, cos_theta, n2n1=n2n1, K=K).T)
+            for K in Ks]
+
+def get_K_interpolated(rho, z, alpha=1.0, Ks=(1,2,3), step=None, **kwargs):
+    """
+    Calculates electric field integrals by a lookup table in rho and z.
+
+    The integrals are evaluated on a table of the distinct z values and
+    either the distinct rho values, in which case the lookup is exact, or a
+    uniform grid in rho if that is smaller, in which case the integrals are
+    interpolated to `rho` with 4-point Lagrange interpolation.
+
+    Parameters
+    ----------
+        rho : numpy.ndarray
+            Rho in cylindrical coordinates, in units of 1/k.
+        z : numpy.ndarray
+            Z in cylindrical coordinates, in units of 1/k. Must be the
+            same shape as `rho`
+        alpha : Float, optional
+            The acceptance angle of the lens, on (0,pi/2). Default is 1.
+        Ks : list of {1, 2, 3}, optional
+            Which of the 3 integrals to evaluate. Default is all.
+        step : Float or None, optional
+            Spacing of the interpolation grid in rho, in units of 1/k.
+            Default is None, i.e. K_TABLE_STEP / sin(alpha).
+        **kwargs :
+            Passed to get_K_table.
+
+    Returns
+    -------
+        list of numpy.ndarray
+            The integrals K_i, each of `rho`.shape
+    """
+    if type(rho) != np.ndarray or type(z) != np.ndarray or (rho.shape != z.shape):
+        raise ValueError('rho and z must be np.arrays of same shape.')
+
+    zu, zi = np.unique(z, return_inverse=True)
+    ru, ri = np.unique(rho, return_inverse=True)
+    zi, ri = zi.ravel(), ri.ravel()
+
+    step = step or K_TABLE_STEP / np.sin(alpha)
+    nr = int(np.ceil(np.abs(ru).max() / step)) + 4
+
+    if ru.size <= nr:
+        tables = get_K_table(ru, zu, alpha=alpha, Ks=Ks, **kwargs)
+        return [t[zi, ri].reshape(rho.shape) for t in tables]
+
+    # the grid starts at -step so that every rho has two nodes on each side
+    grid = step * np.arange(-1, nr-1)
+    tables = get_K_table(grid, zu, alpha=alpha, Ks=Ks, **kwargs)
+
+    x = np.abs(ru) / step + 1
+    i = np.clip(np.floor(x).astype('int'), 1, nr-3)
+    t = x - i
+    weights = [
+        -t*(t-1)*(t-2)/6, (t+1)*(t-1)*(t-2)/2,
+        -(t+1)*t*(t-2)/2, (t+1)*t*(t-1)/6
+    ]
+
+    i = i[ri]
+    weights = [w[ri] for w in weights]
+    out = []
+    for K, table in zip(Ks, tables):
+        kint = sum(w*table[zi, i+j-1] for j, w in enumerate(weights))
+        if K == 3:
+            kint *= np.sign(rho.ravel())
+        out.append(kint.reshape(rho.shape))
+    return out
 
 #######~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#######
 #                          Confocal PSF Calculations
 #######~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#######
 
-def get_hsym_asym(rho, z, get_hdet=False, include_K3_det=True, **kwargs):
+def get_hsym_asym(rho, z, get_hdet=False, include_K3_det=True, use_table=True,
+        max_mem=1e9, **kwargs):
     """
     Calculates the symmetric and asymmetric portions of a confocal PSF.
 
@@ -317,6 +492,15 @@ def get_hsym_asym(rho, z, get_hdet=False, include_K3_det=True, **kwargs):
             lens and no z-polarization of the focused light. Default
             is True, i.e. calculates the K3 component as if the focusing
             lens is high-aperture
+        use_table : Bool, optional
+            Set to True to evaluate the integrals from a lookup table in
+            rho and z with get_K_interpolated, which is much faster when
+            `rho`, `z` are on a grid. Default is True.
+        max_mem : Numeric, optional
+            The maximum memory, in bytes, for the temporaries of the direct
+            (`use_table=False`) calculation, which is done in chunks of
+            voxels that fit. The result does not depend on `max_mem`.
+            Default is 1e9.
 
     Other Parameters
     ----------------
@@ -337,18 +521,35 @@ def get_hsym_asym(rho, z, get_hdet=False, include_K3_det=True, **kwargs):
         hasym : numpy.ndarray
             `rho`.shape numpy.array of the asymmetric portion of the PSF
     """
+    use_K3 = not (get_hdet and not include_K3_det)
+    if use_table:
+        Ks = get_K_interpolated(rho, z, get_hdet=get_hdet,
+                Ks=(1,2,3) if use_K3 else (1,2), **kwargs)
+        K1, K2 = Ks[:2]
+        K3 = Ks[2] if use_K3 else 0*K1
+        return _hsym_asym(K1, K2, K3)
 
-    K1, Kprefactor = get_K(rho, z, K=1, get_hdet=get_hdet, Kprefactor=None,
-            return_Kprefactor=True, **kwargs)
-    K2 = get_K(rho, z, K=2, get_hdet=get_hdet, Kprefactor=Kprefactor,
-            return_Kprefactor=False, **kwargs)
+    if type(rho) != np.ndarray or type(z) != np.ndarray or (rho.shape != z.shape):
+        raise ValueError('rho and z must be np.arrays of same shape.')
 
-    if get_hdet and not include_K3_det:
-        K3 = 0*K1
-    else:
-        K3 = get_K(rho, z, K=3, get_hdet=get_hdet, Kprefactor=Kprefactor,
-            return_Kprefactor=False, **kwargs)
+    rr, zr = rho.ravel(), z.ravel()
+    hsym, hasym = np.zeros(rho.size), np.zeros(rho.size)
+    for sl in get_chunks(rho.size, max_mem=max_mem, **kwargs):
+        r, zz = rr[sl], zr[sl]
+        K1, Kprefactor = get_K(r, zz, K=1, get_hdet=get_hdet, Kprefactor=None,
+                return_Kprefactor=True, **kwargs)
+        K2 = get_K(r, zz, K=2, get_hdet=get_hdet, Kprefactor=Kprefactor,
+                return_Kprefactor=False, **kwargs)
+
+        if not use_K3:
+            K3 = 0*K1
+        else:
+            K3 = get_K(r, zz, K=3, get_hdet=get_hdet, Kprefactor=Kprefactor,
+                return_Kprefactor=False, **kwargs)
+        hsym[sl], hasym[sl] = _hsym_asym(K1, K2, K3)
+    return hsym.reshape(rho.shape), hasym.reshape(rho.shape)
 
+def _hsym_asym(K1, K2, K3):
     hsym = K1*K1.conj() + K2*K2.conj() + 0.5*(K3*K3.conj())
     hasym= K1*K2.conj() + K2*K1.conj() + 0.5*(K3*K3.conj())
 
@@ -445,7 +646,7 @@ def get_polydisp_pts_wts(kfki, sigkf, dist_type='gaussian', nkpts=3):
             The associated Gauss quadrature weights.
     """
     if dist_type.lower() == 'gaussian':
-        pts, wts = np.polynomial.hermite.hermgauss(nkpts)
+        pts, wts = gauss_quadrature('hermite', nkpts)
         kfkipts = np.abs(kfki + sigkf*np.sqrt(2)*pts)
     elif dist_type.lower() == 'laguerre' or dist_type.lower() == 'gamma':
         k_scale = sigkf**2/kfki
@@ -532,8 +733,9 @@ def calculate_polychrome_pinhole_psf(x, y, z, normalize=False, kfki=0.889,
     #2. Hdet
     hdet_func = lambda kfki: get_hsym_asym(rho*kfki, z*kfki,
                 zint=kfki*zint, get_hdet=True, **kwargs)[0]
-    inner = [wts[a] * hdet_func(kfkipts[a]) for a in range(nkpts)]
-    hdet = np.sum(inner, axis=0)
+    hdet = wts[0] * hdet_func(kfkipts[0])
+    for a in range(1, nkpts):
+        hdet += wts[a] * hdet_func(kfkipts[a])
 
     #3. Normalize and return
     if normalize:
@@ -681,7 +883,7 @@ def calculate_linescan_ilm_psf(y,z, polar_angle=0., nlpts=1,
         yg[...,a] = y.copy()
         zg[...,a] = z.copy()
 
-    y_pinhole, wts_pinhole = np.polynomial.hermite.hermgauss(nlpts)
+    y_pinhole, wts_pinhole = gauss_quadrature('hermite', nlpts)
     y_pinhole *= np.sqrt(2)*pinhole_width
     wts_pinhole /= np.sqrt(np.pi)
 
@@ -901,8 +1103,9 @@ def calculate_polychrome_linescan_psf(x, y, z, normalize=False, kfki=0.889,
         hdet_func = lambda kfki: get_hsym_asym(rho3*kfki, z3*kfki,
                 zint=kfki*zint, get_hdet=True, **kwargs)[0]
     #####
-    inner = [wts[a] * hdet_func(kfkipts[a]) for a in range(nkpts)]
-    hdet = np.sum(inner, axis=0)
+    hdet = wts[0] * hdet_func(kfkipts[0])
+    for a in range(1, nkpts):
+        hdet += wts[a] * hdet_func(kfkipts[a])
 
     if normalize:
         hilm /= hilm.sum()
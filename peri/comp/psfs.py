@@ -8,7 +8,7 @@ from multiprocessing import cpu_count
 from numpy.polynomial.legendre import legval
 from numpy.polynomial.chebyshev import chebval
 
-from peri.fft import fft, fftkwargs
+from peri.fft import fft, fftkwargs, plans
 from peri.comp import Component
 from peri.util import Tile, cdd, memoize, listify
 
@@ -18,6 +18,10 @@ from peri.util import Tile, cdd, memoize, listify
 class PSF(Component):
     category = 'psf'
 
+    # whether `execute` is the convolution with `kpsf` of this class, which
+    # `execute_batch` can apply with batched real transforms
+    _kpsf_execute = True
+
     def __init__(self, params, values, shape=None):
         """
         Point spread function classes must contain the following classes in order
@@ -50,7 +54,7 @@ class PSF(Component):
         pad = tuple((d[i],d[i]+o[i]) for i in [0,1,2])
         self.rpsf = np.pad(self.min_rpsf, pad, mode='constant', constant_values=0)
         self.rpsf = fft.ifftshift(self.rpsf)
-        self.kpsf = fft.fftn(self.rpsf, **fftkwargs)
+        self.kpsf = plans.fftn(self.rpsf)
         self.kpsf /= (np.real(self.kpsf[0,0,0]) + 1e-15)
         return self.kpsf
 
@@ -86,11 +90,29 @@ class PSF(Component):
             raise AttributeError("Field passed to PSF incorrect shape")
 
         if not np.iscomplex(field.ravel()[0]):
-            infield = fft.fftn(field, **fftkwargs)
+            infield = plans.fftn(field, copy=False)
         else:
             infield = field
 
-        return np.real(fft.ifftn(infield * self.kpsf, **fftkwargs))
+        return np.real(plans.ifftn(infield * self.kpsf))
+
+    def execute_batch(self, fields):
+        """
+        Apply the psf to each of the real `fields` stacked along the first
+        axis. The convolution with `kpsf` is done with one batched real
+        transform; psfs with their own `execute` apply it to each field.
+        """
+        if not self._kpsf_execute:
+            return np.array([self.execute(f) for f in fields])
+
+        if any(fields.shape[1:] != self.tile.shape):
+            raise AttributeError("Fields passed to PSF incorrect shape")
+
+        # kpsf is the transform of a real psf, so half of it is enough
+        kshape = fields.shape[1:]
+        kfields = plans.rfftn_batch(fields, copy=False)
+        kfields *= self.kpsf[..., :kshape[-1]//2+1]
+        return plans.irfftn_batch(kfields, s=kshape)
 
     def get(self):
         return self
@@ -145,6 +167,9 @@ class IdentityPSF(PSF):
 
     def execute(self, field):
         return field
+
+    def execute_batch(self, fields):
+        return fields
     
     def get_padding_size(self, tile):
         return Tile(np.ones(3))
@@ -204,6 +229,8 @@ class AnisotropicGaussianXYZ(PSF):
 # Begin 4-dimensional point spread functions
 #=============================================================================
 class PSF4D(PSF):
+    _kpsf_execute = False
+
     def __init__(self, params, values, shape=None):
         """
         4-dimensional Point-Spread-Function (PSF) is implemented by assuming
@@ -237,7 +264,7 @@ class PSF4D(PSF):
             rpsf[i] = self.rpsf_xy(vecs, z)
 
         # calcualte the psf in k-space using 2d ffts
-        kpsf = fft.fft2(rpsf, **fftkwargs)
+        kpsf = plans.fftn(rpsf, axes=(1,2))
 
         # need to normalize each x-y slice individually
         for i,z in enumerate(zs):
@@ -268,11 +295,11 @@ class PSF4D(PSF):
             raise AttributeError("Field passed to PSF incorrect shape")
 
         if not np.iscomplexobj(field):
-            infield = fft.fft2(field, **fftkwargs)
+            infield = plans.fftn(field, axes=(1,2), copy=False)
         else:
             infield = field
 
-        cov2d = np.real(fft.ifft2(infield * self.kpsf, **fftkwargs))
+        cov2d = np.real(plans.ifftn(infield * self.kpsf, axes=(1,2)))
         cov2dT = np.rollaxis(cov2d, 0, 3)
 
         out = np.zeros_like(cov2d)
@@ -520,6 +547,8 @@ class GaussianMomentExpansion(PSF4D):
 # Array-based specification of PSF
 #=============================================================================
 class FromArray(PSF):
+    _kpsf_execute = False
+
     def __init__(self, array, *args, **kwargs):
         """
         Only thing to pass is the values of the point spread function (does not
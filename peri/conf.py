@@ -12,6 +12,8 @@ Variable name             Default value          Description
                                                  are faster in subsequent evaluations.
 ``fftw-wisdom``           ``~/.peri-wisdom.pkl`` Location of file in which to store wisdom. Wisdom is the results
                                                  of fftw benchmarking itself, allowing it to run as fast as possible.
+``psf-threads``           -1                     Number of threads for calculating independent slices of exact
+                                                 psfs, -1 indicates all available
 ``log-filename``          ``~/.peri.log``        Name of file for logging.
 ``log-to-file``           False                  Whether or not to actually save logs to a file as well
 ``log-colors``            False                  Display logs in color (supported by xterm256)
@@ -28,6 +30,7 @@ default_conf = {
     "fftw-threads": -1,
     "fftw-planning-effort": "FFTW_MEASURE",
     "fftw-wisdom": os.path.join(os.path.expanduser("~"), ".peri-wisdom.pkl"),
+    "psf-threads": -1,
     "log-filename": os.path.join(os.path.expanduser("~"), '.peri.log'),
     "log-to-file": False,
     "log-colors": False,
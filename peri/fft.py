@@ -19,6 +19,17 @@ arguments::
     from peri.fft import fft, fftkwargs
     fft.fftn(image_array, **fftkwargs)
 
+If pyfftw is not present, ``scipy.fft`` (with ``workers`` threads) is used
+instead, falling back to ``numpy.fft``.
+
+Transforms which are repeated many times on arrays of the same shape should
+go through the ``plans`` object instead, which keeps an explicit FFTW plan
+with aligned input and output buffers for every shape it has seen::
+
+    from peri.fft import plans
+    kfield = plans.rfftn(field)
+    kstack = plans.rfftn_batch([field0, field1, field2])
+
 """
 import atexit
 import pickle
@@ -27,7 +38,7 @@ import numpy as np
 from multiprocessing import cpu_count
 
 from peri import conf
-from peri.util import Tile
+from peri.util import Tile, LRUCache
 from peri.logger import log
 log = log.getChild('fft')
 
@@ -40,11 +51,20 @@ except ImportError as e:
         'Try `pip install pyfftw`.'
     )
     hasfftw = False
-    
+
+try:
+    import scipy.fft
+    hasscipyfft = True
+except ImportError as e:
+    hasscipyfft = False
+
 FFTW_PLAN_FAST = 'FFTW_ESTIMATE'
 FFTW_PLAN_NORMAL = 'FFTW_MEASURE'
 FFTW_PLAN_SLOW = 'FFTW_PATIENT'
 
+# total size of the aligned buffers held by the cached FFTW plans
+FFT_PLAN_CACHE_BYTES = 2**30
+
 def load_wisdom(wisdomfile):
     """
     Prime FFTW with knowledge of which FFTs are best on this machine by
@@ -73,11 +93,12 @@ def save_wisdom(wisdomfile):
             protocol=2
         )
 
+_var = conf.load_conf()
+threads = _var['fftw-threads']
+threads = threads if threads > 0 else cpu_count()
+
 if hasfftw:
-    _var = conf.load_conf()
     effort = _var['fftw-planning-effort']
-    threads = _var['fftw-threads']
-    threads = threads if threads > 0 else cpu_count()
 
     # these variables must be passed to every fft.* function
     fftkwargs = {
@@ -106,9 +127,133 @@ if hasfftw:
     def fftnorm(arr):
         return arr * arr.size
 
+elif hasscipyfft:
+    fftkwargs = {'workers': threads}
+    fft = scipy.fft
+
+    def fftnorm(arr):
+        return arr
+
 else:
     fftkwargs = {}
     fft = np.fft
 
     def fftnorm(arr):
         return arr
+
+class FFTPlans(object):
+    def __init__(self, max_bytes=FFT_PLAN_CACHE_BYTES):
+        """
+        Repeated transforms of same-shaped arrays. With pyfftw, an explicit
+        ``pyfftw.FFTW`` plan with preallocated, aligned buffers is created
+        for every (transform, shape, dtype, axes) and reused on subsequent
+        calls, skipping the lookup and copies of ``pyfftw.interfaces``.
+        Plans are kept in an LRU cache bounded by the size of their buffers.
+        Without pyfftw the calls are passed on to ``peri.fft.fft``.
+
+        The results of the transforms are normalized as in ``numpy.fft``.
+
+        Parameters
+        ----------
+        max_bytes : float
+            Maximum total size of the plan buffers to keep around
+        """
+        self.cache = LRUCache(max_bytes=max_bytes)
+
+    def _plan(self, kind, a, s=None, axes=None):
+        nthreads = fftkwargs.get('threads', 1)
+        key = (kind, a.shape, a.dtype.str, s, axes, nthreads)
+
+        plan = self.cache.get(key)
+        if plan is None:
+            kwargs = {
+                'planner_effort': fftkwargs['planner_effort'],
+                'threads': nthreads, 'auto_align_input': True,
+                'auto_contiguous': True
+            }
+            if kind != 'irfftn':
+                kwargs['overwrite_input'] = True
+
+            builder = getattr(pyfftw.builders, kind)
+            inarr = pyfftw.empty_aligned(a.shape, dtype=a.dtype)
+            plan = builder(inarr, s=s, axes=axes, **kwargs)
+            nbytes = plan.input_array.nbytes + plan.output_array.nbytes
+            self.cache.put(key, plan, nbytes=nbytes)
+        return plan
+
+    def _execute(self, kind, a, s=None, axes=None, copy=True):
+        if not hasfftw:
+            return getattr(fft, kind)(a, s=s, axes=axes, **fftkwargs)
+
+        a = np.asarray(a)
+        if kind in ('rfftn',):
+            a = a.astype('float64', copy=False)
+        else:
+            a = a.astype('complex128', copy=False)
+
+        s = None if s is None else tuple(s)
+        axes = None if axes is None else tuple(axes)
+
+        # copy into the plan's own buffer, multi-dimensional c2r transforms
+        # always destroy their input
+        plan = self._plan(kind, a, s=s, axes=axes)
+        plan.input_array[...] = a
+        out = plan()
+        return out.copy() if copy else out
+
+    def fftn(self, a, s=None, axes=None, copy=True):
+        """
+        N-dimensional FFT of ``a``, see ``numpy.fft.fftn``. If ``copy`` is
+        False, the plan's output buffer is returned, which is overwritten by
+        the next transform of the same shape.
+        """
+        return self._execute('fftn', a, s=s, axes=axes, copy=copy)
+
+    def ifftn(self, a, s=None, axes=None, copy=True):
+        """ N-dimensional inverse FFT of ``a``, see :func:`FFTPlans.fftn` """
+        return self._execute('ifftn', a, s=s, axes=axes, copy=copy)
+
+    def rfftn(self, a, s=None, axes=None, copy=True):
+        """ N-dimensional real FFT of ``a``, see :func:`FFTPlans.fftn` """
+        return self._execute('rfftn', a, s=s, axes=axes, copy=copy)
+
+    def irfftn(self, a, s=None, axes=None, copy=True):
+        """ N-dimensional inverse real FFT of ``a``, see :func:`FFTPlans.fftn` """
+        return self._execute('irfftn', a, s=s, axes=axes, copy=copy)
+
+    def _batch(self, kind, arrays, s=None, axes=None, copy=True):
+        arrays = np.asarray(arrays)
+        if axes is None:
+            axes = range(arrays.ndim - 1)
+        axes = tuple(i % (arrays.ndim - 1) + 1 for i in axes)
+        return self._execute(kind, arrays, s=s, axes=axes, copy=copy)
+
+    def fftn_batch(self, arrays, s=None, axes=None, copy=True):
+        """
+        Transform each of the same-shaped ``arrays`` (a sequence or an array
+        stacked along the first axis) in a single plan, returning the stacked
+        results. ``s`` and ``axes`` refer to the axes of the individual arrays.
+        """
+        return self._batch('fftn', arrays, s=s, axes=axes, copy=copy)
+
+    def ifftn_batch(self, arrays, s=None, axes=None, copy=True):
+        """ Batched inverse FFT, see :func:`FFTPlans.fftn_batch` """
+        return self._batch('ifftn', arrays, s=s, axes=axes, copy=copy)
+
+    def rfftn_batch(self, arrays, s=None, axes=None, copy=True):
+        """ Batched real FFT, see :func:`FFTPlans.fftn_batch` """
+        return self._batch('rfftn', arrays, s=s, axes=axes, copy=copy)
+
+    def irfftn_batch(self, arrays, s=None, axes=None, copy=True):
+        """ Batched inverse real FFT, see :func:`FFTPlans.fftn_batch` """
+        return self._batch('irfftn', arrays, s=s, axes=axes, copy=copy)
+
+    def stats(self):
+        """ Hit / miss statistics of the plan cache """
+        return self.cache.stats()
+
+    def clear(self):
+        """ Release all of the plans and their buffers """
+        self.cache.clear()
+
+plans = FFTPlans()
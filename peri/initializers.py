@@ -7,6 +7,7 @@ from PIL import Image
 import numpy as np
 import scipy.ndimage as nd
 
+from peri.priors import overlap
 from peri.logger import log
 log = log.getChild("initializers")
 
@@ -144,10 +145,19 @@ def trackpy_featuring(im, size=10):
     return pos
 
 def remove_overlaps(pos, rad, zscale=1, doprint=False):
+    """
+    Shrink the radii `rad` (in place) of the spheres at `pos` until none
+    overlap, going through the particles in order.
+    """
     N = rad.shape[0]
     z = np.array([zscale, 1, 1])
-    for i in range(N):
-        o = np.arange(i+1, N)
+
+    # radii only shrink, so only the pairs overlapping at the start need to
+    # be checked; the pad keeps pairs which touch to within round-off
+    pairs = overlap.CellList(pos, rad, zscale=zscale).overlaps(pad=1e-8)
+    starts = np.searchsorted(pairs[:,0], np.arange(N+1))
+    for i in np.unique(pairs[:,0]):
+        o = pairs[starts[i]:starts[i+1], 1]
         d = np.sqrt( ((z*(pos[i] - pos[o]))**2).sum(axis=-1) )
         r = rad[i] + rad[o]
 
@@ -163,6 +173,11 @@ def remove_overlaps(pos, rad, zscale=1, doprint=False):
                 log.info('{} {} {}'.format(diff, rad[i], rad[j]))
 
 def remove_overlaps_naive(pos, rad, zscale=1, doprint=False):
+    """
+    Shrink the radii `rad` (in place) of the spheres at `pos` until none
+    overlap, checking every ordered pair (i, j) one at a time. This is the
+    O(N^2) reference for :func:`remove_overlaps`.
+    """
     N = rad.shape[0]
     z = np.array([zscale, 1, 1])
     for i in range(N):
@@ -1,6 +1,12 @@
 from builtins import range, object
 
 import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+# number of sets of evaluation coordinates whose sparse Barnes weights are
+# kept by each interpolator (the data points and the output points)
+BARNES_CACHE_ENTRIES = 4
 
 
 class BarnesInterpolation1D(object):
@@ -46,12 +52,21 @@ class BarnesInterpolation1D(object):
             a moderate int, causing the Barnes to compute the distance
             matrix in blocks. Does not change the final results. Default is
             None, which uses all the data all at once, using lots of mem.
+            Not used when ``clip`` is True, since then only the pairs of
+            points within the clipsize are found and stored.
 
         donorm : bool, optional
             If False, uses an old, incorrect method to evaluate the interpolant
             rather than the correct version. Default is True. If you're using
             this, set it to True.
 
+        Notes
+        -----
+        With ``clip`` the weights are stored as sparse matrices of the pairs
+        of points closer than the clipsize, found with a KD-tree, and are
+        reused for as long as the evaluation points do not change. The data
+        ``d`` can be changed between calls without recomputing them.
+
         Examples
         --------
         >>> import numpy as np
@@ -81,6 +96,7 @@ class BarnesInterpolation1D(object):
             self.filter_size = filter_size
 
         self.clipsize = clipsize * self.filter_size
+        self._sparse_cache = []
 
     def _default_filter_size(self):
         return (self.x[1:] - self.x[:-1]).mean()/2
@@ -110,9 +126,54 @@ class BarnesInterpolation1D(object):
         else:
             return self._oldcall(rvecs)
 
+    def _points(self, a):
+        """`a` as an [N, ndim] array of points"""
+        return a.reshape(a.shape[0], -1)
+
+    def _sparse_distances(self, rvecs):
+        """
+        The squared distances between `rvecs` and the data points which are
+        within the clipsize, as a sparse matrix, computed as in
+        `_distance_matrix` for the pairs found with a KD-tree.
+        """
+        a, b = self._points(rvecs), self._points(self.x)
+        pairs = cKDTree(a).sparse_distance_matrix(cKDTree(b), self.clipsize,
+                output_type='ndarray')
+        i, j = pairs['i'], pairs['j']
+        rsq = (a[i, 0] - b[j, 0])**2
+        for k in range(1, a.shape[1]):
+            rsq += (a[i, k] - b[j, k])**2
+        m = rsq < self.clipsize**2
+        return sparse.csr_matrix((rsq[m], (i[m], j[m])),
+                shape=(a.shape[0], b.shape[0]))
+
+    def _sparse_weights(self, rvecs, sigma):
+        """
+        The sparse weight matrix and its row sums for the evaluation points
+        `rvecs`, cached for the last few sets of evaluation points
+        """
+        for entry in self._sparse_cache:
+            if entry[0] is rvecs or (entry[0].shape == rvecs.shape and
+                    np.array_equal(entry[0], rvecs)):
+                break
+        else:
+            entry = (rvecs.copy(), self._sparse_distances(rvecs), {})
+            self._sparse_cache = [entry] + self._sparse_cache[
+                    :BARNES_CACHE_ENTRIES-1]
+
+        weights = entry[2]
+        if sigma not in weights:
+            w = entry[1].copy()
+            w.data = np.exp(-w.data / (2*sigma**2))
+            weights[sigma] = (w, np.asarray(w.sum(axis=1)).ravel())
+        return weights[sigma]
+
     def _eval_firstorder(self, rvecs, data, sigma):
         """The first-order Barnes approximation"""
-        if not self.blocksize:
+        if self.clip:
+            weights, norm = self._sparse_weights(rvecs, sigma)
+            return weights.dot(data) / norm
+        elif not self.blocksize:
             dist_between_points = self._distance_matrix(rvecs, self.x)
             gaussian_weights = self._weight(dist_between_points, sigma=sigma)
             return gaussian_weights.dot(data) / gaussian_weights.sum(axis=1)
@@ -206,7 +267,8 @@ class BarnesInterpolationND(BarnesInterpolation1D):
 
 
 class ChebyshevInterpolation1D(object):
-    def __init__(self, func, args=(), window=(0., 1.), degree=3, evalpts=4):
+    def __init__(self, func, args=(), window=(0., 1.), degree=3, evalpts=4,
+            coeffs=None):
         """A 1D Chebyshev approximation / interpolation for an ND function,
         approximating (N-1)D in in the last dimension.
 
@@ -229,6 +291,10 @@ class ChebyshevInterpolation1D(object):
         evalpts : integer
             Number of Chebyshev points to evaluate the function at
 
+        coeffs : ndarray [optional]
+            Previously calculated coefficients for this func, degree and
+            window. If given, func is not evaluated.
+
         Examples
         --------
         >>> import numpy as np
@@ -241,7 +307,7 @@ class ChebyshevInterpolation1D(object):
         self.args = args
         self.func = func
         self.window = window
-        self.set_order(evalpts, degree)
+        self.set_order(evalpts, degree, coeffs=coeffs)
 
     def _x2c(self, x):
         """ Convert windowdow coordinates to cheb coordinates [-1,1] """
@@ -281,14 +347,17 @@ class ChebyshevInterpolation1D(object):
         coeffs[0] *= 0.5
         self._coeffs = np.array(coeffs)
 
-    def set_order(self, evalpts, degree):
+    def set_order(self, evalpts, degree, coeffs=None):
         if evalpts < degree:
             raise ValueError("Number of Chebyshev points must be > degree")
 
         self.evalpts = evalpts
         self.degree = degree
 
-        self._construct_coefficients()
+        if coeffs is not None:
+            self._coeffs = np.array(coeffs)
+        else:
+            self._construct_coefficients()
 
     @property
     def coefficients(self):
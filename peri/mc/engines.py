@@ -1,5 +1,11 @@
 from builtins import range, object
 
+import multiprocessing
+import numpy as np
+
+from peri import util
+from peri.mc import samplers
+
 class SequentialBlockEngine(object):
     def __init__(self, state):
         self.state = state
@@ -63,3 +69,170 @@ class SequentialBlockEngine(object):
                     ob.update(ll)
 
         self.loglike, self.state = ll, s
+
+# the state sampled by the processes of CheckerboardEngine, which is set
+# before forking so that it is inherited rather than pickled
+_pool_state = None
+
+def _sample_cell(args):
+    """
+    Samples the particle parameters of one checkerboard cell of `_pool_state`
+    in a worker process, returning the parameters, their final values and
+    the change in loglikelihood.
+    """
+    params, values, bounds, nsteps, width, procedure, seed = args
+    state = _pool_state
+    np.random.seed(seed)
+
+    # the shared particle field already has the particles at these values,
+    # only this process's copy of the parameters is out of date
+    state.set_values(params, values)
+    ll0 = state.loglikelihood
+
+    eng = SequentialBlockEngine(state)
+    eng.add_samplers([
+        samplers.SliceSampler1D(width, block=p, procedure=procedure, bounds=b)
+        for p, b in zip(params, bounds)
+    ])
+    eng.dosteps(nsteps, burnin=True)
+    return params, state.get_values(params), state.loglikelihood - ll0
+
+class CheckerboardEngine(object):
+    def __init__(self, state, nproc=None, cellsize=None, maxrad=None,
+            width=1, procedure='uniform'):
+        """
+        Samples the particle positions and radii of an ImageState with
+        several processes at once. The data, model, residuals and particle
+        field of the state are moved into shared memory and the image is
+        divided into cells which are colored as a 3D checkerboard. The
+        particles of every cell of one color are sampled concurrently, each
+        cell by one process, while the particles of each cell are confined to
+        it. Since the update region of a particle never reaches into another
+        cell of the same color, the processes write to disjoint parts of the
+        shared arrays and the changes in loglikelihood simply add.
+
+        Parameters
+        ----------
+        state : :class:`peri.states.ImageState`
+            The state to sample, with a single particle component.
+
+        nproc : int, optional
+            Number of worker processes. Default is the number of cpus.
+
+        cellsize : int or ndarray, optional
+            Size of the checkerboard cells. It must be at least twice the
+            half-width of a particle update region, which is used by default.
+
+        maxrad : float, optional
+            Largest radius allowed while sampling, used to bound the update
+            regions. Default is 1.25 times the current largest radius.
+
+        width : float
+            Initial width of the slice samplers.
+
+        procedure : string
+            Stepout procedure of the slice samplers.
+        """
+        self.state = state
+        self.nproc = nproc or multiprocessing.cpu_count()
+        self.width = width
+        self.procedure = procedure
+
+        self.obj = self._get_particles(state)
+        rad = np.asarray(self.obj.rad)
+        self.maxrad = maxrad or 1.25*(rad.max() if rad.size else 1.0)
+
+        minsize = 2*self.update_halfwidth()
+        cellsize = minsize if cellsize is None else util.aN(cellsize)
+        if (cellsize < minsize).any():
+            raise ValueError('cellsize must be at least %r' % minsize)
+        self.cellsize = cellsize
+
+    @staticmethod
+    def _get_particles(state):
+        obj = state.get('obj')
+        comps = [
+            c for c in getattr(obj, 'comps', [obj]) if hasattr(c, 'rad')
+        ]
+        if len(comps) != 1:
+            raise ValueError('state must have exactly one particle component')
+        return comps[0]
+
+    def update_halfwidth(self):
+        """
+        Largest extent of the region of the image changed by a particle
+        update, measured from the particle's center
+        """
+        zsc = np.array([1.0/self.obj.zscale, 1, 1])
+        psf = self.state.get_padding_size(self.state.oshape)
+        psf = np.zeros(3) if psf is None else (psf.shape + 1)//2
+        return np.ceil(zsc*self.maxrad + self.obj.support_pad + psf + 1).astype('int')
+
+    def cells(self):
+        """
+        The checkerboard decomposition of the image. Returns a list over the
+        8 colors of lists of (lower bound, upper bound, particle indices) of
+        each cell, where the cells on the edge of the image extend outwards to
+        infinity.
+        """
+        shape = self.state.ishape.shape
+        ncells = np.maximum(shape // self.cellsize, 1)
+        edges = [np.linspace(0, s, n+1) for s, n in zip(shape, ncells)]
+        for e in edges:
+            e[0], e[-1] = -np.inf, np.inf
+
+        pos = np.asarray(self.obj.pos)
+        index = np.array([
+            np.searchsorted(e, p, side='right') - 1 for e, p in zip(edges, pos.T)
+        ]).T.reshape(-1, 3)
+
+        colors = [[] for i in range(8)]
+        for cell in np.ndindex(*ncells):
+            inds = np.arange(pos.shape[0])[(index == cell).all(axis=1)]
+            if inds.size == 0:
+                continue
+
+            l = np.array([e[c] for e, c in zip(edges, cell)])
+            r = np.array([e[c+1] for e, c in zip(edges, cell)])
+            color = int(np.dot(np.array(cell) % 2, [4, 2, 1]))
+            colors[color].append((l, r, inds))
+        return colors
+
+    def _cell_args(self, l, r, inds, nsteps):
+        params, bounds = [], []
+        for i in inds:
+            params.extend(self.obj.param_particle_pos(i))
+            params.extend(self.obj.param_particle_rad(i))
+            bounds.extend(list(zip(l, r)) + [(0., self.maxrad)])
+
+        values = self.state.get_values(params)
+        seed = np.random.randint(2**31)
+        return (params, values, bounds, nsteps, self.width, self.procedure,
+                seed)
+
+    def dosteps(self, nsteps=1):
+        """
+        Perform `nsteps` sweeps over all of the particles, with each cell
+        sampled for one step at a time. Returns the loglikelihood.
+        """
+        global _pool_state
+        try:
+            context = multiprocessing.get_context('fork')
+        except AttributeError:
+            # python 2 always forks
+            context = multiprocessing
+
+        self.state.share_memory()
+        _pool_state = self.state
+        pool = context.Pool(self.nproc)
+        try:
+            for step in range(nsteps):
+                for cells in self.cells():
+                    args = [self._cell_args(l, r, i, 1) for l, r, i in cells]
+                    for params, values, dll in pool.map(_sample_cell, args):
+                        self.state.set_values(params, values)
+                        self.state._loglikelihood += dll
+        finally:
+            pool.terminate()
+            _pool_state = None
+        return self.state.loglikelihood
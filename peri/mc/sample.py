@@ -71,6 +71,22 @@ def sample_particles(state, stepout=1, start=0, quiet=False):
 
     return state.state.copy()
 
+def sample_particles_parallel(state, N=1, stepout=1, nproc=None,
+        cellsize=None, procedure='uniform'):
+    """
+    Sample the positions and radii of all particles `N` times, sampling
+    spatially disjoint groups of particles concurrently in `nproc`
+    processes that share the state's image arrays. See
+    :class:`peri.mc.engines.CheckerboardEngine`. Returns the particle
+    parameter values.
+    """
+    eng = engines.CheckerboardEngine(state, nproc=nproc, cellsize=cellsize,
+            width=stepout, procedure=procedure)
+    eng.dosteps(N)
+
+    params = eng.obj.param_particle(list(range(eng.obj.N)))
+    return np.array(state.get_values(params))
+
 def sample_particle_pos(state, stepout=1, start=0, quiet=False):
     if not quiet:
         log.info('{:-^39}'.format(' POS '))
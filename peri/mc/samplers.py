@@ -8,14 +8,38 @@ from copy import deepcopy
 import numpy as np
 
 class Sampler(object):
-    def __init__(self, block=None):
+    def __init__(self, block=None, bounds=None):
+        """
+        Base class for samplers of the parameters ``block`` of a state.
+
+        Parameters
+        ----------
+        block : string or list of strings
+            The parameters to sample
+
+        bounds : tuple of (lower, upper) [optional]
+            If given, values of the block outside of these bounds have zero
+            probability and are never set in the state.
+        """
         self.block = block
+        self.bounds = bounds
+
+    def getvalue(self, state):
+        """ The current value(s) of the block in ``state`` """
+        return np.array(state.get_values(self.block))
 
     def getstate(self, state, substate):
         state.update(self.block, substate)
         return state
 
+    def inbounds(self, substate):
+        if self.bounds is None:
+            return True
+        return np.all((substate >= self.bounds[0]) & (substate <= self.bounds[1]))
+
     def loglikelihood(self, state, substate):
+        if not self.inbounds(substate):
+            return -np.inf
         state.update(self.block, substate)
         return state.loglikelihood
 
@@ -52,8 +76,8 @@ class MHSampler(Sampler):
         self.varsteps = varsteps
 
     def sample(self, state, curloglike=None):
-        size = state.state[self.block].shape
-        x = state.state[self.block]
+        x = self.getvalue(state)
+        size = x.shape
 
         tvar = self.var*np.random.rand() if self.varsteps else self.var
 
@@ -72,11 +96,11 @@ class SliceSampler(Sampler):
         self.maxsteps = maxsteps
 
     def sample(self, state, curloglike=None):
-        size = state.state[self.block].shape
-        x = state.state[self.block]
+        x = self.getvalue(state)
+        size = x.shape
 
-        if not isinstance(x, np.ndarray):
-            x = np.array([x])
+        if x.ndim == 0:
+            x = x.reshape(1)
 
         px = curloglike or self.loglikelihood(state, x)
         up = np.log(np.random.rand()) + px
@@ -273,14 +297,11 @@ class SliceSampler1D(Sampler):
         return p1, x1
 
     def sample(self, state, curloglike=None):
-        x = state.state[self.block]
-
-        if not isinstance(x, float):
-            if np.array(state.state[self.block]).shape[0] > 1:
-                raise AttributeError("SliceSampler1D cannot have multidimensional blocks")
+        x = self.getvalue(state)
 
-        if not isinstance(x, np.ndarray):
-            x = np.array([x])
+        if x.size > 1:
+            raise AttributeError("SliceSampler1D cannot have multidimensional blocks")
+        x = x.reshape(1)
 
         px = curloglike or self.loglikelihood(state, x)
         up = np.log(np.random.rand()) + px
@@ -310,11 +331,11 @@ class HamiltonianMCSampler(Sampler):
         self.eps = eps
 
     def sample(self, state, curloglike=None):
-        size = state.state[self.block].shape
-        x = state.state[self.block]
+        x = self.getvalue(state)
+        size = x.shape
 
-        if not isinstance(x, np.ndarray):
-            x = np.array([x])
+        if x.ndim == 0:
+            x = x.reshape(1)
 
         g = -self.gradloglikelihood(state, x)
         E = -self.loglikelihood(state, x)
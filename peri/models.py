@@ -2,7 +2,12 @@ from future.utils import iteritems
 from builtins import object
 
 import re
+import ast
+import operator
 
+import numpy as np
+
+from peri import util
 from peri.comp import (
     ComponentCollection, GlobalScalar, ilms, psfs, objs, exactpsf
 )
@@ -41,6 +46,140 @@ allobjs = {
 class ModelError(Exception):
     pass
 
+#=============================================================================
+# Compiled model equations
+#=============================================================================
+BINARY_OPS = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply,
+    ast.Div: np.true_divide, ast.Pow: operator.pow,
+}
+UNARY_OPS = {ast.USub: np.negative, ast.UAdd: np.positive}
+
+# fields smaller than this many elements are faster to evaluate with fresh
+# temporaries than through the buffered operation tree
+EXPRESSION_BUFFER_SIZE = 1 << 16
+
+class Expression(object):
+    def __init__(self, equation):
+        """
+        A model equation such as ``'H(I*(1-P)+C*P) + B'`` parsed once into a
+        tree of operations. Arithmetic is evaluated with numpy ufuncs writing
+        into intermediate buffers which are kept between evaluations, or
+        into the result of a child operation when it is no longer needed.
+        Function calls (such as the PSF) are evaluated as in python. The
+        result of the whole expression is never one of the kept buffers.
+        Small fields (see ``EXPRESSION_BUFFER_SIZE``) and equations using
+        any other syntax are evaluated with the compiled python expression.
+
+        Parameters
+        -----------
+        equation : string
+            The python expression to compile
+        """
+        self.equation = equation
+        self.code = compile(equation, '<model>', 'eval')
+        self.names = set(self.code.co_names)
+        self._buffers = {}
+
+        try:
+            self.root = self._build(ast.parse(equation, mode='eval').body)
+        except ModelError:
+            self.root = None
+
+    def _build(self, node):
+        """ Transform a python ast node into nested tuples of operations """
+        if isinstance(node, ast.Name):
+            return ('var', node.id)
+        if isinstance(node, getattr(ast, 'Constant', ())) or (
+                isinstance(node, getattr(ast, 'Num', ()))):
+            return ('const', getattr(node, 'value', getattr(node, 'n', None)))
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
+            return ('binop', BINARY_OPS[type(node.op)],
+                    self._build(node.left), self._build(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPS:
+            return ('unary', UNARY_OPS[type(node.op)], self._build(node.operand))
+        if isinstance(node, ast.Call) and not node.keywords and all(
+                not isinstance(a, getattr(ast, 'Starred', ())) for a in node.args):
+            return ('call', self._build(node.func),
+                    [self._build(a) for a in node.args])
+        raise ModelError('Unsupported syntax in model equation')
+
+    def _buffer(self, node, shape, dtype):
+        """ Scratch array for the result of `node`, reused between calls """
+        buf = self._buffers.get(id(node))
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[id(node)] = buf
+        return buf
+
+    def _apply(self, node, func, args, owned, root):
+        """
+        Apply the ufunc `func` to `args`, writing in place into an operand
+        we `owned` if possible and otherwise into the buffer of `node`
+        """
+        arrays = [a for a in args if isinstance(a, np.ndarray)]
+        if root or len(arrays) == 0:
+            return func(*args), False
+
+        # powers keep the fast paths of `**`, so cannot be written in place
+        if not isinstance(func, np.ufunc):
+            out = func(*args)
+            return out, all(out is not a for a in args)
+
+        shape = arrays[0].shape
+        if any(a.shape != shape for a in arrays[1:]):
+            shape = np.broadcast(*arrays).shape
+        dtype = np.result_type(*args)
+        for a, own in zip(args, owned):
+            if own and a.shape == shape and a.dtype == dtype:
+                return func(*args, out=a), True
+        return func(*args, out=self._buffer(node, shape, dtype)), True
+
+    def _evaluate(self, node, variables, root=False):
+        """
+        Evaluate the operation `node`, returning the value and whether it is
+        an intermediate array which may be overwritten by the caller
+        """
+        kind = node[0]
+        if kind == 'var':
+            return variables[node[1]], False
+        if kind == 'const':
+            return node[1], False
+        if kind == 'binop':
+            left, lown = self._evaluate(node[2], variables)
+            right, rown = self._evaluate(node[3], variables)
+            return self._apply(node, node[1], (left, right), (lown, rown), root)
+        if kind == 'unary':
+            val, own = self._evaluate(node[2], variables)
+            return self._apply(node, node[1], (val,), (own,), root)
+
+        func = self._evaluate(node[1], variables)[0]
+        args = [self._evaluate(a, variables)[0] for a in node[2]]
+        out = func(*args)
+
+        # a function such as the identity psf may hand back its argument,
+        # which must not be the result if it is one of our buffers
+        if root and isinstance(out, np.ndarray) and any(
+                np.shares_memory(out, b) for b in self._buffers.values()):
+            out = out.copy()
+        return out, False
+
+    def __call__(self, variables):
+        """ Evaluate the equation given a dict of `variables` """
+        size = max([v.size for v in variables.values()
+            if isinstance(v, np.ndarray)] or [0])
+        if self.root is None or size < EXPRESSION_BUFFER_SIZE:
+            return eval(self.code, variables)
+        return self._evaluate(self.root, variables, root=True)[0]
+
+    def __getstate__(self):
+        odict = self.__dict__.copy()
+        util.cdd(odict, ['_buffers', 'root', 'code', 'names'])
+        return odict
+
+    def __setstate__(self, idict):
+        self.__init__(idict['equation'])
+
 class Model(object):
     def __init__(self, modelstr, varmap, registry={}):
         """
@@ -77,6 +216,7 @@ class Model(object):
         self.registry = registry
         self.ivarmap = {v:k for k, v in iteritems(self.varmap)}
         self.check_consistency()
+        self._expressions = {}
 
     def check_consistency(self):
         """
@@ -157,12 +297,25 @@ class Model(object):
         name = self.diffname(self.ivarmap[category])
         return self.modelstr.get(name)
 
-    def map_vars(self, comps, funcname='get', diffmap=None, **kwargs):
+    def get_expression(self, name):
+        """
+        The compiled :class:`~peri.models.Expression` for the equation
+        ``modelstr[name]``, built the first time it is needed.
+        """
+        exprs = self.__dict__.setdefault('_expressions', {})
+        if name not in exprs:
+            exprs[name] = Expression(self.modelstr[name])
+        return exprs[name]
+
+    def map_vars(self, comps, funcname='get', diffmap=None, names=None,
+            **kwargs):
         """
         Map component function ``funcname`` result into model variables
         dictionary for use in eval of the model. If ``diffmap`` is provided then
         that symbol is translated into 'd'+diffmap.key and is replaced by
-        diffmap.value. ``**kwargs` are passed to the ``comp.funcname(**kwargs)``.
+        diffmap.value. If ``names`` is given, only the components for those
+        symbols are evaluated. ``**kwargs` are passed to the
+        ``comp.funcname(**kwargs)``.
         """
         out = {}
         diffmap = diffmap or {}
@@ -175,7 +328,8 @@ class Model(object):
                 out[symbol] = diffmap[cat]
             else:
                 symbol = self.ivarmap[cat]
-                out[symbol] = getattr(c, funcname)(**kwargs)
+                if names is None or symbol in names:
+                    out[symbol] = getattr(c, funcname)(**kwargs)
 
         return out
 
@@ -203,13 +357,48 @@ class Model(object):
         ``**kwargs``:
             Arguments passed to ``funcname`` of component objects
         """
-        evar = self.map_vars(comps, funcname, diffmap=diffmap)
-
         if diffmap is None:
-            return eval(self.get_base_model(), evar)
+            name = 'full'
         else:
             compname = list(diffmap.keys())[0]
-            return eval(self.get_difference_model(compname), evar)
+            name = self.diffname(self.ivarmap[compname])
+
+        # only the components which appear in the equation are evaluated
+        expr = self.get_expression(name)
+        evar = self.map_vars(comps, funcname, diffmap=diffmap, names=expr.names)
+        return expr(evar)
+
+    def evaluate_batch(self, comps, category, fields):
+        """
+        Evaluate the difference model of `category` for each of the
+        difference `fields`, stacked along the first axis, returning the
+        stacked results.
+
+        The whole stack is broadcast through the equation at once, with the
+        functions of the model (such as the psf) applied through their
+        ``execute_batch``. If one of them has none, the difference model is
+        evaluated for each field in turn.
+        """
+        name = self.diffname(self.ivarmap[category])
+        expr = self.get_expression(name)
+        evar = self.map_vars(comps, 'get', diffmap={category: fields},
+                names=expr.names)
+
+        for symbol, var in iteritems(evar):
+            if not callable(var):
+                continue
+            if not hasattr(var, 'execute_batch'):
+                return np.array([
+                    self.evaluate(comps, 'get', diffmap={category: f})
+                    for f in fields
+                ])
+            evar[symbol] = var.execute_batch
+        return expr(evar)
+
+    def __getstate__(self):
+        odict = self.__dict__.copy()
+        util.cdd(odict, ['_expressions'])
+        return odict
 
     def __str__(self):
         return "{} : {}".format(self.__class__.__name__, self.get_base_model())
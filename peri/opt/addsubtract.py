@@ -5,6 +5,7 @@ import scipy.ndimage as nd
 
 import peri
 from peri import initializers
+from peri.priors import overlap
 from peri.util import Tile
 import peri.opt.optimize as opt
 
@@ -83,14 +84,14 @@ def _feature_guess(im, rad, minmass=None, use_tp=False, trim_edge=False):
 
 
 def check_add_particles(st, guess, rad='calc', do_opt=True, im_change_frac=0.2,
-                        min_derr='3sig', **kwargs):
+                        min_derr='3sig', batch=False, **kwargs):
     """
     Checks whether to add particles at a given position by seeing if adding
     the particle improves the fit of the state.
 
     Parameters
     ----------
-    st : :class:`peri.states.State`
+    st : :class:`peri.states.ImageState`
         The state to check adding particles to.
     guess : [N,3] list-like
         The positions of particles to check to add.
@@ -108,6 +109,11 @@ def check_add_particles(st, guess, rad='calc', do_opt=True, im_change_frac=0.2,
     min_derr : Float or '3sig'
         The minimal improvement in error to add a particle. Default
         is ``'3sig' = 3*st.sigma``.
+    batch : Bool, optional
+        If True, the guesses are split into groups whose image regions do
+        not overlap and each group is added, optimized and checked together,
+        removing the rejected particles of a group with a single update.
+        Default is False, which checks the guesses one at a time.
 
     Returns
     -------
@@ -116,6 +122,12 @@ def check_add_particles(st, guess, rad='calc', do_opt=True, im_change_frac=0.2,
     new_poses : [N,3] list
         List of the positions of the added particles. If ``do_opt==True``,
         then these positions will differ from the input 'guess'.
+
+    Notes
+    -----
+    The change in error is found from the tiles touched by each check with
+    :func:`peri.states.ImageState.residuals_journal`, rather than from copies
+    of the full residuals.
     """
     # FIXME does not use the **kwargs, but needs b/c called with wrong kwargs
     if min_derr == '3sig':
@@ -124,41 +136,103 @@ def check_add_particles(st, guess, rad='calc', do_opt=True, im_change_frac=0.2,
     new_poses = []
     if rad == 'calc':
         rad = guess_add_radii(st)
+    guess = np.reshape(guess, (-1, 3))
     message = ('-'*30 + 'ADDING' + '-'*30 +
                '\n  Z\t  Y\t  X\t  R\t|\t ERR0\t\t ERR1')
     with log.noformat():
         CLOG.info(message)
-    for a in range(guess.shape[0]):
-        p0 = guess[a]
-        absent_err = st.error
-        absent_d = st.residuals.copy()
-        ind = st.obj_add_particle(p0, rad)
-        if do_opt:
-            # the slowest part of this
-            opt.do_levmarq_particles(
-                st, ind, damping=1.0, max_iter=1, run_length=3,
-                eig_update=False, include_rad=False)
-        present_err = st.error
-        present_d = st.residuals.copy()
-        dont_kill = should_particle_exist(
-                absent_err, present_err, absent_d, present_d,
-                im_change_frac=im_change_frac, min_derr=min_derr)
-        if dont_kill:
-            accepts += 1
-            p = tuple(st.obj_get_positions()[ind].ravel())
-            r = tuple(st.obj_get_radii()[ind].ravel())
-            new_poses.append(p)
-            part_msg = '%2.2f\t%3.2f\t%3.2f\t%3.2f\t|\t%4.3f  \t%4.3f' % (
-                    p + r + (absent_err, st.error))
-            with log.noformat():
-                CLOG.info(part_msg)
-        else:
-            st.obj_remove_particle(ind)
-            if np.abs(absent_err - st.error) > 1e-4:
+
+    regions = [_add_region(st, p0, rad) for p0 in guess]
+    if batch:
+        groups = _separated_groups(regions)
+    else:
+        groups = [[a] for a in range(guess.shape[0])]
+
+    absent_err = st.error
+    for group in groups:
+        with st.residuals_journal() as journal:
+            inds = st.obj_add_particle(guess[group], [rad]*len(group))
+            if do_opt:
+                # the slowest part of this
+                for ind in inds:
+                    opt.do_levmarq_particles(
+                        st, [ind], damping=1.0, max_iter=1, run_length=3,
+                        eig_update=False, include_rad=False)
+
+            # a lone guess is checked over everything it changed
+            kill, group_derr = [], 0.0
+            for a, ind in zip(group, inds):
+                tile = regions[a] if len(group) > 1 else None
+                derr, im_change = st.residuals_change(journal, tile=tile)
+                present_err = absent_err + derr
+                if _should_exist(-derr, im_change, im_change_frac, min_derr):
+                    accepts += 1
+                    p = tuple(st.obj_get_positions()[ind].ravel())
+                    r = tuple(st.obj_get_radii()[ind].ravel())
+                    new_poses.append(p)
+                    part_msg = '%2.2f\t%3.2f\t%3.2f\t%3.2f\t|\t%4.3f  \t%4.3f' % (
+                            p + r + (absent_err, present_err))
+                    with log.noformat():
+                        CLOG.info(part_msg)
+                    absent_err = present_err
+                    group_derr += derr
+                else:
+                    kill.append(ind)
+
+            if len(kill) > 0:
+                st.obj_remove_particle(kill)
+            if np.abs(st.residuals_change(journal)[0] - group_derr) > 1e-4:
                 raise RuntimeError('updates not exact?')
     return accepts, new_poses
 
 
+def _add_region(st, pos, rad):
+    """
+    The padded image tile whose residuals can change when a particle of
+    radius `rad` is added at `pos` (unpadded image coordinates) and then
+    moved by up to `rad` while optimizing.
+    """
+    c = np.asarray(pos) + st.ishape.l
+    tile = Tile(np.floor(c - 2*rad), np.ceil(c + 2*rad)).pad(_support_pad(st))
+    psf = st.get_padding_size(tile)
+    if psf is not None:
+        tile = tile.pad((psf.shape + 1)//2)
+    return tile
+
+
+def _support_pad(st):
+    """
+    The padding (pixels) about a particle's bounding box which can change
+    when it is drawn, the largest `support_pad` of the state's objects
+    """
+    obj = st.get('obj')
+    return max(getattr(c, 'support_pad', 0)
+               for c in getattr(obj, 'comps', [obj]))
+
+
+def _separated_groups(regions):
+    """
+    Greedily split the indices of `regions` into groups whose tiles do not
+    overlap, preserving the order of the indices within each group.
+    """
+    groups, members = [], []
+    for a, region in enumerate(regions):
+        for group, tiles in zip(groups, members):
+            if not any(_overlaps(region, t) for t in tiles):
+                group.append(a)
+                tiles.append(region)
+                break
+        else:
+            groups.append([a])
+            members.append([region])
+    return groups
+
+
+def _overlaps(t0, t1):
+    """Whether the tiles `t0` and `t1` share any pixels"""
+    return (Tile.intersection(t0, t1).shape > 0).all()
+
+
 def check_remove_particle(st, ind, im_change_frac=0.2, min_derr='3sig',
                           **kwargs):
     """
@@ -168,7 +242,7 @@ def check_remove_particle(st, ind, im_change_frac=0.2, min_derr='3sig',
 
     Parameters
     ----------
-    st : :class:`peri.states.State`
+    st : :class:`peri.states.ImageState`
         The state to check adding particles to.
     ind : Int
         The index of the particle to check to remove.
@@ -193,16 +267,13 @@ def check_remove_particle(st, ind, im_change_frac=0.2, min_derr='3sig',
     # FIXME does not use the **kwargs, but needs b/c called with wrong kwargs
     if min_derr == '3sig':
         min_derr = 3 * st.sigma
-    present_err = st.error
-    present_d = st.residuals.copy()
-    p, r = st.obj_remove_particle(ind)
+    with st.residuals_journal() as journal:
+        p, r = st.obj_remove_particle(ind)
+        derr, im_change = st.residuals_change(journal)
     p = p[0]
     r = r[0]
-    absent_err = st.error
-    absent_d = st.residuals.copy()
 
-    if should_particle_exist(absent_err, present_err, absent_d, present_d,
-                             im_change_frac=im_change_frac, min_derr=min_derr):
+    if _should_exist(derr, im_change, im_change_frac, min_derr):
         st.obj_add_particle(p, r)
         killed = False
     else:
@@ -239,8 +310,17 @@ def should_particle_exist(absent_err, present_err, absent_d, present_d,
     """
     delta_im = np.ravel(present_d - absent_d)
     im_change = np.dot(delta_im, delta_im)
+    return _should_exist(absent_err - present_err, im_change,
+                         im_change_frac, min_derr)
+
+
+def _should_exist(err_gain, im_change, im_change_frac, min_derr):
+    """
+    Whether a particle which lowers the error by `err_gain` while changing
+    the residuals by `im_change` (sum of squares) should be present.
+    """
     err_cutoff = max([im_change_frac * im_change, min_derr])
-    return (absent_err - present_err) >= err_cutoff
+    return err_gain >= err_cutoff
 
 
 def add_missing_particles(st, rad='calc', tries=50, **kwargs):
@@ -286,6 +366,9 @@ def add_missing_particles(st, rad='calc', tries=50, **kwargs):
     min_derr : Float or '3sig', optional
         The minimal improvement in error to add a particle. Default
         is ``'3sig' = 3*st.sigma``.
+    batch : Bool, optional
+        Whether to check guesses with non-overlapping regions together.
+        Default is False.
 
     Returns
     -------
@@ -308,7 +391,8 @@ def add_missing_particles(st, rad='calc', tries=50, **kwargs):
 
 def remove_bad_particles(st, min_rad='calc', max_rad='calc', min_edge_dist=2.0,
                          check_rad_cutoff=[3.5, 15], check_outside_im=True,
-                         tries=50, im_change_frac=0.2, **kwargs):
+                         check_overlap=False, tries=50, im_change_frac=0.2,
+                         **kwargs):
     """
     Removes improperly-featured particles from the state, based on a
     combination of particle size and the change in error on removal.
@@ -340,6 +424,10 @@ def remove_bad_particles(st, min_rad='calc', max_rad='calc', min_edge_dist=2.0,
         If True, checks if particles located outside the unpadded image
         should be deleted. Default is True.
 
+    check_overlap : Bool, optional
+        If True, also checks whether to delete the smaller particle of each
+        pair of overlapping particles. Default is False.
+
     tries : Int, optional
         The maximum number of particles with radii < check_rad_cutoff
         to try to remove. Checks in increasing order of radius size.
@@ -405,6 +493,8 @@ def remove_bad_particles(st, min_rad='calc', max_rad='calc', min_edge_dist=2.0,
         check_inds = np.unique(np.append(check_rad_inds, check_edge_inds))
     else:
         check_inds = check_rad_inds
+    if check_overlap:
+        check_inds = np.union1d(check_inds, overlapping_particles(st))
 
     check_inds = check_inds[np.argsort(st.obj_get_radii()[check_inds])]
     tries = np.min([tries, check_inds.size])
@@ -425,6 +515,18 @@ def remove_bad_particles(st, min_rad='calc', max_rad='calc', min_edge_dist=2.0,
     return removed, delete_poses
 
 
+def overlapping_particles(st):
+    """
+    Indices of the smaller particle of each pair of overlapping particles in
+    the state `st`, found with a :class:`peri.priors.overlap.CellList`.
+    """
+    pos, rad = st.obj_get_positions(), st.obj_get_radii()
+    zscale = st.get_values('zscale') if 'zscale' in st.lmap else 1
+    pairs = overlap.CellList(pos, rad, zscale=zscale).overlaps()
+    i, j = pairs[:,0], pairs[:,1]
+    return np.unique(np.where(rad[i] <= rad[j], i, j))
+
+
 def add_subtract(st, max_iter=7, max_npart='calc', max_mem=2e8,
                  always_check_remove=False, **kwargs):
     """
@@ -476,6 +578,9 @@ def add_subtract(st, max_iter=7, max_npart='calc', max_mem=2e8,
     check_outside_im : Bool, optional
         Set to True to check whether to delete particles whose positions are
         outside the un-padded image.
+    check_overlap : Bool, optional
+        Set to True to check whether to delete the smaller of each pair of
+        overlapping particles.
 
     rad : Float, optional
         The initial radius for added particles; added particles radii are
@@ -6,6 +6,7 @@ import time
 import tempfile
 import pickle
 import gc
+import multiprocessing
 
 import numpy as np
 from numpy.random import randint
@@ -61,7 +62,8 @@ rather than for all the pixels (in addition to leastsq solution instead of
 linalg.solve)
 """
 
-def get_rand_Japprox(s, params, num_inds=1000, include_cost=False, **kwargs):
+def get_rand_Japprox(s, params, num_inds=1000, include_cost=False,
+        analytic=False, max_mem=1e9, **kwargs):
     """
     Calculates a random approximation to J by returning J only at a
     set of random pixel/voxel locations.
@@ -78,6 +80,14 @@ def get_rand_Japprox(s, params, num_inds=1000, include_cost=False, **kwargs):
         include_cost : Bool, optional
             Set to True to append a finite-difference measure of the full
             cost gradient onto the returned J.
+        analytic : Bool, optional
+            Set to True to use the analytic derivatives of the components
+            where the state provides them (see
+            :func:`peri.states.ImageState.gradmodel_analytic`), with finite
+            differences only for the remaining parameters. Default is False.
+        max_mem : Numeric, optional
+            The maximum memory for the analytic derivatives passed through
+            the model at once. Default is 1e9.
 
     Other Parameters
     ----------------
@@ -101,8 +111,15 @@ def get_rand_Japprox(s, params, num_inds=1000, include_cost=False, **kwargs):
     else:
         inds = None
         return_inds = slice(0, None)
-        slicer = [slice(0, None)]*len(s.residuals.shape)
-    if include_cost:
+        slicer = tuple([slice(0, None)]*len(s.residuals.shape))
+    if analytic and hasattr(s, 'gradmodel_analytic'):
+        J = s.gradmodel_analytic(params=params, inds=inds, slicer=slicer,
+                flat=False, error=include_cost, max_mem=max_mem, **kwargs)
+        if include_cost:
+            J[0] *= -1
+        else:
+            J *= -1
+    elif include_cost:
         Jact, ge = s.gradmodel_e(params=params, inds=inds, slicer=slicer,flat=False,
                 **kwargs)
         Jact *= -1
@@ -339,7 +356,8 @@ def _check_groups(s, groups):
     else:
         return (np.arange(s.obj_get_radii().size) == np.sort(ans)).all()
 
-def calc_particle_group_region_size(s, region_size=40, max_mem=1e9, **kwargs):
+def calc_particle_group_region_size(s, region_size=40, max_mem=1e9,
+        sparse_J=False, **kwargs):
     """
     Finds the biggest region size for LM particle optimization with a
     given memory constraint.
@@ -352,6 +370,10 @@ def calc_particle_group_region_size(s, region_size=40, max_mem=1e9, **kwargs):
             The initial guess for the region size. Default is 40
         max_mem : Numeric, optional
             The maximum memory for the optimizer to take. Default is 1e9
+        sparse_J : Bool, optional
+            Set to True if J is stored as a :class:`TileJacobian`, in which
+            case the memory is that of the individual particle tiles plus
+            that of JTJ. Default is False
 
     Other Parameters
     ----------------
@@ -368,6 +390,15 @@ def calc_particle_group_region_size(s, region_size=40, max_mem=1e9, **kwargs):
     """
     region_size = np.array(region_size).astype('int')
 
+    particle_jsizes = {}
+    def get_particle_jsize(ind):
+        # the particle tiles do not depend on the region size, so cache them
+        if ind not in particle_jsizes:
+            nms = s.param_particle(ind)
+            tile = s.get_update_io_tiles(nms, s.get_values(nms))[2]
+            particle_jsizes[ind] = tile.shape.prod() * len(nms)
+        return particle_jsizes[ind]
+
     def calc_mem_usage(region_size):
         rs = np.array(region_size)
         particle_groups = separate_particles_into_groups(s, region_size=
@@ -379,6 +410,9 @@ def calc_particle_group_region_size(s, region_size=40, max_mem=1e9, **kwargs):
         biggroups = [particle_groups[i] for i in np.argsort(numpart)[-5:]]
         def get_tile_jsize(group):
             nms = s.param_particle(group)
+            if sparse_J:
+                return (sum([get_particle_jsize(i) for i in group]) +
+                        len(nms)**2)
             tile = s.get_update_io_tiles(nms, s.get_values(nms))[2]
             return tile.shape.prod() * len(nms)
         mems = [8*get_tile_jsize(g) for g in biggroups]  # 8 for bytes/float64
@@ -420,6 +454,116 @@ def get_residuals_update_tile(st, padded_tile):
     inner_tile = st.ishape.intersection([st.ishape, padded_tile])
     return inner_tile.translate(-st.pad)
 
+class TileJacobian(object):
+    """
+    Sparse J for parameters which only affect a small region of the image.
+
+    Rather than a dense [nparams, npix] array, J is stored as one block of
+    values per parameter over the tile of the residuals which that
+    parameter affects. Products with J and JTJ are evaluated from the
+    blocks directly, so the memory scales with the summed volume of the
+    parameter tiles rather than with nparams times the volume of the
+    whole region.
+
+    Parameters
+    ----------
+        tile : :class:`peri.util.Tile`
+            The tile of the residuals spanned by J.
+        tiles : List of :class:`peri.util.Tile`
+            The region affected by each parameter, relative to `tile`.
+        blocks : List of numpy.ndarray
+            The values of J for each parameter, of shape tiles[i].shape.
+
+    Attributes
+    ----------
+        shape : tuple
+            The shape of the equivalent dense J, (nparams, tile.volume)
+        nbytes : Int
+            The memory occupied by the blocks of J.
+    """
+    def __init__(self, tile, tiles, blocks):
+        self.tile = tile
+        self.tiles = tiles
+        self.blocks = blocks
+
+    @property
+    def shape(self):
+        return (len(self.blocks), self.tile.volume)
+
+    @property
+    def nbytes(self):
+        return sum([b.nbytes for b in self.blocks])
+
+    def __getitem__(self, key):
+        """
+        J[rows] for a slice, index array or boolean mask of the parameters
+        is the TileJacobian of those rows; a single row or an index which
+        also selects pixels, J[rows, pixels], is taken from the dense J.
+        """
+        if isinstance(key, tuple):
+            return self.todense()[key]
+        rows = np.arange(len(self.blocks))[key]
+        if np.ndim(rows) == 0:
+            row = np.zeros(self.tile.shape)
+            row[self.tiles[rows].slicer] = self.blocks[rows]
+            return row.ravel()
+        return TileJacobian(self.tile, [self.tiles[i] for i in rows],
+                [self.blocks[i] for i in rows])
+
+    def __setitem__(self, key, values):
+        """
+        J[rows] = values for dense rows over the whole tile. Only the part
+        of each row inside that parameter's tile is kept.
+        """
+        rows = np.atleast_1d(np.arange(len(self.blocks))[key])
+        values = np.reshape(values, (rows.size,) + tuple(self.tile.shape))
+        for i, v in zip(rows, values):
+            self.blocks[i] = v[self.tiles[i].slicer].copy()
+
+    def todense(self):
+        """Returns J as a dense [nparams, npix] numpy.ndarray"""
+        J = np.zeros((len(self.blocks),) + tuple(self.tile.shape))
+        for a, (t, b) in enumerate(zip(self.tiles, self.blocks)):
+            J[a][t.slicer] = b
+        return J.reshape(self.shape)
+
+    def dot(self, vec):
+        """np.dot(J, vec) for a vector `vec` over the residuals"""
+        vec = np.reshape(vec, self.tile.shape)
+        return np.array([(b*vec[t.slicer]).sum() for t, b in
+                zip(self.tiles, self.blocks)])
+
+    def tdot(self, vec):
+        """np.dot(J.T, vec) for a vector `vec` over the parameters"""
+        out = np.zeros(self.tile.shape)
+        for v, t, b in zip(vec, self.tiles, self.blocks):
+            out[t.slicer] += v*b
+        return out.ravel()
+
+    def jtj(self):
+        """np.dot(J, J.T), from the overlapping blocks only"""
+        n = len(self.blocks)
+        l = np.array([t.l for t in self.tiles]).reshape(n, -1)
+        r = np.array([t.r for t in self.tiles]).reshape(n, -1)
+        JTJ = np.zeros([n, n])
+        for i in range(n):
+            overlaps = (np.minimum(r[i], r[i:]) > np.maximum(l[i], l[i:]))
+            for j in np.nonzero(overlaps.all(axis=1))[0] + i:
+                ov = Tile(np.maximum(l[i], l[j]), np.minimum(r[i], r[j]))
+                JTJ[i, j] = JTJ[j, i] = np.sum(
+                        self.blocks[i][ov.translate(-l[i]).slicer] *
+                        self.blocks[j][ov.translate(-l[j]).slicer])
+        return JTJ
+
+    def rank_1_update(self, direction, values):
+        """
+        J += np.outer(direction, values - np.dot(direction, J)), keeping
+        only the part of the update which lies in each parameter's tile.
+        """
+        delta = np.reshape(values - self.tdot(direction), self.tile.shape)
+        for d, t, b in zip(direction, self.tiles, self.blocks):
+            b += d * delta[t.slicer]
+
 #=============================================================================#
 #         ~~~~~        Class/Engine LM minimization Stuff     ~~~~~
 #=============================================================================#
@@ -982,7 +1126,7 @@ class LMEngine(object):
                 CLOG.fatal('Empty subblock in find_LM_updates')
                 raise ValueError('Empty sub-block')
             j = self.J[subblock]
-            JTJ = np.dot(j, j.T)
+            JTJ = j.jtj() if isinstance(j, TileJacobian) else np.dot(j, j.T)
             damped_JTJ = self._calc_damped_jtj(JTJ, subblock=subblock)
             grad = grad[subblock]  #select the subblock of the grad
         else:
@@ -1213,11 +1357,7 @@ class LMEngine(object):
     def update_J(self):
         """Updates J, JTJ, and internal counters."""
         self.calc_J()
-        # np.dot(j, j.T) is slightly faster but 2x as much mem
-        step = np.ceil(1e-2 * self.J.shape[1]).astype('int')  # 1% more mem...
-        self.JTJ = low_mem_sq(self.J, step=step)
-        #copies still, since J is not C -ordered but a slice of j_e...
-        #doing self.J.copy() works but takes 2x as much ram..
+        self.JTJ = self._calc_JTJ()
         self._fresh_JTJ = True
         self._J_update_counter = 0
         if np.any(np.isnan(self.JTJ)):
@@ -1228,7 +1368,19 @@ class LMEngine(object):
     def calc_grad(self):
         """The gradient of the cost w.r.t. the parameters."""
         residuals = self.calc_residuals()
-        return 2*np.dot(self.J, residuals)
+        return 2*self._calc_Jdot(residuals)
+
+    def _calc_JTJ(self):
+        """The approximate Hessian np.dot(J, J.T) from the current J."""
+        # np.dot(j, j.T) is slightly faster but 2x as much mem
+        #copies still, since J is not C -ordered but a slice of j_e...
+        #doing self.J.copy() works but takes 2x as much ram..
+        step = np.ceil(1e-2 * self.J.shape[1]).astype('int')  # 1% more mem...
+        return low_mem_sq(self.J, step=step)
+
+    def _calc_Jdot(self, vec):
+        """np.dot(J, vec) for a vector `vec` over the residuals."""
+        return np.dot(self.J, vec)
 
     def _rank_1_J_update(self, direction, values):
         """
@@ -1254,7 +1406,7 @@ class LMEngine(object):
         direction = delta_vals / nrm
         vals = delta_residuals / nrm
         self._rank_1_J_update(direction, vals)
-        self.JTJ = np.dot(self.J, self.J.T)
+        self.JTJ = self._calc_JTJ()
 
     def check_update_eig_J(self):
         do_update = (self.eig_update & (not self._fresh_JTJ) &
@@ -1279,7 +1431,7 @@ class LMEngine(object):
             grad_stif = (res1-res0)/dl
             self._rank_1_J_update(stif_dir, grad_stif)
 
-        self.JTJ = np.dot(self.J, self.J.T)
+        self.JTJ = self._calc_JTJ()
         #Putting the parameters back:
         _ = self.update_function(self.param_vals)
 
@@ -1308,7 +1460,7 @@ class LMEngine(object):
         rm2 = self.calc_residuals().copy()
         der2 = (rm2 + rm1 - 2*rm0)
 
-        corr, res, rank, s = np.linalg.lstsq(damped_JTJ, np.dot(self.J, der2),
+        corr, res, rank, s = np.linalg.lstsq(damped_JTJ, self._calc_Jdot(der2),
                 rcond=self.min_eigval)
         corr *= -0.5
         return corr
@@ -1330,9 +1482,9 @@ class LMEngine(object):
             blk_J.append((r1-r0)/self.eig_dl)
         self.J[blk] = np.array(blk_J)
         self.update_function(p0)
-        #Then we also need to update JTJ:
-        self.JTJ = np.dot(self.J, self.J.T)
-        if np.any(np.isnan(self.J)) or np.any(np.isnan(self.JTJ)):
+        #Then we also need to update JTJ, which has nans if J does:
+        self.JTJ = self._calc_JTJ()
+        if np.any(np.isnan(self.JTJ)):
             raise FloatingPointError('J, JTJ have nans.')
 
 class LMFunction(LMEngine):
@@ -1603,6 +1755,12 @@ class LMGlobals(LMEngine):
             Dict of ``**kwargs`` for opt implementation. Right now only for
             get_num_px_jtj, i.e. keys of 'decimate', 'min_redundant'.
             Default is `{}`. Stored as self.opt_kwargs
+        analytic_J : Bool, optional
+            Whether to use the analytic derivatives of components which
+            provide them when calculating J, using finite differences only
+            for the other parameters. Default is True. Stored as
+            self.analytic_J. Earlier versions always used finite
+            differences; set it to False to reproduce them.
 
     Attributes
     ----------
@@ -1626,10 +1784,12 @@ class LMGlobals(LMEngine):
         do_levmarq : Convenience function for LMGlobals
         do_levmarq_particles : Convenience function for optimizing particles
     """
-    def __init__(self, state, param_names, max_mem=1e9, opt_kwargs={}, **kwargs):
+    def __init__(self, state, param_names, max_mem=1e9, opt_kwargs={},
+            analytic_J=True, **kwargs):
         self.state = state
         self.opt_kwargs = opt_kwargs
         self.max_mem = max_mem
+        self.analytic_J = analytic_J
         self.num_pix = get_num_px_jtj(state, len(param_names), max_mem=max_mem,
                 **self.opt_kwargs)
         self.param_names = param_names
@@ -1646,7 +1806,8 @@ class LMGlobals(LMEngine):
         # self.J, self._inds = get_rand_Japprox(self.state,
                 # self.param_names, num_inds=self.num_pix)
         je, self._inds = get_rand_Japprox(self.state, self.param_names,
-                num_inds=self.num_pix, include_cost=True)
+                num_inds=self.num_pix, include_cost=True,
+                analytic=self.analytic_J, max_mem=self.max_mem)
         self.J = je[0]
         #Storing the _direction_ of the exact gradient of the model, rescaled
         #as to the size we expect from the inds:
@@ -1674,7 +1835,13 @@ class LMGlobals(LMEngine):
         """
         self.update_function(self.param_vals)
         params = np.array(self.param_names)[blk].tolist()
-        blk_J = -self.state.gradmodel(params=params, inds=self._inds, flat=False)
+        if self.analytic_J and hasattr(self.state, 'gradmodel_analytic'):
+            blk_J = -self.state.gradmodel_analytic(params=params,
+                    inds=self._inds, flat=False, batch=True,
+                    max_mem=self.max_mem)
+        else:
+            blk_J = -self.state.gradmodel(params=params, inds=self._inds,
+                    flat=False, batch=True)
         self.J[blk] = blk_J
         #Then we also need to update JTJ:
         self.JTJ = np.dot(self.J, self.J.T)
@@ -1782,6 +1949,11 @@ class LMParticles(LMEngine):
         include_rad : Bool, optional
             Whether or not to include the particle radii in the
             optimization. Default is True
+        sparse_J : Bool, optional
+            If True, stores J as a :class:`TileJacobian`, keeping for each
+            parameter only the values over the tile that parameter affects
+            instead of over the whole region spanned by the particles.
+            Default is False
 
     Attributes
     ----------
@@ -1818,11 +1990,13 @@ class LMParticles(LMEngine):
     the pad and barely overlapping the image) these numbers might be
     insufficient.
     """
-    def __init__(self, state, particles, include_rad=True, **kwargs):
+    def __init__(self, state, particles, include_rad=True, sparse_J=False,
+            **kwargs):
         self.state = state
         if len(particles) == 0:
             raise ValueError('Empty list of particle indices')
         self.particles = particles
+        self.sparse_J = sparse_J
         self.param_names = (state.param_particle(particles) if include_rad
                 else state.param_particle_pos(particles))
         self._dif_tile = self._get_diftile()
@@ -1857,12 +2031,50 @@ class LMParticles(LMEngine):
         self._dif_tile = self._get_diftile()
         del self.J
         #J = grad(residuals) = -grad(model)
-        if self._dif_tile.volume > 0:
+        if self._dif_tile.volume > 0 and self.sparse_J:
+            self.J = self._calc_tile_J()
+        elif self._dif_tile.volume > 0:
             self.J = -self.state.gradmodel(params=self.param_names, rts=True,
-                slicer=self._dif_tile.slicer)
+                slicer=self._dif_tile.slicer, batch=True)
         else:
             self.J = np.zeros([len(self.param_names), 1])
 
+    def _calc_tile_J(self, dl=2e-5):
+        """Calculates J as a TileJacobian, one block per parameter."""
+        tiles, blocks = [], []
+        for p in self.param_names:
+            val = self.state.get_values(p)
+            itile = self.state.get_update_io_tiles(p, val+dl)[1]
+            if itile is not None:
+                tile = Tile.intersection(self._dif_tile,
+                        get_residuals_update_tile(self.state, itile))
+            if itile is None or (tile.shape <= 0).any():
+                # parameter does not affect the residuals in the region
+                tile = Tile(self._dif_tile.l, self._dif_tile.l)
+                block = np.zeros(tile.shape)
+            else:
+                block = -self.state.gradmodel(params=[p], dl=dl, rts=True,
+                        slicer=tile.slicer)[0].reshape(tile.shape)
+            tiles.append(tile.translate(-self._dif_tile.l))
+            blocks.append(block)
+        return TileJacobian(self._dif_tile, tiles, blocks)
+
+    def _calc_JTJ(self):
+        if isinstance(self.J, TileJacobian):
+            return self.J.jtj()
+        return super(LMParticles, self)._calc_JTJ()
+
+    def _calc_Jdot(self, vec):
+        if isinstance(self.J, TileJacobian):
+            return self.J.dot(vec)
+        return super(LMParticles, self)._calc_Jdot(vec)
+
+    def _rank_1_J_update(self, direction, values):
+        if isinstance(self.J, TileJacobian):
+            self.J.rank_1_update(direction, values)
+        else:
+            super(LMParticles, self)._rank_1_J_update(direction, values)
+
     def calc_residuals(self):
         if self._dif_tile.volume > 0:
             return self.state.residuals[self._dif_tile.slicer].ravel().copy()
@@ -1920,11 +2132,17 @@ class LMParticleGroupCollection(object):
             Set to True to create a series of temp files that save J
             for each group of particles. Needed for do_internal_run().
             Default is False.
+        nproc : Int, optional
+            The number of processes over which to optimize groups of
+            particles which do not interact. Default is 1, i.e. optimize
+            all the groups serially in this process. See Notes.
 
     Other Parameters
     ----------------
         Pass any kwargs that would be passed to LMParticles. Stored in
-        self._kwargs for reference.
+        self._kwargs for reference. With ``sparse_J=True`` the region size
+        is calculated from the memory of the sparse J, allowing much
+        larger groups of particles.
 
     Attributes
     ----------
@@ -1969,15 +2187,31 @@ class LMParticleGroupCollection(object):
     which will raise an error. So use with caution. Deleting any
     references to the temp files by deleting the LMParticleGroupCollection
     instance will close and remove the temporary files.
+
+    When `nproc` > 1, the particle groups are colored so that no two
+    groups of the same color have overlapping padded update tiles. The
+    colors are run one after another; the groups within a color are
+    optimized simultaneously in one pool of forked processes, each of which
+    keeps a copy-on-write copy of the state and applies the updates of the
+    earlier colors to it before optimizing a group. The final parameter
+    values of each group are then applied to the state in the order of the
+    groups. If a group's particles moved so far that its update tile now
+    overlaps that of an earlier group of the same color, its result is
+    discarded and the group is optimized again in this process. Each
+    process may use up to `max_mem` for its J, and forking requires a
+    POSIX system. Saving J is not supported with more than one process.
     """
     def __init__(self, state, region_size=40, do_calc_size=True, max_mem=1e9,
-            get_cos=False, save_J=False, **kwargs):
+            get_cos=False, save_J=False, nproc=1, **kwargs):
         self.state = state
         self._kwargs = kwargs
         self.region_size = region_size
         self.get_cos = get_cos
         self.save_J = save_J
         self.max_mem = max_mem
+        self.nproc = nproc
+        if save_J and nproc > 1:
+            raise ValueError('save_J is not supported with nproc > 1')
 
         self.reset(do_calc_size=do_calc_size)
 
@@ -2005,7 +2239,8 @@ class LMParticleGroupCollection(object):
             self.max_mem = new_max_mem
         if do_calc_size:
             self.region_size = calc_particle_group_region_size(self.state,
-                    region_size=self.region_size, max_mem=self.max_mem)
+                    region_size=self.region_size, max_mem=self.max_mem,
+                    sparse_J=self._kwargs.get('sparse_J', False))
         self.stats = []
         self.particle_groups = separate_particles_into_groups(self.state,
                 self.region_size, doshift='rand')
@@ -2032,18 +2267,26 @@ class LMParticleGroupCollection(object):
 
     def _dump_j_diftile(self, group_index, j, tile):
         j_file, tile_file = self._get_tmpfiles(group_index)
-        np.save(j_file, j)
+        if isinstance(j, TileJacobian):
+            pickle.dump(j, j_file, protocol=2)
+        else:
+            np.save(j_file, j)
         pickle.dump(tile, tile_file, protocol=2)
 
     def _load_j_diftile(self, group_index):
         j_file, tile_file = self._get_tmpfiles(group_index)
-        J = np.load(j_file)
+        if self._kwargs.get('sparse_J', False):
+            J = pickle.load(j_file)
+        else:
+            J = np.load(j_file)
         tile = pickle.load(tile_file)
-        JTJ = np.dot(J, J.T)
+        JTJ = J.jtj() if isinstance(J, TileJacobian) else np.dot(J, J.T)
         return J, JTJ, tile
 
     def _do_run(self, mode='1'):
         """workhorse for the self.do_run_xx methods."""
+        if self.nproc > 1 and mode != 'internal':
+            return self._do_run_parallel(mode=mode)
         for a in range(len(self.particle_groups)):
             group = self.particle_groups[a]
             lp = LMParticles(self.state, group, **self._kwargs)
@@ -2062,6 +2305,97 @@ class LMParticleGroupCollection(object):
                 self._dump_j_diftile(a, lp.J, lp._dif_tile)
                 self._has_saved_J[a] = True
 
+    def _color_groups(self):
+        """
+        Colors the particle groups such that no groups of the same color
+        have overlapping update tiles, returning a list of the group indices
+        of each color.
+        """
+        colors, bounds = [], []
+        for a, group in enumerate(self.particle_groups):
+            nms = self.state.param_particle(group)
+            tile = self.state.get_update_io_tiles(nms,
+                    self.state.get_values(nms))[0]
+            for c, (l, r) in enumerate(bounds):
+                if not (np.minimum(r, tile.r) > np.maximum(l, tile.l)).all(
+                        axis=1).any():
+                    break
+            else:
+                c = len(colors)
+                colors.append([])
+                bounds.append((np.zeros((0, tile.dim)),
+                        np.zeros((0, tile.dim))))
+            colors[c].append(a)
+            l, r = bounds[c]
+            bounds[c] = (np.vstack([l, tile.l]), np.vstack([r, tile.r]))
+        return colors
+
+    def _do_run_parallel(self, mode='1'):
+        """
+        Runs the groups of each color in one pool of self.nproc processes,
+        re-running in this process any group whose update tile came to
+        overlap that of an earlier group of the same color
+        """
+        global _pool_state
+        try:
+            context = multiprocessing.get_context('fork')
+        except AttributeError:
+            # python 2 always forks
+            context = multiprocessing
+
+        colors = self._color_groups()
+        stats = [None] * len(self.particle_groups)
+        # the updates made to the state since the pool was forked, which the
+        # workers apply to their own copies before optimizing a group, and
+        # how many of them each worker (by pid) is known to have applied
+        updates = []
+        applied = {}
+
+        # the state is inherited by the forked processes, not pickled
+        _pool_state = self.state
+        nworkers = min(self.nproc, max([len(c) for c in colors]))
+        pool = context.Pool(nworkers,
+                initializer=_init_particle_group_worker,
+                initargs=(self.nproc,))
+        try:
+            for color in colors:
+                # each task only carries the updates which the worker
+                # furthest behind has not yet applied
+                start = min(applied.values()) if len(applied) == nworkers else 0
+                args = [(self.particle_groups[a], mode, self.get_cos,
+                        self._kwargs, start, updates[start:]) for a in color]
+                results = pool.map(_run_particle_group, args, chunksize=1)
+                for pid, count, _ in results:
+                    applied[pid] = count
+                results = [res for _, _, res in results]
+
+                # the groups were optimized without seeing each other, which
+                # only holds if they did not move into each other's tiles
+                rerun = []
+                l = np.zeros((0, self.state.dim))
+                r = np.zeros((0, self.state.dim))
+                for a, (names, values, stat) in zip(color, results):
+                    tile = self.state.get_update_io_tiles(names, values)[0]
+                    if (np.minimum(r, tile.r) > np.maximum(l, tile.l)).all(
+                            axis=1).any():
+                        rerun.append(a)
+                        continue
+                    l, r = np.vstack([l, tile.l]), np.vstack([r, tile.r])
+                    self.state.update(names, values)
+                    updates.append((names, values))
+                    stats[a] = stat
+
+                for a in rerun:
+                    CLOG.debug('Re-running particle group %d serially' % a)
+                    names, values, stats[a] = _optimize_particle_group(
+                            self.state, self.particle_groups[a], mode,
+                            self.get_cos, self._kwargs)
+                    updates.append((names, values))
+        finally:
+            pool.terminate()
+            _pool_state = None
+        self.stats.extend(stats)
+
     def do_run_1(self):
         """Calls LMParticles.do_run_1 for each group of particles."""
         self._do_run(mode='1')
@@ -2078,6 +2412,51 @@ class LMParticleGroupCollection(object):
             raise RuntimeError('J, JTJ have not been pre-computed. Call do_run_1 or do_run_2')
         self._do_run(mode='internal')
 
+# the state optimized by the processes of LMParticleGroupCollection, which is
+# set before forking so that it is shared rather than pickled, and the number
+# of the collection's updates which a process has applied to its copy
+_pool_state = None
+_pool_applied = 0
+
+def _init_particle_group_worker(nproc):
+    """Splits the fft threads between the processes of the pool."""
+    global _pool_applied
+    _pool_applied = 0
+    from peri.fft import fftkwargs
+    for key in ['threads', 'workers']:
+        if key in fftkwargs:
+            fftkwargs[key] = max(fftkwargs[key] // nproc, 1)
+
+def _optimize_particle_group(state, group, mode, get_cos, kwargs):
+    """
+    Optimizes one group of particles of `state`, returning the parameter
+    names, their final values and the stats.
+    """
+    lp = LMParticles(state, group, **kwargs)
+    if mode == '1':
+        lp.do_run_1()
+    if mode == '2':
+        lp.do_run_2()
+    values = np.ravel(state.get_values(lp.param_names))
+    return lp.param_names, values, lp.get_termination_stats(get_cos=get_cos)
+
+def _run_particle_group(args):
+    """
+    Optimizes one group of particles of `_pool_state` in a worker process,
+    after bringing the process's copy of the state up to date with the
+    `updates` made by the collection from index `start` on. Returns the pid
+    and the number of updates applied along with the result.
+    """
+    global _pool_applied
+    group, mode, get_cos, kwargs, start, updates = args
+    if _pool_applied < start:
+        raise RuntimeError('Worker is missing updates of the collection')
+    for names, values in updates[_pool_applied - start:]:
+        _pool_state.update(names, values)
+    _pool_applied = start + len(updates)
+    result = _optimize_particle_group(_pool_state, group, mode, get_cos, kwargs)
+    return os.getpid(), _pool_applied, result
+
 class AugmentedState(object):
     """
     Augments a state with a set of radii(z) parameters.
@@ -2211,6 +2590,11 @@ class LMAugmentedState(LMGlobals):
             Dict of ``**kwargs`` for opt implementation. Right now only for
             get_num_px_jtj, i.e. keys of 'decimate', min_redundant'.
             Default is `{}`. Stored as self.opt_kwargs.
+        analytic_J : Bool, optional
+            Whether to use the analytic derivatives of components which
+            provide them for the state's part of J. Default is True. Stored
+            as self.analytic_J. Earlier versions always used finite
+            differences; set it to False to reproduce them.
 
     Attributes
     ----------
@@ -2235,11 +2619,13 @@ class LMAugmentedState(LMGlobals):
         do_levmarq : Convenience function for LMGlobals
         do_levmarq_particles : Convenience function for optimizing particles
     """
-    def __init__(self, aug_state, max_mem=1e9, opt_kwargs={}, **kwargs):
+    def __init__(self, aug_state, max_mem=1e9, opt_kwargs={}, analytic_J=True,
+            **kwargs):
         self.aug_state = aug_state
         self.state = aug_state.state
         self.opt_kwargs = opt_kwargs
         self.max_mem = max_mem
+        self.analytic_J = analytic_J
         self.num_pix = get_num_px_jtj(aug_state.state, aug_state.param_vals.size,
                 max_mem=max_mem, **self.opt_kwargs)
         # super(LMAugmentedState, self).__init__(**kwargs)
@@ -2267,7 +2653,8 @@ class LMAugmentedState(LMGlobals):
                 list(self.opt_kwargs.values()) + [[self.J, graderr]])}
         params = sa.param_names
         _, self._inds = get_rand_Japprox(s, params, num_inds=self.num_pix,
-                include_cost=True, **kw)  # storing via out kwarg
+                include_cost=True, analytic=self.analytic_J,
+                max_mem=self.max_mem, **kw)  # storing via out kwarg
 
         #2. J for the augmented portion:
         old_aug_vals = sa.param_vals[sa.rscale_mask].copy()
@@ -2436,7 +2823,7 @@ def do_levmarq_n_directions(s, directions, max_iter=2, run_length=2,
 
 def burn(s, n_loop=6, collect_stats=False, desc='', rz_order=0, fractol=1e-4,
         errtol=1e-2, mode='burn', max_mem=1e9, include_rad=True,
-        do_line_min='default', partial_log=False, dowarn=True):
+        do_line_min='default', partial_log=False, dowarn=True, nproc=1):
     """
     Optimizes all the parameters of a state.
 
@@ -2488,6 +2875,9 @@ def burn(s, n_loop=6, collect_stats=False, desc='', rz_order=0, fractol=1e-4,
         dowarn : Bool, optional
             Whether to log a warning if termination results from finishing
             loops rather than from convergence. Default is True.
+        nproc : Int, optional
+            The number of processes to optimize the groups of particles
+            with; see LMParticleGroupCollection. Default is 1.
 
     Returns
     -------
@@ -2601,7 +2991,8 @@ def burn(s, n_loop=6, collect_stats=False, desc='', rz_order=0, fractol=1e-4,
         pstats = do_levmarq_all_particle_groups(s, region_size=40, max_iter=1,
                 do_calc_size=True, run_length=4, eig_update=False,
                 damping=prtl_dmp, fractol=0.1*fractol, collect_stats=
-                collect_stats, max_mem=max_mem, include_rad=include_rad)
+                collect_stats, max_mem=max_mem, include_rad=include_rad,
+                nproc=nproc)
         all_lp_stats.append(pstats)
         if desc is not None:
             states.save(s, desc=desc)
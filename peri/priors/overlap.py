@@ -6,6 +6,14 @@ import scipy as sp
 
 from peri.logger import log
 
+# log prior of a configuration with overlapping hard spheres
+ZEROLOGPRIOR = -1e100
+
+# fraction of the particles which may be moved since the last rebuild of a
+# CellList before it is rebuilt; moved particles are searched by brute force
+CELL_REBUILD_FRAC = 0.05
+CELL_REBUILD_MIN = 64
+
 class HardSphereOverlapNaive(object):
     def __init__(self, pos, rad, zscale=1, prior_type='absolute'):
         self.N = rad.shape[0]
@@ -53,158 +61,246 @@ class HardSphereOverlapNaive(object):
         return self.logpriors.sum()
 
 
-class HardSphereOverlapCell(object):
-    def __init__(self, pos, rad, typ, bounds=None, cutoff=None, zscale=1, maxn=30,
-            prior_type='absolute'):
+class CellList(object):
+    def __init__(self, pos, rad, cutoff=None, bounds=None, periodic=False,
+            zscale=1, active=None):
+        """
+        A neighbor index of spheres binned into cells at least `cutoff` wide,
+        used to find overlapping spheres without comparing every pair. The
+        cells are stored as one array of particle indices sorted by cell, so
+        they hold any number of particles.
+
+        Moved particles are taken out of their cells and searched by brute
+        force until more than ``CELL_REBUILD_FRAC`` of the particles have
+        moved, when the cells are rebuilt in one vectorized pass.
+
+        Parameters
+        ----------
+        pos : ndarray [N,3]
+            Positions of the spheres
+        rad : ndarray [N]
+            Radii of the spheres
+        cutoff : float, optional
+            The cell size, at least the largest sum of two radii. Default is
+            2.1 times the largest radius.
+        bounds : tuple of ndarrays, optional
+            The (lower, upper) corners of the box. Particles outside a bounded
+            box are kept in the edge cells. Default is the extent of `pos`,
+            mildly inflated.
+        periodic : Bool, optional
+            Whether the box is periodic, with distances measured to the
+            nearest image. Requires `bounds`. Default is False.
+        zscale : float, optional
+            Scale of the z distances relative to x and y. Default is 1.
+        active : ndarray [N] of bools, optional
+            Which particles are present. Default is all.
+        """
+        self.pos = np.array(pos, dtype='float').reshape(-1, 3)
+        self.rad = np.array(rad, dtype='float').reshape(-1)
+        self.N = self.rad.shape[0]
+        if active is None:
+            active = np.ones(self.N, dtype='bool')
+        self.active = np.array(active, dtype='bool')
+        self.zscale = np.array([zscale, 1, 1])
+        self.periodic = periodic
 
-        # the mild inflation is to deal with numerical issues
-        # at the absolute boundaries
         if bounds is None:
+            if periodic:
+                raise ValueError('a periodic CellList requires bounds')
+            # the mild inflation is to deal with numerical issues at the
+            # absolute boundaries
             bounds = (
-                pos.min(axis=0)-0.1*np.abs(pos.min(axis=0)),
-                pos.max(axis=0)+0.1*np.abs(pos.max(axis=0))
-            )
-        if cutoff is None:
-            cutoff = 2.1 * rad.max()
-
-        # setup the big box that the particles live in
+                self.pos.min(axis=0)-0.1*np.abs(self.pos.min(axis=0)),
+                self.pos.max(axis=0)+0.1*np.abs(self.pos.max(axis=0))
+            ) if self.N > 0 else (np.zeros(3), np.ones(3))
         self.bounds = bounds
-        self.bl, self.br = np.array(bounds[0]), np.array(bounds[1])
+        self.bl, self.br = np.array(bounds[0], dtype='float'), np.array(bounds[1], dtype='float')
         self.bdiff = self.br - self.bl
 
-        self.N = rad.shape[0]
+        self.setup_cells(cutoff)
+
+    def setup_cells(self, cutoff=None):
+        """ Choose cells of size `cutoff` (see __init__) and rebuild """
+        length = self.zscale * self.bdiff
+        if cutoff is None:
+            rmax = self.rad[self.active].max() if self.active.any() else 0
+            cutoff = 2.1*rmax if rmax > 0 else length.max()
         self.cutoff = cutoff
-        self.pos = pos.copy()
-        self.rad = rad.copy()
-        self.typ = typ.copy()
-        self.maxn = maxn
-        self.zscale = np.array([zscale, 1, 1])
-        self.logpriors = np.zeros_like(rad)
-        self.inds = [[] for i in range(self.N)]
-        self.neighs = [{} for i in range(self.N)]
 
-        if prior_type == 'absolute':
-            self.prior_func = lambda x: (x < 0)*ZEROLOGPRIOR
-        self._initialize()
-
-    def _initialize(self):
-        self.size = (self.bdiff / self.cutoff).astype('int')
-        self.size += 1
-
-        self.cells = np.zeros(tuple(self.size) + (self.maxn,), dtype='int') - 1
-        self.counts = np.zeros(self.size, dtype='int')
-
-        for i in range(self.N):
-            if self.typ[i] == 1:
-                self._bin_particle(i)
-
-    def _pos_to_inds(self, pos):
-        ind = (self.size * (pos - self.bl) / self.bdiff).astype('int')
-        return [[np.s_[ind[0], ind[1], ind[2]], ind]]
-
-    def _unbin_particle(self, index):
-        inds = self.inds[index]
-
-        for n in self.neighs[index].keys():
-            dlogprior = self.neighs[n].pop(index)
-            self.logpriors[n] -= dlogprior
-
-        for ind,_ in inds:
-            cell = self.cells[ind]
-            p = np.where(cell == index)[0]
-            cell[p] = cell[self.counts[ind]-1]
-            cell[self.counts[ind]-1] = -1
-            self.cells[ind] = cell
-            self.counts[ind] -= 1
-
-        self.inds[index] = []
-        self.neighs[index] = {}
-
-    def _bin_particle(self, index):
-        inds = self._pos_to_inds(self.pos[index])
-
-        for ind,q in inds:
-            try:
-                self.cells[ind][self.counts[ind]] = index
-            except IndexError as e:
-                self.inds[index] = []
-                self.neighs[index] = {}
-                self.logpriors[index] = ZEROLOGPRIOR
-                return
-
-            self.counts[ind] += 1
-
-        self.inds[index] = inds
-
-        neighs = self._neighbors(index).astype('int')
-        for n in neighs:
-            co = self._logprior(index, n)
-            self.neighs[index][n] = co
-            self.neighs[n][index] = co
-
-            self.logpriors[n] += co
-
-        self.logpriors[index] = np.sum(self.neighs[index].values())
-
-    def _logprior(self, i, j):
-        dd = self._dist_diff(self.pos[i], self.pos[j],
-                np.array(self.rad[i]+self.rad[j]), self.zscale)
-        return self.prior_func(dd)
-
-    def _dist_diff(self, p0, p1, r1r2, zs):
-        a = zs*(p0-p1)
-        dist = np.dot(a, a)
-        dist0 = r1r2*r1r2
-        return dist - dist0
-
-    def _dist_diff2(self, p0, p1, r1r2, zs):
-        from scipy import weave
-        code = """
-            double dist = 0.0;
-            for (int i=0; i<3; i++){
-                double d = zs[i]*(p0[i] - p1[i]);
-                dist += d*d;
-            }
-            o[0] = dist - r1r2[0]*r1r2[0];
+        self.size = np.clip((length / cutoff).astype('int'), 1, None)
+        self.width = length / self.size
+        self.rebuild()
+
+    def rebuild(self):
+        """ Re-bin all the active particles into their cells """
+        inds = np.nonzero(self.active)[0]
+        keys = self._keys(self.pos[inds])
+        order = np.argsort(keys, kind='mergesort')
+        self._cellkeys = keys[order]
+        self._cellinds = inds[order]
+        self._moved = np.zeros(self.N, dtype='bool')
+        self._extra = np.zeros(0, dtype='int')
+
+    def _cells(self, pos):
+        cells = np.floor(self.zscale*(pos - self.bl) / self.width).astype('int')
+        if self.periodic:
+            return cells % self.size
+        return np.clip(cells, 0, self.size-1)
+
+    def _keys(self, pos):
+        return np.ravel_multi_index(self._cells(pos).T, self.size)
+
+    def update(self, inds, pos=None, rad=None, active=None):
+        """
+        Move the particles `inds` to positions `pos` with radii `rad`, and
+        whether they are `active`, all at once. Arguments which are None are
+        left unchanged.
+        """
+        inds = np.atleast_1d(np.asarray(inds, dtype='int'))
+        if pos is not None:
+            self.pos[inds] = np.reshape(pos, (-1, 3))
+        if rad is not None:
+            self.rad[inds] = rad
+        if active is not None:
+            self.active[inds] = active
+
+        if (self.rad[inds][self.active[inds]] > self.cutoff/2).any():
+            return self.setup_cells()
+
+        self._moved[inds] = True
+        self._extra = np.union1d(self._extra, inds)
+        if self._extra.size > max(CELL_REBUILD_FRAC*self.N, CELL_REBUILD_MIN):
+            self.rebuild()
+
+    def candidates(self, inds):
+        """
+        Pairs of particles (i, j), with i in `inds`, which share a cell or
+        are in neighboring cells, including every pair closer than the cell
+        size. Pairs may be repeated.
+        """
+        inds = np.unique(np.atleast_1d(np.asarray(inds, dtype='int')))
+        inds = inds[self.active[inds]]
+
+        offsets = np.array(list(itertools.product([-1, 0, 1], repeat=3)))
+        cells = self._cells(self.pos[inds])[:, None, :] + offsets[None]
+        if self.periodic:
+            valid = np.ones(cells.shape[:2], dtype='bool')
+            cells = cells % self.size
+        else:
+            valid = ((cells >= 0) & (cells < self.size)).all(axis=-1)
+        owner = np.repeat(inds, offsets.shape[0]).reshape(valid.shape)[valid]
+        keys = np.ravel_multi_index(cells[valid].T, self.size)
+
+        # expand the ranges of each neighboring cell in the sorted index
+        lo = np.searchsorted(self._cellkeys, keys, side='left')
+        hi = np.searchsorted(self._cellkeys, keys, side='right')
+        count = hi - lo
+        start = np.repeat(lo - np.cumsum(count) + count, count)
+        i = np.repeat(owner, count)
+        j = self._cellinds[start + np.arange(count.sum())]
+        keep = ~self._moved[j]
+
+        # the moved particles are no longer in the cells; check them all
+        extra = self._extra[self.active[self._extra]]
+        i = np.hstack([i[keep], np.repeat(inds, extra.size)])
+        j = np.hstack([j[keep], np.tile(extra, inds.size)])
+        return i[i != j], j[i != j]
+
+    def distance(self, i, j):
+        """ Distances between particles `i` and `j`, scaled in z """
+        delta = self.pos[i] - self.pos[j]
+        if self.periodic:
+            delta -= self.bdiff * np.round(delta / self.bdiff)
+        return np.sqrt(((self.zscale*delta)**2).sum(axis=-1))
+
+    def overlaps(self, inds=None, pad=0.0):
+        """
+        Pairs of active particles which overlap, i.e. whose distance is less
+        than the sum of their radii plus `pad`.
+
+        Parameters
+        ----------
+        inds : list of ints, optional
+            Only return the overlaps involving these particles. Default is
+            all particles.
+        pad : float, optional
+            Extra distance by which particles are counted as overlapping.
+            Default is 0.
+
+        Returns
+        -------
+        pairs : ndarray [M,2]
+            Index pairs (i, j) with i < j, sorted by i then j.
         """
-        o = np.zeros(1)
-        weave.inline(code, ["p0", "p1", "r1r2", "zs", "o"])
-        return o[0]
+        if inds is None:
+            inds = np.nonzero(self.active)[0]
+        if self.active.any() and 2*self.rad[self.active].max() + pad > self.cutoff:
+            self.setup_cells(2.1*self.rad[self.active].max() + pad)
 
-    def _gentiles(self, loc):
-        return itertools.product(
-                range(max(loc[0]-1,0), min(loc[0]+2, self.size[0])),
-                range(max(loc[1]-1,0), min(loc[1]+2, self.size[1])),
-                range(max(loc[2]-1,0), min(loc[2]+2, self.size[2]))
-            )
+        i, j = self.candidates(inds)
+        a, b = np.minimum(i, j), np.maximum(i, j)
+        pairs = np.unique(a*self.N + b)
+        a, b = pairs // max(self.N, 1), pairs % max(self.N, 1)
 
-    def _neighbors(self, i):
-        locs = self.inds[i]
+        touch = self.distance(a, b) < self.rad[a] + self.rad[b] + pad
+        return np.array([a[touch], b[touch]], dtype='int').T.reshape(-1, 2)
+
+
+class HardSphereOverlapCell(object):
+    def __init__(self, pos, rad, typ=None, bounds=None, cutoff=None, zscale=1,
+            maxn=None, prior_type='absolute', periodic=False):
+        """
+        Hard sphere overlap prior with a :class:`CellList` neighbor index.
+        Each particle's logprior is ``ZEROLOGPRIOR`` times the number of
+        particles it overlaps.
+
+        Parameters
+        ----------
+        pos, rad : ndarray
+            Positions [N,3] and radii [N] of the particles
+        typ : ndarray [N], optional
+            Particle types; only particles of type 1 are present. Default
+            is all 1.
+        bounds, cutoff, zscale, periodic :
+            The box and cells, see :class:`CellList`
+        maxn : ignored
+            Kept for compatibility; the cells no longer have a fixed depth.
+        prior_type : {'absolute'}
+            The form of the prior.
+        """
+        if prior_type != 'absolute':
+            raise ValueError('prior_type must be absolute')
+        self.N = rad.shape[0]
+        self.typ = np.ones(self.N, dtype='int') if typ is None else np.array(typ)
+        self.index = CellList(pos, rad, cutoff=cutoff, bounds=bounds,
+                periodic=periodic, zscale=zscale, active=self.typ == 1)
+        self.bounds = self.index.bounds
+        self.cutoff = self.index.cutoff
+        self.zscale = self.index.zscale
 
-        neighs = []
-        for _,loc in locs:
-            tiles = self._gentiles(loc)
+        self.counts = np.zeros(self.N, dtype='int')
+        np.add.at(self.counts, self.index.overlaps().ravel(), 1)
+        self.logpriors = ZEROLOGPRIOR * self.counts
 
-            for tile in tiles:
-                cell = self.cells[tile]
-                count = self.counts[tile]
-                neighs.extend(cell[:count])
+    @property
+    def pos(self):
+        return self.index.pos
 
-        neighs = np.unique(np.array(neighs))
-        neighs = np.delete(neighs, np.where((neighs == i) | (neighs == -1)))
-        return neighs
+    @property
+    def rad(self):
+        return self.index.rad
 
-    def update(self, index, pos, rad, typ):
-        for i,p,r,t in zip(index, pos, rad, typ):
-            if self.typ[i] == 1:
-                self._unbin_particle(i)
+    def update(self, index, pos, rad, typ=None):
+        """ Move the particles `index` all at once, see CellList.update """
+        index = np.atleast_1d(index)
+        np.subtract.at(self.counts, self.index.overlaps(index).ravel(), 1)
 
-            self.pos[i] = p
-            self.rad[i] = r
-            self.typ[i] = t
+        if typ is not None:
+            self.typ[index] = typ
+        self.index.update(index, pos, rad, self.typ[index] == 1)
 
-            if self.typ[i] == 1:
-                self._bin_particle(i)
+        np.add.at(self.counts, self.index.overlaps(index).ravel(), 1)
+        self.logpriors = ZEROLOGPRIOR * self.counts
 
     def logprior(self):
         return self.logpriors.sum()
@@ -216,16 +312,16 @@ def test():
         x = np.random.rand(N, 3)
         r = 0.05*np.random.rand(N)
 
-        a = HardSphereOverlapNaive(x, r)
+        a = HardSphereOverlapNaive(x.copy(), r.copy())
         b = HardSphereOverlapCell(x, r)
 
         assert((a.logpriors == b.logpriors).all())
 
         for j in range(100):
             l = np.random.randint(N, size=1)
-            pp = x[l]#np.random.rand(3)
+            pp = np.random.rand(1, 3)
             rp = 0.05*np.random.rand(1)
-            a.update(l, pp, rp)
+            a.update(l, pp, rp, None)
             b.update(l, pp, rp)
 
             if not (a.logpriors == b.logpriors).all():
@@ -2,7 +2,6 @@ from builtins import range, str, object
 
 import os
 import re
-import copy
 import json
 import numpy as np
 import pickle
@@ -11,9 +10,16 @@ from functools import partial
 from contextlib import contextmanager
 
 from peri import util, comp, models
+from peri.comp import exactpsf
 from peri.logger import log as baselog
 log = baselog.getChild('states')
 
+# number of float64 fields the size of the gradient tile which are held for
+# each parameter whose analytic model derivative is passed through the model
+# (and its psf) in gradmodel_analytic: the component derivative, its stacked
+# copy and transform, and the model derivative
+ANALYTIC_GRAD_FIELDS = 4
+
 class UpdateError(Exception):
     pass
 
@@ -73,6 +79,16 @@ out : ndarray or None, optional
     check for shape internally; will just raise an error. Default is None,
     i.e. initialize the output internally.
 
+batch : boolean, optional
+    If True, parameters whose update regions do not overlap are perturbed
+    together and each gradient is taken from its own region, so that the
+    function is evaluated once per group of parameters rather than once per
+    parameter and the parameters of a group which share a component are
+    updated in one pass of that component. Only used by states which know
+    their update regions (see :class:`~peri.states.ImageState`) and for
+    functions which return a sampled field; otherwise ignored. Default is
+    False
+
 **kwargs :
     Arguments to `func`
 """
@@ -311,7 +327,7 @@ class State(comp.ParameterGroup):
         return (f11 - f10 - f01 + f00) / (dl**2)
 
     def _grad(self, funct, params=None, dl=2e-5, rts=False, nout=1, out=None,
-            **kwargs):
+            batch=False, **kwargs):
         """
         Gradient of `func` wrt a set of parameters params. (see _graddoc)
         """
@@ -545,6 +561,7 @@ class ImageState(State, comp.ComponentCollection):
         self.priors = priors
         self.pad = util.aN(pad, dim=self.dim)
         self.model_as_data = model_as_data
+        self._journal = None
 
         comp.ComponentCollection.__init__(self, comps=comps)
 
@@ -596,6 +613,21 @@ class ImageState(State, comp.ComponentCollection):
     def set_tile_full(self):
         self.set_tile(self.oshape)
 
+    def share_memory(self):
+        """
+        Move the data, model, residuals and the particle fields of the
+        objects into shared memory, so that processes forked from this one
+        can update spatially disjoint regions of the same state concurrently
+        (see :class:`peri.mc.engines.CheckerboardEngine`).
+        """
+        for name in ['_data', '_model', '_residuals']:
+            setattr(self, name, util.shared_array(getattr(self, name)))
+
+        obj = self.get('obj')
+        for c in getattr(obj, 'comps', [obj]):
+            if isinstance(getattr(c, 'particles', None), np.ndarray):
+                c.particles = util.shared_array(c.particles)
+
     def model_to_data(self, sigma=0.0):
         """ Switch out the data for the model's recreation of the data. """
         im = self.model.copy()
@@ -685,40 +717,320 @@ class ImageState(State, comp.ComponentCollection):
         # have all components update their tiles
         self.set_tile(otile)
 
-        oldmodel = self._model[itile.slicer].copy()
-
         # here we diverge depending if there is only one component update
         # (so that we may calculate a variation / difference image) or if many
         # parameters are being update (should just update the whole model).
+        # in both cases only the difference image is needed to update the
+        # model, residuals and loglikelihood in place
         if len(comps) == 1 and self.mdl.get_difference_model(comps[0].category):
             comp = comps[0]
-            model0 = copy.deepcopy(comp.get())
+            model0 = comp.get()
+            if isinstance(model0, np.ndarray):
+                model0 = self._get_buffer(model0.shape, fill=model0)
+
             super(ImageState, self).update(params, values)
-            model1 = copy.deepcopy(comp.get())
+            model1 = comp.get()
+
+            if isinstance(model0, np.ndarray):
+                diff = np.subtract(model1, model0, out=model0)
+            else:
+                diff = model1 - model0
 
-            diff = model1 - model0
             diff = self.mdl.evaluate(
                 self.comps, 'get', diffmap={comp.category: diff}
             )
 
-            if isinstance(model0, (float, int)):
-                self._model[itile.slicer] += diff
-            else:
-                self._model[itile.slicer] += diff[iotile.slicer]
+            if np.ndim(diff) > 0:
+                diff = diff[iotile.slicer]
         else:
             super(ImageState, self).update(params, values)
 
             # allow the model to be evaluated using our components
-            diff = self.mdl.evaluate(self.comps, 'get')
-            self._model[itile.slicer] = diff[iotile.slicer]
-
-        newmodel = self._model[itile.slicer].copy()
+            newmodel = self.mdl.evaluate(self.comps, 'get')[iotile.slicer]
+            diff = self._get_buffer(newmodel.shape)
+            np.subtract(newmodel, self._model[itile.slicer], out=diff)
 
         # use the model image update to modify other class variables which
         # are hard to compute globally for small local updates
-        self.update_from_model_change(oldmodel, newmodel, itile)
+        self.update_from_model_diff(diff, itile)
         return True
 
+    def _get_buffer(self, shape, fill=None):
+        """
+        A float64 scratch array of `shape`, reused between updates so that
+        the difference images do not need to be allocated every time. If
+        given, `fill` is copied into the buffer.
+        """
+        size = int(np.prod(shape))
+        if getattr(self, '_buffer', None) is None or self._buffer.size < size:
+            self._buffer = np.empty(size, dtype=np.float64)
+
+        buf = self._buffer[:size].reshape(shape)
+        if fill is not None:
+            np.copyto(buf, fill)
+        return buf
+
+    def _grad(self, funct, params=None, dl=2e-5, rts=False, nout=1, out=None,
+            batch=False, **kwargs):
+        """
+        Gradient of `func` wrt a set of parameters params. (see _graddoc)
+        """
+        if not batch or nout != 1:
+            return super(ImageState, self)._grad(funct, params=params, dl=dl,
+                    rts=rts, nout=nout, out=out, **kwargs)
+
+        if params is None:
+            params = self.param_all()
+        ps = util.listify(params)
+        f0 = funct(**kwargs)
+
+        # the owner of each sampled pixel is written into a label field which
+        # is sampled exactly as `funct` samples the model
+        labels = -np.ones(self.model.shape, dtype='int32')
+        if not (isinstance(f0, np.ndarray) and
+                sample(labels, **kwargs).size == f0.size):
+            return super(ImageState, self)._grad(funct, params=params, dl=dl,
+                    rts=rts, nout=nout, out=out, **kwargs)
+
+        grad = np.zeros((len(ps),) + f0.shape) if out is None else out
+        inds = {p: i for i, p in enumerate(ps)}
+
+        for group, tiles in self._grad_param_groups(ps, dl=dl):
+            if f0 is None:
+                f0 = funct(**kwargs)
+            vals = np.array(util.listify(self.get_values(group)))
+            self._update_disjoint(group, vals+dl, tiles)
+            f1 = funct(**kwargs)
+            if rts:
+                self._update_disjoint(group, vals, tiles)
+            diff = ((f1 - f0) / dl).ravel()
+            # the function at the start of the next group, if it is known
+            f0 = None if rts else f1
+
+            # the part of each update region inside the image
+            regions = []
+            for k, tile in enumerate(tiles):
+                if tile is None:
+                    continue
+                region = util.Tile.intersection(tile[1], self.ishape)
+                if (region.shape > 0).all():
+                    region = region.translate(-self.pad)
+                    labels[region.slicer] = k
+                    regions.append(region)
+            owner = sample(labels, **kwargs).ravel()
+
+            # the sampled pixels owned by each parameter, in order
+            owned = np.flatnonzero(owner >= 0)
+            owned = owned[np.argsort(owner[owned], kind='mergesort')]
+            counts = np.bincount(owner[owned], minlength=len(group))
+            splits = np.split(owned, np.cumsum(counts)[:-1])
+            for p, pix in zip(group, splits):
+                row = grad[inds[p]]
+                if out is not None:
+                    row[...] = 0
+                row.flat[pix] = diff[pix]
+
+            for region in regions:
+                labels[region.slicer] = -1
+        return grad
+
+    def model_gradient(self, param):
+        """
+        The analytic derivative of the model (over the inner region) with
+        respect to `param`, see
+        :func:`~peri.states.ImageState.model_gradients`. Returns None if the
+        parameter's component has no analytic derivative.
+        """
+        return self.model_gradients([param])[0]
+
+    def model_gradients(self, params):
+        """
+        The analytic derivatives of the model (over the inner region) with
+        respect to each of `params`. The derivative of a component's field
+        (see :func:`~peri.comp.comp.Component.gradient`) is passed through
+        the model's difference equation, which is linear in the varied field.
+        The derivatives of each component are stacked and passed through
+        together, over the inner region padded by the psf support only.
+
+        Returns a list with the derivative of each parameter, or None for the
+        parameters whose component has no analytic derivative.
+        """
+        out = [None]*len(params)
+        groups = {}
+        for i, p in enumerate(params):
+            comps = self.affected_components(p)
+            if len(comps) == 1 and self.mdl.get_difference_model(
+                    comps[0].category):
+                groups.setdefault(comps[0], []).append(i)
+        if len(groups) == 0:
+            return out
+
+        tile = self._gradient_tile()
+        inner = self.ishape.translate(-tile.l).slicer
+        self.set_tile(tile)
+
+        for comp, inds in groups.items():
+            fields = []
+            for i in inds:
+                dfield = comp.gradient(params[i])
+                if dfield is not None:
+                    fields.append((i, np.broadcast_to(dfield, tile.shape)))
+            if len(fields) == 0:
+                continue
+
+            stack = np.array([f for _, f in fields])
+            dmodel = self.mdl.evaluate_batch(self.comps, comp.category, stack)
+            dmodel = np.broadcast_to(dmodel, stack.shape)
+            for k, (i, _) in enumerate(fields):
+                out[i] = dmodel[k][inner]
+        return out
+
+    def _gradient_tile(self):
+        """
+        The tile of the padded image which determines the model over the
+        inner region, the inner region padded by the psf support on each
+        side. If that does not fit in the image the whole image is used.
+        """
+        psf = self.get_padding_size(self.ishape)
+        if psf is None:
+            return self.ishape.copy()
+
+        tile = self.ishape.pad(psf.shape)
+        if (tile.l < self.oshape.l).any() or (tile.r > self.oshape.r).any():
+            return self.oshape.copy()
+        return tile
+
+    def gradmodel_analytic(self, params=None, dl=2e-5, rts=False, error=False,
+            out=None, inds=None, slicer=None, flat=True, batch=False,
+            max_mem=1e9):
+        """
+        Gradient of the sampled model wrt `params` as in `gradmodel`, using
+        :func:`~peri.states.ImageState.model_gradient` for every parameter
+        which has one and finite differences of size `dl` for the rest. If
+        `error` is True, the gradient of the error is returned as well, as
+        in `gradmodel_e`. The other arguments are those of `gradmodel`;
+        `batch` only applies to the finite differences without `error`. The
+        analytic derivatives of as many parameters are found at once as fit
+        in `max_mem` bytes, but at least one.
+        """
+        if params is None:
+            params = self.param_all()
+
+        ps = util.listify(params)
+        kwargs = {'inds': inds, 'slicer': slicer, 'flat': flat}
+        f0 = sample(self.model, **kwargs)
+
+        if out is not None:
+            grad = out
+        elif error:
+            grad = [np.zeros((len(ps),) + f0.shape), np.zeros(len(ps))]
+        else:
+            grad = np.zeros((len(ps),) + f0.shape)
+        jac, graderr = grad if error else (grad, None)
+
+        res = self.residuals.ravel() if error else None
+        numerical = []
+        nbytes = 8 * ANALYTIC_GRAD_FIELDS * self._gradient_tile().volume
+        nbatch = max(int(max_mem // nbytes), 1)
+        for start in range(0, len(ps), nbatch):
+            dmodels = self.model_gradients(ps[start:start+nbatch])
+            for i, dmodel in enumerate(dmodels, start):
+                if dmodel is None:
+                    numerical.append(i)
+                    continue
+
+                jac[i] = sample(dmodel, **kwargs)
+                if error:
+                    graderr[i] = -2*np.dot(res, dmodel.ravel())
+
+        if len(numerical) > 0:
+            nps = [ps[i] for i in numerical]
+            if error:
+                njac, nerr = self.gradmodel_e(params=nps, dl=dl, rts=rts,
+                        **kwargs)
+            else:
+                njac = self.gradmodel(params=nps, dl=dl, rts=rts,
+                        batch=batch, **kwargs)
+
+            for k, i in enumerate(numerical):
+                jac[i] = njac[k]
+                if error:
+                    graderr[i] = nerr[k]
+        return grad
+
+    def _grad_param_groups(self, params, dl=2e-5):
+        """
+        Split `params` into groups whose model update regions do not overlap,
+        so that the parameters of each group may be perturbed by `dl` at the
+        same time. Returns a list of (group, tiles) where tiles are the
+        (outer, inner, iotile) update tiles of each parameter in the group as
+        from `get_update_io_tiles`, or None if that parameter does not change
+        the model.
+        """
+        groups, bounds = [], []
+        for p in params:
+            val = self.get_values(p)
+            tiles = self.get_update_io_tiles(p, val+dl)
+            if tiles[1] is None or (tiles[1].shape <= 0).any():
+                tiles = None
+
+            # first fit into a group with no overlapping regions
+            for ind, (l, r) in enumerate(bounds):
+                if tiles is None:
+                    break
+                if len(l) == 0:
+                    continue
+                itile = tiles[1]
+                overlaps = np.minimum(r, itile.r) > np.maximum(l, itile.l)
+                if not overlaps.all(axis=1).any():
+                    break
+            else:
+                ind = len(groups)
+                groups.append(([], []))
+                bounds.append((np.zeros((0, self.dim), dtype='int'),
+                        np.zeros((0, self.dim), dtype='int')))
+
+            groups[ind][0].append(p)
+            groups[ind][1].append(tiles)
+            if tiles is not None:
+                l, r = bounds[ind]
+                bounds[ind] = (np.vstack([l, tiles[1].l]),
+                        np.vstack([r, tiles[1].r]))
+        return groups
+
+    def _update_disjoint(self, params, values, tiles):
+        """
+        Update `params` to `values`, where `tiles` are the (outer, inner,
+        iotile) update tiles of each parameter (see `_grad_param_groups`)
+        and the inner tiles do not overlap. If all of the parameters belong
+        to one component with a difference model, the component is updated
+        once and the model is changed over each parameter's tile alone.
+        Otherwise the parameters are updated one at a time.
+        """
+        comps = self.affected_components(params)
+        if len(comps) != 1 or not self.mdl.get_difference_model(comps[0].category):
+            for p, v in zip(params, values):
+                self.update(p, v)
+            return
+
+        comp = comps[0]
+        tiles = [t for t in tiles if t is not None]
+        fields = []
+        for outer, inner, iotile in tiles:
+            comp.set_tile(outer)
+            fields.append(np.array(comp.get(), dtype='float'))
+
+        super(ImageState, self).update(params, values)
+
+        for (outer, inner, iotile), field in zip(tiles, fields):
+            self.set_tile(outer)
+            diff = self.mdl.evaluate(
+                self.comps, 'get', diffmap={comp.category: comp.get() - field}
+            )
+            if np.ndim(diff) > 0:
+                diff = diff[iotile.slicer]
+            self.update_from_model_diff(diff, inner)
+
     def get(self, name):
         """ Return component by category name """
         for c in self.comps:
@@ -767,6 +1079,100 @@ class ImageState(State, comp.ComponentCollection):
         self._loglikelihood += self._calc_loglikelihood(newmodel, tile=tile)
         self._residuals[tile.slicer] = self._data[tile.slicer] - newmodel
 
+    def update_from_model_diff(self, diff, tile):
+        """
+        Add the (scalar or array) model difference `diff` to the model in
+        `tile`, updating the residuals and loglikelihood in place. With the
+        residuals r, the loglikelihood changes by (r.diff - diff.diff/2)/sig^2,
+        summed over the part of `tile` inside the image (not the pad) as in
+        `_calc_loglikelihood`
+        """
+        res = self._residuals[tile.slicer]
+        if self._journal is not None:
+            self._journal.append((tile.copy(), res.copy()))
+
+        inner = util.Tile.intersection(tile, self.ishape)
+        if (inner.shape > 0).all():
+            islicer = inner.translate(-tile.l).slicer
+            r = res[islicer]
+            if np.ndim(diff) == 0:
+                rd, dd = diff*r.sum(), diff*diff*r.size
+            else:
+                d = diff[islicer]
+                ind = 'ijklmn'[:d.ndim]
+                sub = '{0},{0}->'.format(ind)
+                rd, dd = np.einsum(sub, r, d), np.einsum(sub, d, d)
+            self._loglikelihood += (rd - 0.5*dd) / self.sigma**2
+
+        self._model[tile.slicer] += diff
+        np.subtract(self._data[tile.slicer], self._model[tile.slicer], out=res)
+
+    @contextmanager
+    def residuals_journal(self):
+        """
+        Record a copy of the residuals of every update tile before it is
+        changed, so that the effect of a group of updates on the error can be
+        found from the changed tiles alone with
+        :func:`~peri.states.ImageState.residuals_change`::
+
+            with st.residuals_journal() as journal:
+                st.update(params, values)
+                derr, dres = st.residuals_change(journal)
+
+        Journals may be nested; the entries of an inner journal are also
+        added to the enclosing one.
+        """
+        outer, self._journal = self._journal, []
+        try:
+            yield self._journal
+        finally:
+            inner, self._journal = self._journal, outer
+            if outer is not None:
+                outer.extend(inner)
+
+    def residuals_change(self, journal, tile=None):
+        """
+        Change of the residuals since the start of a residuals journal.
+
+        Parameters
+        ----------
+        journal : list
+            The journal yielded by
+            :func:`~peri.states.ImageState.residuals_journal`
+        tile : :class:`~peri.util.Tile`, optional
+            The region (in padded image coordinates) over which to measure the
+            change. Default is the bounding tile of all journaled updates.
+
+        Returns
+        -------
+        derr : Float
+            The change in the state error over `tile`.
+        dres : Float
+            The sum of the squared change of the residuals over `tile`.
+        """
+        if len(journal) == 0:
+            return 0.0, 0.0
+        if tile is None:
+            tile = util.Tile.boundingtile([t for t, _ in journal])
+
+        tile = util.Tile.intersection(tile, self.ishape)
+        if (tile.shape <= 0).any():
+            return 0.0, 0.0
+
+        # rebuild the residuals at the start of the journal by rolling back
+        # the saved tiles, latest first
+        present = self._residuals[tile.slicer]
+        absent = present.copy()
+        for t, res in reversed(journal):
+            sub = util.Tile.intersection(t, tile)
+            if (sub.shape <= 0).any():
+                continue
+            absent[sub.translate(-tile.l).slicer] = res[sub.translate(-t.l).slicer]
+
+        delta = (present - absent).ravel()
+        derr = np.dot((present + absent).ravel(), delta)
+        return derr, np.dot(delta, delta)
+
     def exports(self):
         raise NotImplementedError('inherited but not relevant')
 
@@ -847,7 +1253,7 @@ class ImageState(State, comp.ComponentCollection):
         self.reset()
 
 
-def save(state, filename=None, desc='', extra=None):
+def save(state, filename=None, desc='', extra=None, psfcache=False):
     """
     Save the current state with extra information (for example samples and LL
     from the optimization procedure).
@@ -868,6 +1274,11 @@ def save(state, filename=None, desc='', extra=None):
 
     extra : list of pickleable objects
         if provided, will be saved with the state
+
+    psfcache : boolean
+        if True and the state has an exact psf, also save the cached psf
+        slices to filename + ``peri.comp.exactpsf.PSF_CACHE_SUFFIX`` so that
+        they need not be recalculated when the state is loaded
     """
     if isinstance(state.image, util.RawImage):
         desc = desc or 'save'
@@ -891,7 +1302,11 @@ def save(state, filename=None, desc='', extra=None):
 
     pickle.dump(save, open(filename, 'wb'), protocol=2)
 
-def load(filename):
+    psf = state.get('psf')
+    if psfcache and isinstance(psf, exactpsf.ExactPSF):
+        exactpsf.save_cache(filename + exactpsf.PSF_CACHE_SUFFIX, psf)
+
+def load(filename, psfcache=True):
     """
     Load the state from the given file, moving to the file's directory during
     load (temporarily, moving back after loaded)
@@ -900,9 +1315,16 @@ def load(filename):
     ----------
     filename : string
         name of the file to open, should be a .pkl file
+
+    psfcache : boolean
+        if True, restore the psf cache saved alongside the state by
+        :func:`save` (if present) before the psf is recalculated
     """
     path, name = os.path.split(filename)
     path = path or '.'
 
+    cachename = name + exactpsf.PSF_CACHE_SUFFIX
     with util.indir(path):
+        if psfcache and os.path.exists(cachename):
+            exactpsf.load_cache(cachename)
         return pickle.load(open(name, 'rb'))
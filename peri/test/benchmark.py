@@ -0,0 +1,344 @@
+"""
+Timing benchmarks for the core operations on a state, built on the fake
+states of :mod:`peri.test.init`. Each benchmark is run for a set of image
+sizes and particle counts, and the results are stored as JSON so that runs
+from different commits can be compared::
+
+    python -m peri.test.benchmark -o new.json --compare old.json
+
+or from python::
+
+    from peri.test import benchmark
+    results = benchmark.run(['update-particle'], imsizes=(32,), particles=(8,))
+    benchmark.save(results, 'new.json')
+    benchmark.compare(benchmark.load('old.json'), results)
+"""
+from __future__ import print_function
+from builtins import range
+
+import copy
+import json
+import time
+import platform
+import subprocess
+import os
+from collections import OrderedDict
+from itertools import product
+
+import numpy as np
+import scipy
+
+from peri.comp import exactpsf
+from peri.opt import addsubtract, optimize
+from peri.test import init
+from peri.logger import log as baselog
+log = baselog.getChild('benchmark')
+
+# default parameters of a benchmark run
+DEFAULT_IMSIZES = (32, 64)
+DEFAULT_PARTICLES = (8, 40)
+DEFAULT_RADIUS = 5.0
+DEFAULT_REPEAT = 5
+
+# particle counts which would pack the image more densely than this are
+# skipped, since the configurations cannot be relaxed
+MAX_PACKING_FRACTION = 0.45
+
+# relative slow down which counts as a regression in `compare`
+REGRESSION_TOLERANCE = 0.1
+
+#=============================================================================
+# The benchmarks themselves
+#=============================================================================
+# Each benchmark takes the base state for a configuration and returns a pair
+# (setup, func). `setup()` returns the arguments of `func`, which is the
+# operation that is timed. The base state must not be modified, so any
+# benchmark which changes the state works on a copy.
+def _alternating_update(st, param, delta):
+    """ Update `param` by +/- `delta` in turn, so the state does not drift """
+    sign = [1]
+    def func():
+        sign[0] *= -1
+        st.update(param, st.get_values(param) + sign[0]*delta)
+    return func
+
+def bench_update_particle(st):
+    st = copy.deepcopy(st)
+    return tuple, _alternating_update(st, 'sph-0-x', 0.1)
+
+def bench_update_ilm(st):
+    st = copy.deepcopy(st)
+    return tuple, _alternating_update(st, 'ilm-b0-3', 1e-3)
+
+def bench_update_psf(st):
+    st = copy.deepcopy(st)
+    return tuple, _alternating_update(st, 'psf-sigx', 1e-3)
+
+def bench_spheres_initialize(st):
+    obj = st.get('obj')
+    return tuple, obj.initialize
+
+def bench_exactpsf_execute(st):
+    psf = exactpsf.ExactLineScanConfocalPSF()
+    psf.set_shape(st.oshape, st.ishape)
+    psf.set_tile(st.oshape)
+    field = st.get('obj').get().copy()
+    return tuple, lambda: psf.execute(field)
+
+def _perturbed(st, scale=0.3):
+    """ A copy of `st` with the particle positions randomly displaced """
+    def setup():
+        out = copy.deepcopy(st)
+        inds = list(range(out.obj_get_positions().shape[0]))
+        pos = out.param_particle_pos(inds)
+        vals = np.array(out.get_values(pos))
+        out.update(pos, vals + scale*np.random.randn(*vals.shape))
+        return (out,)
+    return setup
+
+def bench_lm_particles(st):
+    particles = list(range(min(5, st.obj_get_positions().shape[0])))
+    func = lambda s: optimize.do_levmarq_particles(s, particles, max_iter=1)
+    return _perturbed(st), func
+
+def bench_lm_globals(st):
+    params = st.get('ilm').params
+    def setup():
+        out = copy.deepcopy(st)
+        out.update(params, np.array(out.get_values(params)) * 1.01)
+        return (out,)
+    func = lambda s: optimize.do_levmarq(s, params, max_iter=1, run_length=1)
+    return setup, func
+
+def bench_add_subtract(st):
+    def setup():
+        out = copy.deepcopy(st)
+        out.obj_remove_particle([0])
+        return (out,)
+    func = lambda s: addsubtract.add_subtract(s, max_iter=1)
+    return setup, func
+
+BENCHMARKS = OrderedDict([
+    ('update-particle', bench_update_particle),
+    ('update-ilm', bench_update_ilm),
+    ('update-psf', bench_update_psf),
+    ('spheres-initialize', bench_spheres_initialize),
+    ('exactpsf-execute', bench_exactpsf_execute),
+    ('lm-particles', bench_lm_particles),
+    ('lm-globals', bench_lm_globals),
+    ('add-subtract', bench_add_subtract),
+])
+
+#=============================================================================
+# Running and comparing
+#=============================================================================
+def time_function(setup, func, repeat=DEFAULT_REPEAT):
+    """
+    Time `func(*setup())` `repeat` times, returning a list of the times in
+    seconds. The time spent in `setup` is not included.
+    """
+    times = []
+    for i in range(repeat):
+        args = setup()
+        t0 = time.time()
+        func(*args)
+        times.append(time.time() - t0)
+    return times
+
+def _commit():
+    """ The git commit of the source tree, if available """
+    try:
+        path = os.path.dirname(os.path.abspath(__file__))
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=path,
+                stderr=subprocess.STDOUT)
+        return out.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def metadata():
+    """ Information about the environment a benchmark is run in """
+    try:
+        import peri
+        version = peri.__version__
+    except Exception:
+        version = None
+
+    return OrderedDict([
+        ('date', time.strftime('%Y-%m-%d %H:%M:%S')),
+        ('commit', _commit()),
+        ('peri', version),
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('scipy', scipy.__version__),
+        ('platform', platform.platform()),
+    ])
+
+def configurations(imsizes=DEFAULT_IMSIZES, particles=DEFAULT_PARTICLES,
+        radius=DEFAULT_RADIUS):
+    """
+    The (imsize, particles) pairs to run, skipping those which would be
+    packed more densely than MAX_PACKING_FRACTION
+    """
+    vparticle = 4./3*np.pi*radius**3
+    out = []
+    for imsize, N in product(imsizes, particles):
+        if N * vparticle <= MAX_PACKING_FRACTION * imsize**3:
+            out.append((imsize, N))
+        else:
+            log.warning('Skipping {} particles in an image of size {}'.format(
+                N, imsize))
+    return out
+
+def run(names=None, imsizes=DEFAULT_IMSIZES, particles=DEFAULT_PARTICLES,
+        radius=DEFAULT_RADIUS, repeat=DEFAULT_REPEAT, seed=10):
+    """
+    Run the benchmarks.
+
+    Parameters
+    ----------
+    names : list of strings, optional
+        The names of the benchmarks in `BENCHMARKS` to run. Default is all.
+
+    imsizes : list of ints, optional
+        Sizes of the (cubic) images of the states.
+
+    particles : list of ints, optional
+        Numbers of particles in the states. Every image size is run with
+        every particle count that fits.
+
+    radius : float, optional
+        Radius of the particles.
+
+    repeat : int, optional
+        Number of times each benchmark is timed.
+
+    seed : int, optional
+        Random seed for the particle configurations and perturbations.
+
+    Returns
+    -------
+    results : dict
+        Dictionary with the `meta` data of the run and a list of `results`,
+        one for each benchmark and configuration.
+    """
+    names = names or list(BENCHMARKS.keys())
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError('Unknown benchmark {}'.format(name))
+
+    results = []
+    for imsize, N in configurations(imsizes, particles, radius):
+        st = init.create_many_particle_state(imsize=imsize, N=N,
+                radius=radius, seed=seed, sigma=0.05)
+
+        for name in names:
+            np.random.seed(seed)
+            setup, func = BENCHMARKS[name](st)
+            times = time_function(setup, func, repeat=repeat)
+            log.info('{} imsize={} particles={}: {:.4g} s'.format(
+                name, imsize, N, min(times)))
+
+            results.append(OrderedDict([
+                ('benchmark', name), ('imsize', imsize), ('particles', N),
+                ('radius', radius), ('times', times), ('best', min(times)),
+                ('mean', float(np.mean(times))),
+            ]))
+
+    return OrderedDict([
+        ('meta', metadata()), ('repeat', repeat), ('results', results)
+    ])
+
+def save(results, filename):
+    """ Save the `results` of a run to a JSON file """
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2)
+
+def load(filename):
+    """ Load the results of a run from a JSON file """
+    with open(filename) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+def _key(result):
+    return (result['benchmark'], result['imsize'], result['particles'])
+
+def compare(old, new, tolerance=REGRESSION_TOLERANCE, verbose=True):
+    """
+    Compare the best times of two runs, `old` and `new`, for the benchmarks
+    and configurations they share.
+
+    Parameters
+    ----------
+    old, new : dict
+        Results of :func:`~peri.test.benchmark.run`
+
+    tolerance : float, optional
+        Fractional slow down of `new` which counts as a regression.
+
+    verbose : bool, optional
+        Whether to print a table of the comparison.
+
+    Returns
+    -------
+    regressions : list of tuples
+        (benchmark, imsize, particles, old time, new time) of every
+        regression.
+    """
+    reference = {_key(r): r['best'] for r in old['results']}
+
+    rows, regressions = [], []
+    for r in new['results']:
+        key = _key(r)
+        if key not in reference:
+            continue
+
+        t0, t1 = reference[key], r['best']
+        ratio = t1 / t0 if t0 > 0 else np.inf
+        rows.append(key + (t0, t1, ratio))
+        if ratio > 1 + tolerance:
+            regressions.append(key + (t0, t1))
+
+    if verbose:
+        fmt = '{:<20} {:>7} {:>9} {:>11} {:>11} {:>7}'
+        print(fmt.format('benchmark', 'imsize', 'particles', 'old (s)',
+            'new (s)', 'ratio'))
+        for name, imsize, N, t0, t1, ratio in rows:
+            flag = ' *' if ratio > 1 + tolerance else ''
+            print(fmt.format(name, imsize, N, '%.4g' % t0, '%.4g' % t1,
+                '%.2f' % ratio) + flag)
+    return regressions
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="PERI benchmarks")
+    parser.add_argument('benchmarks', nargs='*',
+        help='benchmarks to run, any of: ' + ', '.join(BENCHMARKS.keys()))
+    parser.add_argument('--imsize', '-s', type=int, nargs='+',
+        default=DEFAULT_IMSIZES, help='image sizes')
+    parser.add_argument('--particles', '-n', type=int, nargs='+',
+        default=DEFAULT_PARTICLES, help='numbers of particles')
+    parser.add_argument('--radius', '-r', type=float, default=DEFAULT_RADIUS,
+        help='particle radius')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+        help='number of timings of each benchmark')
+    parser.add_argument('--output', '-o', help='JSON file for the results')
+    parser.add_argument('--compare', '-c',
+        help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = run(args.benchmarks, imsizes=args.imsize,
+            particles=args.particles, radius=args.radius, repeat=args.repeat)
+
+    if args.output:
+        save(results, args.output)
+    if args.compare:
+        regressions = compare(load(args.compare), results)
+        return 1 if regressions else 0
+
+    for r in results['results']:
+        print('{:<20} imsize={:<4} particles={:<5} best={:.4g} s'.format(
+            r['benchmark'], r['imsize'], r['particles'], r['best']))
+    return 0
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -5,8 +5,10 @@ from builtins import range, str, object
 import os
 import sys
 import time
+import ctypes
 import inspect
 import itertools
+import multiprocessing
 import numpy as np
 from contextlib import contextmanager
 
@@ -888,6 +890,34 @@ def cdd(d, k):
         if i in d:
             d.pop(i)
 
+#=============================================================================
+# Shared memory arrays
+#=============================================================================
+def is_shared(arr):
+    """ Whether the ndarray ``arr`` is a view of a :func:`shared_array` """
+    base = arr
+    while base is not None:
+        if isinstance(base, ctypes.Array):
+            return True
+        base = getattr(base, 'base', None)
+    return False
+
+def shared_array(arr):
+    """
+    Copy ``arr`` into shared memory, returning an ndarray of the same shape
+    and dtype. Changes to the array are seen by every process forked after
+    the copy is made (and by the parent). Arrays which are already shared
+    are returned as is.
+    """
+    if is_shared(arr):
+        return arr
+
+    raw = multiprocessing.RawArray('b', max(arr.nbytes, 1))
+    out = np.frombuffer(raw, dtype=arr.dtype, count=arr.size)
+    out = out.reshape(arr.shape)
+    out[...] = arr
+    return out
+
 #=============================================================================
 # Progress bar
 #=============================================================================
@@ -1043,16 +1073,145 @@ class ProgressBar(object):
 # useful decorators
 #=============================================================================
 import functools
+import pickle
 import types
 
-def newcache():
-    out = {}
-    out['hits'] = 0
-    out['misses'] = 0
-    out['size'] = 0
-    return out
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache(object):
+    def __init__(self, max_bytes=1e9):
+        """
+        A dictionary-like cache which is bounded by the total number of bytes
+        that it holds, evicting the least recently used entries first.
+
+        Parameters
+        ----------
+        max_bytes : float
+            Maximum size of the cache. Entries which are larger than this
+            on their own are never stored.
+
+        Examples
+        --------
+        >>> cache = LRUCache(max_bytes=1e6)
+        >>> cache.put('a', np.zeros(10))
+        >>> cache.get('a').shape
+        (10,)
+        >>> cache.stats()['hits']
+        1
+        """
+        self.max_bytes = max_bytes
+        self.clear()
+
+    @staticmethod
+    def sizeof(value):
+        """ Number of bytes held by ``value``, recursing into containers """
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, (tuple, list)):
+            return sum(LRUCache.sizeof(v) for v in value)
+        if isinstance(value, dict):
+            return sum(LRUCache.sizeof(v) for v in value.values())
+        return sys.getsizeof(value)
+
+    def clear(self):
+        """ Remove all entries and reset the statistics """
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def get(self, key, default=None):
+        """ Get the value for ``key``, marking it as recently used """
+        if key not in self._data:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def put(self, key, value, nbytes=None):
+        """
+        Store ``value`` under ``key``, evicting old entries as needed. The
+        size of the value may be given by ``nbytes`` if it cannot be found
+        with :func:`LRUCache.sizeof`.
+        """
+        size = self.sizeof(value) if nbytes is None else nbytes
+        if key in self._data:
+            self._data.pop(key)
+            self.nbytes -= self._sizes.pop(key)
+
+        if size > self.max_bytes:
+            return
+
+        self._data[key] = value
+        self._sizes[key] = size
+        self.nbytes += size
+
+        while self.nbytes > self.max_bytes:
+            k, _ = self._data.popitem(last=False)
+            self.nbytes -= self._sizes.pop(k)
+            self.evictions += 1
+
+    def stats(self):
+        """ Dictionary of the hit / miss / eviction counts and current size """
+        return {
+            'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions, 'entries': len(self),
+            'nbytes': self.nbytes, 'max_bytes': self.max_bytes
+        }
+
+    def save(self, filename, keys=None):
+        """
+        Pickle the entries given by ``keys`` (all entries by default) to
+        ``filename`` so that they can be restored with :func:`LRUCache.load`
+        """
+        keys = self.keys() if keys is None else keys
+        items = [(k, self._data[k]) for k in keys if k in self._data]
+        with open(filename, 'wb') as f:
+            pickle.dump(items, f, protocol=2)
+
+    def load(self, filename):
+        """ Add the entries pickled by :func:`LRUCache.save` to the cache """
+        with open(filename, 'rb') as f:
+            items = pickle.load(f)
+        for k, v in items:
+            self.put(k, v)
+
+    def __repr__(self):
+        return "{}({} entries, {} bytes)".format(
+            self.__class__.__name__, len(self), self.nbytes
+        )
+
+def _hashable(arg):
+    """ Hashable version of a memoized argument, keyed on numpy array data """
+    if isinstance(arg, np.ndarray):
+        return (arg.shape, arg.dtype.str, arg.tobytes())
+    if isinstance(arg, Tile):
+        return ('Tile', _hashable(arg.l), _hashable(arg.r))
+    return arg
 
 def memoize(cache_max_size=1e9):
+    """
+    Cache the results of a method on the instance, keyed on its arguments.
+    Each method receives its own :class:`LRUCache` of ``cache_max_size``
+    bytes in ``self._memoize_caches`` which can be emptied with
+    ``self._memoize_clear()``.
+    """
     def memoize_inner(obj):
         cache_name = str(obj)
 
@@ -1062,52 +1221,31 @@ def memoize(cache_max_size=1e9):
             # provide a method to the object to clear the cache too
             if not hasattr(self, '_memoize_caches'):
                 def clear_cache(self):
-                    for k,v in iteritems(self._memoize_caches):
-                        self._memoize_caches[k] = newcache()
+                    for v in self._memoize_caches.values():
+                        v.clear()
                 self._memoize_caches = {}
                 self._memoize_clear = types.MethodType(clear_cache, self)
 
             # next, add the particular cache for this method if it does
             # not already exist in the parent 'self'
             cache = self._memoize_caches.get(cache_name)
-            if not cache:
-                cache = newcache()
+            if cache is None:
+                cache = LRUCache(max_bytes=cache_max_size)
                 self._memoize_caches[cache_name] = cache
 
-            size = 0
-            hashed = []
-
             # let's hash the arguments (both args, kwargs) and be mindful of
             # numpy arrays -- that is, only take care of its data, not the obj
             # itself
-            for arg in args:
-                if isinstance(arg, np.ndarray):
-                    hashed.append(arg.tostring())
-                else:
-                    hashed.append(arg)
-            for k,v in iteritems(kwargs):
-                if isinstance(v, np.ndarray):
-                    hashed.append(v.tostring())
-                else:
-                    hashed.append(v)
+            hashed = tuple(_hashable(arg) for arg in args)
+            hashed += tuple(
+                (k, _hashable(kwargs[k])) for k in sorted(kwargs.keys())
+            )
 
-            hashed = tuple(hashed)
-            if hashed not in cache:
+            ans = cache.get(hashed, _MISSING)
+            if ans is _MISSING:
                 ans = obj(self, *args, **kwargs)
-
-                # if it is not too much to ask, place the answer in the cache
-                if isinstance(ans, np.ndarray):
-                    size = ans.nbytes
-
-                newsize = size + cache['size']
-                if newsize < cache_max_size:
-                    cache[hashed] = ans
-                    cache['misses'] += 1
-                    cache['size'] = newsize
-                return ans
-
-            cache['hits'] += 1
-            return cache[hashed]
+                cache.put(hashed, ans)
+            return ans
 
         return wrapper
 
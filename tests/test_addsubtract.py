@@ -0,0 +1,30 @@
+import unittest
+
+import numpy as np
+
+from peri.opt import addsubtract
+from peri.test import init
+
+class CheckAddTestCase(unittest.TestCase):
+    def check_add(self, batch):
+        st = init.create_many_particle_state(imsize=48, N=10, radius=4.0,
+                sigma=0.05, seed=10)
+        pos = st.obj_get_positions().copy()
+        inds = [0, 3, 6, 9]
+        st.obj_remove_particle(inds)
+
+        # the removed particles, slightly off, and two spurious guesses
+        np.random.seed(1)
+        guess = np.vstack([pos[inds] + 0.3*np.random.randn(len(inds), 3),
+                [[10, 10, 40.], [30, 5, 5]]])
+        accepts, poses = addsubtract.check_add_particles(st, guess, rad=4.0,
+                batch=batch)
+        return accepts, st.error, np.sort(st.obj_get_positions(), axis=0)
+
+    def test_batch_matches_serial(self):
+        a0, err0, pos0 = self.check_add(batch=False)
+        a1, err1, pos1 = self.check_add(batch=True)
+        self.assertEqual(a0, 4)
+        self.assertEqual(a0, a1)
+        self.assertTrue(np.allclose(err0, err1, rtol=1e-10))
+        self.assertTrue(np.allclose(pos0, pos1, atol=1e-8))
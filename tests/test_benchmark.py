@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from peri.test import benchmark
+
+class BenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_run_save_compare(self):
+        names = ['update-particle', 'update-ilm', 'spheres-initialize']
+        results = benchmark.run(names, imsizes=(16,), particles=(2, 1000),
+                radius=3.0, repeat=1)
+        self.assertEqual(len(results['results']), len(names))
+
+        filename = os.path.join(self.tmpdir, 'bench.json')
+        benchmark.save(results, filename)
+        old = benchmark.load(filename)
+        self.assertEqual(benchmark.compare(old, results, verbose=False), [])
+
+        slow = benchmark.load(filename)
+        for r in slow['results']:
+            r['best'] = 2*r['best'] + 1
+        regressions = benchmark.compare(old, slow, verbose=False)
+        self.assertEqual(len(regressions), len(names))
@@ -0,0 +1,119 @@
+import unittest
+
+import numpy as np
+
+from peri.comp import exactpsf
+
+class SeparableTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(10)
+        z, y, x = np.meshgrid(*[np.arange(-3, 4.)]*3, indexing='ij')
+        self.kernel = np.exp(-(x*x + y*y)/4. - z*z/9.) * (1 + 0.1*x*y)
+
+    def test_rank_one(self):
+        a, b, c = [np.random.rand(n) for n in [5, 7, 3]]
+        kernel = a[:,None,None] * b[None,:,None] * c[None,None,:]
+        terms, error = exactpsf.separable_decomposition(kernel, tol=1e-8)
+        self.assertEqual(len(terms), 1)
+        self.assertEqual(len(terms[0][1]), 1)
+        self.assertTrue(error < 1e-8)
+
+    def test_error_within_tolerance(self):
+        for tol in [1e-1, 1e-2, 1e-4]:
+            terms, error = exactpsf.separable_decomposition(self.kernel, tol=tol)
+            approx = sum(
+                a[:,None,None] * b[None,:,None] * c[None,None,:]
+                for a, planes in terms for b, c in planes
+            )
+            actual = np.sqrt(((approx - self.kernel)**2).sum() /
+                    (self.kernel**2).sum())
+            self.assertTrue(error <= tol)
+            self.assertTrue(np.allclose(actual, error))
+
+    def test_convolution_matches_fft(self):
+        field = np.random.rand(12, 10, 11)
+        terms, error = exactpsf.separable_decomposition(self.kernel, tol=1e-12)
+
+        pad = np.zeros(field.shape)
+        pad[:7,:7,:7] = self.kernel
+        pad = np.roll(pad, (-3, -3, -3), axis=(0, 1, 2))
+        ref = np.fft.irfftn(np.fft.rfftn(field) * np.fft.rfftn(pad),
+                s=field.shape)
+
+        out = exactpsf.separable_convolve(field, terms)
+        self.assertTrue(np.allclose(out, ref))
+
+    def test_chebyshev_psf_matches_fft(self):
+        from peri import util
+        tile = util.Tile(24)
+        field = np.random.rand(*tile.shape)
+
+        def execute(tol):
+            psf = exactpsf.ChebyshevLineScanConfocalPSF(separable_tol=tol)
+            psf.set_shape(tile, tile)
+            psf.set_tile(tile)
+            return psf, psf.execute(field)
+
+        ref = execute(None)[1]
+        for tol in [1e-2, 1e-3]:
+            psf, out = execute(tol)
+            self.assertTrue(psf.separable_error <= tol)
+            self.assertTrue(np.abs(out - ref).max() <= tol*np.abs(ref).max())
+
+class ChebyshevExecuteTestCase(unittest.TestCase):
+    def test_chunked_matches_unchunked(self):
+        from peri import util
+        tile = util.Tile((24, 26, 22))
+        psf = exactpsf.ChebyshevLineScanConfocalPSF()
+        psf.set_shape(tile, tile)
+        psf.set_tile(tile)
+
+        np.random.seed(10)
+        field = np.random.rand(*tile.shape)
+        ncoeffs = len(psf.cheb.coefficients)
+        self.assertTrue(psf._cheb_chunk(tile.shape) >= ncoeffs)
+        ref = psf.execute(field)
+
+        nbytes = exactpsf.CHEB_EXECUTE_BYTES
+        try:
+            # a budget of two and then of less than one coefficient
+            for budget in [nbytes // psf._cheb_chunk(tile.shape) * 2, 1]:
+                exactpsf.CHEB_EXECUTE_BYTES = budget
+                self.assertTrue(psf._cheb_chunk(tile.shape) < ncoeffs)
+                out = psf.execute(field)
+                self.assertTrue(np.allclose(out, ref, rtol=1e-12, atol=1e-14))
+        finally:
+            exactpsf.CHEB_EXECUTE_BYTES = nbytes
+
+class ExactPSFExecuteTestCase(unittest.TestCase):
+    def test_matches_per_plane_convolution(self):
+        from peri import util
+        psf = exactpsf.ExactLineScanConfocalPSF()
+        tile = util.Tile(24)
+        psf.set_shape(tile, tile)
+        psf.set_tile(tile)
+
+        np.random.seed(10)
+        field = np.random.rand(*tile.shape)
+        out = psf.execute(field)
+
+        # the original convolution, one 3D transform of a rolled sub-field
+        # for every plane
+        ref = np.zeros_like(field)
+        zc = tile.coords(form='flat')[0]
+        for i, z in enumerate(zc):
+            if z < psf.zrange[0] or z > psf.zrange[1]:
+                continue
+            fs = np.array(tile.shape)
+            fs[0] = psf.support[0]
+            zslice = int(z - psf.zrange[0])
+            middle = field.shape[0]//2
+
+            subpsf = psf._kpad(psf.slices[zslice], fs, norm=True)
+            subfield = np.roll(field, middle - i, axis=0)
+            subfield = subfield[middle-fs[0]//2:middle+fs[0]//2+1]
+            conv = np.fft.irfftn(np.fft.rfftn(subfield) * subpsf,
+                    s=subfield.shape)
+            ref[i] = conv[psf.support[0]//2]
+
+        self.assertTrue(np.allclose(out, ref, rtol=1e-12, atol=1e-14))
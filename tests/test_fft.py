@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+import scipy.fft
+
+from peri import fft as pfft
+
+class PlansTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(10)
+        self.field = np.random.rand(6, 10, 12)
+        self.plans = pfft.FFTPlans()
+
+    def check_transforms(self, plans):
+        f = self.field
+        k = plans.rfftn(f)
+        self.assertTrue(np.allclose(k, np.fft.rfftn(f)))
+        self.assertTrue(np.allclose(plans.irfftn(k, s=f.shape), f))
+
+        k = plans.fftn(f)
+        self.assertTrue(np.allclose(k, np.fft.fftn(f)))
+        self.assertTrue(np.allclose(plans.ifftn(k).real, f))
+
+        # batches transform each array separately
+        k = plans.rfftn_batch(f)
+        self.assertTrue(np.allclose(k, np.fft.rfftn(f, axes=(1,2))))
+        self.assertTrue(np.allclose(
+            plans.irfftn_batch(k, s=f.shape[1:]), f))
+
+        k = plans.fftn_batch([f[0], f[1]])
+        self.assertTrue(np.allclose(k[1], np.fft.fftn(f[1])))
+        self.assertTrue(np.allclose(plans.ifftn_batch(k).real, f[:2]))
+
+    @unittest.skipIf(not pfft.hasfftw, 'pyfftw not installed')
+    def test_fftw_plans(self):
+        self.check_transforms(self.plans)
+
+        # plans are reused for the same transform and shape
+        nplans = len(self.plans.cache.keys())
+        self.plans.rfftn(2*self.field)
+        self.assertEqual(len(self.plans.cache.keys()), nplans)
+
+    @unittest.skipIf(not pfft.hasfftw, 'pyfftw not installed')
+    def test_output_buffer_is_reused(self):
+        k0 = self.plans.rfftn(self.field, copy=False)
+        ref = k0.copy()
+        k1 = self.plans.rfftn(2*self.field, copy=False)
+        self.assertTrue(k0 is k1)
+        self.assertTrue(np.allclose(k0, 2*ref))
+
+        k2 = self.plans.rfftn(self.field)
+        self.assertTrue(k2 is not k1)
+        self.assertTrue(np.allclose(k2, ref))
+
+    def test_fallback(self):
+        saved = pfft.hasfftw, pfft.fft, pfft.fftkwargs
+        pfft.hasfftw, pfft.fft, pfft.fftkwargs = False, scipy.fft, {'workers': 1}
+        try:
+            self.check_transforms(self.plans)
+            self.assertEqual(len(self.plans.cache.keys()), 0)
+        finally:
+            pfft.hasfftw, pfft.fft, pfft.fftkwargs = saved
@@ -0,0 +1,54 @@
+import copy
+import unittest
+
+import numpy as np
+
+from peri.comp import ilms
+from peri.util import Tile
+
+class IncrementalUpdateTestCase(unittest.TestCase):
+    shape = Tile((10, 32, 40))
+
+    def check_updates(self, ilm, nupdates=200):
+        """ Random single parameter updates against a full rebuild """
+        np.random.seed(10)
+        params = [p for p in ilm.params if not p.endswith('-scale')]
+        for i in range(nupdates):
+            p = params[np.random.randint(len(params))]
+            ilm.update(p, ilm.get_values(p) + 0.1*np.random.randn())
+
+        # unpickling drops the cached fields, weights and bases
+        ref = copy.deepcopy(ilm)
+        self.assertTrue(np.allclose(ilm.get(), ref.get(), rtol=0, atol=1e-13))
+
+    def test_barnes(self):
+        for cls in [ilms.BarnesStreakLegPoly2P1D, ilms.BarnesXYLegPolyZ]:
+            self.check_updates(cls(npts=(6,4), zorder=3, shape=self.shape))
+
+    def test_polynomial(self):
+        for cls in [ilms.Polynomial3D, ilms.LegendrePoly3D,
+                ilms.LegendrePoly2P1D, ilms.ChebyshevPoly2P1D]:
+            self.check_updates(cls(order=(3,3,3), shape=self.shape))
+
+class AddOuterTestCase(unittest.TestCase):
+    def check(self, field):
+        np.random.seed(10)
+        vec = np.random.randn(field.shape[0])
+        plane = np.random.randn(*field.shape[1:])
+        ref = field + vec[:,None,None] * plane[None]
+        ilms._add_outer(field, vec, plane)
+        tol = 1e-5 if field.dtype == np.float32 else 1e-13
+        self.assertTrue(np.allclose(field, ref, rtol=0, atol=tol))
+
+    def test_contiguous(self):
+        self.check(np.random.rand(5, 6, 7))
+
+    def test_non_contiguous(self):
+        field = np.random.rand(10, 6, 14)
+        view = field[::2, :, ::2]
+        self.check(view)
+        self.assertTrue(np.shares_memory(view, field))
+
+    def test_float32(self):
+        self.check(np.random.rand(5, 6, 7).astype(np.float32))
+        self.check(np.random.rand(10, 6, 7).astype(np.float32)[::2])
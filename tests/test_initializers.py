@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from peri import initializers
+from peri.priors import overlap
+
+def remove_overlaps_brute(pos, rad, zscale=1):
+    """Every pair i < j in order, as remove_overlaps visits them."""
+    N = rad.shape[0]
+    z = np.array([zscale, 1, 1])
+    for i in range(N):
+        o = np.arange(i+1, N)
+        d = np.sqrt( ((z*(pos[i] - pos[o]))**2).sum(axis=-1) )
+        diff = d - (rad[i] + rad[o])
+        mask = diff < 0
+        for j, d in zip(o[mask], diff[mask]):
+            rad[i] -= np.abs(d)*rad[i]/(rad[i]+rad[j]) + 1e-10
+            rad[j] -= np.abs(d)*rad[j]/(rad[i]+rad[j]) + 1e-10
+
+class RemoveOverlapsTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(11)
+        self.pos = np.random.rand(300, 3) * [10, 30, 30]
+        self.rad = 1 + 0.5*np.random.rand(300)
+
+    def overlaps(self, rad):
+        return overlap.CellList(self.pos, rad, zscale=1.3).overlaps()
+
+    def test_matches_brute_force(self):
+        rad0, rad1 = self.rad.copy(), self.rad.copy()
+        initializers.remove_overlaps(self.pos, rad0, zscale=1.3)
+        remove_overlaps_brute(self.pos, rad1, zscale=1.3)
+        self.assertTrue((rad0 == rad1).all())
+
+    def test_no_overlaps_remain(self):
+        self.assertTrue(len(self.overlaps(self.rad)) > 0)
+        for func in [initializers.remove_overlaps,
+                     initializers.remove_overlaps_naive]:
+            rad = self.rad.copy()
+            func(self.pos, rad, zscale=1.3)
+            self.assertEqual(len(self.overlaps(rad)), 0)
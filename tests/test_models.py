@@ -0,0 +1,38 @@
+import unittest
+
+import numpy as np
+
+from peri import models
+
+class ExpressionTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(10)
+        shape = (48, 48, 48)
+        self.variables = {
+            'H': lambda x: 2*x, 'I': np.random.rand(*shape),
+            'P': np.random.rand(*shape), 'C': 0.3, 'B': np.random.rand(*shape),
+        }
+
+    def test_matches_eval(self):
+        for eq in ['H(I*(1-P)+C*P) + B', 'H((C-I)*P)', '-I/(1+P)**2', 'C*B']:
+            expr = models.Expression(eq)
+            for i in range(2):
+                out = expr(dict(self.variables))
+                self.assertTrue(np.array_equal(out, eval(eq, dict(self.variables))))
+
+    def test_result_not_reused(self):
+        expr = models.Expression('H(I*(1-P)+C*P) + B')
+        out0 = expr(dict(self.variables))
+        ref = out0.copy()
+        expr(dict(self.variables, C=0.5))
+        self.assertTrue(np.array_equal(out0, ref))
+
+    def test_root_call_returning_its_argument(self):
+        expr = models.Expression('H(dI*(1-P))')
+        variables = dict(self.variables, H=lambda x: x,
+                dI=np.random.rand(*self.variables['P'].shape))
+        out0 = expr(dict(variables))
+        ref = out0.copy()
+        out1 = expr(dict(variables, dI=2*variables['dI']))
+        self.assertTrue(out0 is not out1)
+        self.assertTrue(np.array_equal(out0, ref))
@@ -0,0 +1,109 @@
+import unittest
+
+import numpy as np
+
+from peri.util import Tile
+from peri.comp import objs
+from peri.test import init
+
+class SphereProfileTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dr = np.linspace(-8, 8, 100001)
+
+    def _check_bound(self, alpha, tol):
+        table = objs.SphereProfileTable(alpha, tol=tol)
+        for a in [0.5, 1.5, 3.0, 7.3]:
+            bound = 2*tol*(1 + 1/np.maximum(np.abs(self.dr + a), 1e-12))
+            err = np.abs(table.gaussian(self.dr, a) -
+                    objs.sphere_analytical_gaussian(self.dr, a, alpha))
+            self.assertTrue((err <= bound).all())
+            err = np.abs(table.trim(self.dr, a) -
+                    objs.sphere_analytical_gaussian_trim(self.dr, a, alpha))
+            self.assertTrue((err <= bound).all())
+
+    def test_accuracy_default_alpha(self):
+        self._check_bound(0.27595, 1e-8)
+
+    def test_accuracy_other_alphas(self):
+        self._check_bound(0.2, 1e-6)
+        self._check_bound(0.5, 1e-7)
+
+    def test_drawn_spheres(self):
+        pos = np.array([[10.3, 12.1, 11.7], [14.0, 9.2, 13.5], [2.1, 3.3, 1.4]])
+        rad = np.array([3.2, 4.1, 2.5])
+        for method in ['exact-gaussian', 'exact-gaussian-trim']:
+            kw = {'shape': Tile(24), 'method': method}
+            s0 = objs.PlatonicSpheresCollection(pos, rad, **kw)
+            s1 = objs.PlatonicSpheresCollection(pos, rad, profile_tol=1e-8, **kw)
+            self.assertTrue(np.allclose(s0.particles, s1.particles, atol=1e-6))
+
+    def test_alpha_invalidates_table(self):
+        pos = np.array([[10.3, 12.1, 11.7]])
+        sph = objs.PlatonicSpheresCollection(pos, np.array([3.2]),
+                shape=Tile(24), method='exact-gaussian', profile_tol=1e-8)
+        self.assertEqual(sph._profile_table.alpha, sph.alpha[0])
+
+        sph.set_draw_method('exact-gaussian', alpha=0.35)
+        sph.initialize()
+        self.assertEqual(sph._profile_table.alpha, 0.35)
+
+        ref = objs.PlatonicSpheresCollection(pos, np.array([3.2]),
+                shape=Tile(24), method='exact-gaussian', alpha=0.35)
+        self.assertTrue(np.allclose(sph.particles, ref.particles, atol=1e-6))
+
+class BatchDrawTestCase(unittest.TestCase):
+    def test_matches_one_at_a_time(self):
+        np.random.seed(10)
+        # particles well inside, on the edge of and partly outside the field
+        pos = np.random.rand(12, 3) * 30 - 3
+        rad = np.random.rand(12) * 2 + 2.5
+        for method in ['exact-gaussian', 'exact-gaussian-trim', 'lerp']:
+            sph = objs.PlatonicSpheresCollection(pos, rad, shape=Tile(24),
+                    method=method)
+            batch = sph.particles.copy()
+            sph.particles[...] = 0
+            for p0, r0 in zip(sph.pos, sph._drawargs()):
+                sph._draw_particle(p0, r0)
+            self.assertTrue(np.array_equal(batch, sph.particles))
+
+            # an update of many particles against a rebuild
+            params = sph.param_radii()
+            sph.update(params, np.array(sph.get_values(params)) * 1.05)
+            full = sph.particles.copy()
+            sph.initialize()
+            self.assertTrue(np.allclose(full, sph.particles, atol=1e-12))
+
+class AddRemoveParticlesTestCase(unittest.TestCase):
+    def test_maps_match_rebuild(self):
+        st = init.create_many_particle_state(imsize=32, N=6, radius=3.0,
+                sigma=0.05, seed=10)
+        obj = st.get('obj')
+        np.random.seed(10)
+        for i in range(20):
+            if np.random.rand() < 0.5 and obj.N > 2:
+                inds = np.random.choice(obj.N, 2, replace=False)
+                st.obj_remove_particle(list(inds))
+            else:
+                st.obj_add_particle(32*np.random.rand(2, 3), [3.0, 3.0])
+
+        params, pindex = list(obj._params), dict(obj._pindex)
+        pmap, lmap = dict(st.pmap), dict(st.lmap)
+        field, model = obj.particles.copy(), st._model.copy()
+
+        obj.setup_variables()
+        st.trigger_parameter_change()
+        self.assertEqual(params, obj._params)
+        self.assertEqual(pindex, obj._pindex)
+        self.assertEqual(pmap, dict(st.pmap))
+        self.assertEqual(lmap, dict(st.lmap))
+
+        values = np.hstack([obj.pos, obj.rad[:,None]]).ravel()
+        self.assertTrue(np.array_equal(values,
+                obj.get_values_at(obj.param_indices(params[:-1]))))
+        self.assertTrue(np.array_equal(sorted(values),
+                sorted(obj.get_values(params[:-1]))))
+
+        obj.initialize()
+        st.calculate_model()
+        self.assertTrue(np.allclose(field, obj.particles, rtol=0, atol=1e-12))
+        self.assertTrue(np.allclose(model, st._model, rtol=0, atol=1e-12))
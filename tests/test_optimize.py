@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+
+from peri.util import Tile
+from peri.opt import optimize
+from peri.test import init
+
+class TileJacobianTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(10)
+        tile = Tile([3, 4, 5], [13, 16, 15])
+        tiles, blocks = [], []
+        for i in range(6):
+            l = np.random.randint(0, 6, size=3)
+            t = Tile(l, np.minimum(l + np.random.randint(2, 8, size=3),
+                    tile.shape))
+            tiles.append(t)
+            blocks.append(np.random.randn(*t.shape))
+        self.J = optimize.TileJacobian(tile, tiles, blocks)
+
+        self.dense = np.zeros((6,) + tuple(tile.shape))
+        for a, (t, b) in enumerate(zip(tiles, blocks)):
+            self.dense[a][t.slicer] = b
+        self.dense = self.dense.reshape(6, -1)
+
+    def test_products(self):
+        J, dense = self.J, self.dense
+        self.assertTrue(np.allclose(J.todense(), dense, rtol=0, atol=0))
+        self.assertTrue(np.allclose(J.jtj(), np.dot(dense, dense.T)))
+        vec = np.random.randn(dense.shape[1])
+        self.assertTrue(np.allclose(J.dot(vec), np.dot(dense, vec)))
+        vec = np.random.randn(dense.shape[0])
+        self.assertTrue(np.allclose(J.tdot(vec), np.dot(dense.T, vec)))
+
+    def test_indexing(self):
+        J, dense = self.J, self.dense
+        mask = np.array([True, False, True, True, False, False])
+        for key in [mask, slice(1, 4), [0, 5]]:
+            sub = J[key]
+            self.assertTrue(isinstance(sub, optimize.TileJacobian))
+            self.assertTrue(np.allclose(sub.todense(), dense[key]))
+        self.assertTrue(np.allclose(J[2], dense[2]))
+        self.assertTrue(np.allclose(J[:, ::3], dense[:, ::3]))
+
+        rows = np.random.randn(3, dense.shape[1])
+        J[mask] = rows
+        self.assertTrue(np.allclose(J.todense()[~mask], dense[~mask]))
+        for row, t, b in zip(rows, [J.tiles[i] for i in [0, 2, 3]],
+                [J.blocks[i] for i in [0, 2, 3]]):
+            self.assertTrue(np.allclose(row.reshape(J.tile.shape)[t.slicer], b))
+
+class SparseLMParticlesTestCase(unittest.TestCase):
+    def test_matches_dense(self):
+        st = init.create_many_particle_state(imsize=32, N=6, radius=3.0,
+                sigma=0.05, seed=10)
+        np.random.seed(10)
+        params = st.param_particle_pos(list(range(6)))
+        st.update(params, np.array(st.get_values(params)) +
+                0.1*np.random.randn(len(params)))
+
+        dense = optimize.LMParticles(st, [0, 1, 2])
+        sparse = optimize.LMParticles(st, [0, 1, 2], sparse_J=True)
+        for lm in [dense, sparse]:
+            lm.update_J()
+        self.assertTrue(isinstance(sparse.J, optimize.TileJacobian))
+        self.assertTrue(np.allclose(sparse.J.todense(), dense.J, atol=1e-10))
+
+        grad = dense.calc_grad()
+        self.assertTrue(np.allclose(sparse.calc_grad(), grad, atol=1e-8))
+        subblock = np.zeros(len(dense.param_names), dtype='bool')
+        subblock[::2] = True
+        self.assertTrue(np.allclose(
+            sparse.find_LM_updates(grad, subblock=subblock),
+            dense.find_LM_updates(grad, subblock=subblock), atol=1e-8))
+        self.assertTrue(np.allclose(sparse.calc_model_cosine(mode='svd'),
+            dense.calc_model_cosine(mode='svd'), atol=1e-8))
+
+        for lm in [dense, sparse]:
+            lm.update_select_J(subblock)
+        self.assertTrue(np.allclose(sparse.JTJ, dense.JTJ, rtol=1e-8))
+
+class ParticleGroupCollectionTestCase(unittest.TestCase):
+    def optimize(self, nproc):
+        st = init.create_many_particle_state(imsize=40, N=16, radius=4.0,
+                sigma=0.05, seed=10)
+        np.random.seed(11)
+        params = st.param_particle_pos(list(range(16)))
+        st.update(params, np.array(st.get_values(params)) +
+                0.3*np.random.randn(len(params)))
+
+        lg = optimize.LMParticleGroupCollection(st, region_size=16,
+                do_calc_size=False, nproc=nproc, max_iter=3)
+        lg.do_run_2()
+        lg.reset(do_calc_size=False)
+        lg.do_run_2()
+        return st
+
+    def test_parallel_matches_serial(self):
+        st1 = self.optimize(nproc=1)
+        st2 = self.optimize(nproc=2)
+        self.assertTrue(np.allclose(st1.error, st2.error, rtol=1e-6))
+        self.assertTrue(np.allclose(st1.obj_get_positions(),
+                st2.obj_get_positions(), atol=1e-2))
+
+        model = st2._model.copy()
+        st2.reset()
+        self.assertTrue(np.allclose(model, st2._model, rtol=0, atol=1e-12))
@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from peri.priors import overlap
+
+def brute_overlaps(pos, rad, zscale=1, box=None):
+    delta = pos[:, None, :] - pos[None, :, :]
+    if box is not None:
+        delta -= box * np.round(delta / box)
+    dist = np.sqrt(((np.array([zscale, 1, 1])*delta)**2).sum(axis=-1))
+    i, j = np.nonzero(dist < rad[:, None] + rad[None, :])
+    keep = i < j
+    return np.array([i[keep], j[keep]]).T
+
+class CellListTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(10)
+        self.pos = np.random.rand(400, 3) * [10, 30, 30]
+        self.rad = 1 + 0.5*np.random.rand(400)
+
+    def test_overlaps(self):
+        index = overlap.CellList(self.pos, self.rad, zscale=1.3)
+        self.assertTrue((index.overlaps() ==
+                brute_overlaps(self.pos, self.rad, zscale=1.3)).all())
+
+    def test_periodic(self):
+        box = np.array([10, 30, 30.])
+        index = overlap.CellList(self.pos, self.rad, periodic=True,
+                bounds=(np.zeros(3), box))
+        self.assertTrue((index.overlaps() ==
+                brute_overlaps(self.pos, self.rad, box=box)).all())
+
+    def test_bulk_update(self):
+        prior = overlap.HardSphereOverlapCell(self.pos, self.rad)
+        pos, rad = self.pos.copy(), self.rad.copy()
+        for n in [1, 5, 100]:
+            inds = np.random.choice(400, n, replace=False)
+            pos[inds] = np.random.rand(n, 3) * [12, 32, 32]
+            rad[inds] = 1 + np.random.rand(n)
+            prior.update(inds, pos[inds], rad[inds])
+
+            counts = np.zeros(400, dtype='int')
+            np.add.at(counts, brute_overlaps(pos, rad).ravel(), 1)
+            self.assertTrue((prior.counts == counts).all())
@@ -0,0 +1,31 @@
+import unittest
+
+import numpy as np
+
+from peri.comp import psfcalc
+
+class RadialTableTestCase(unittest.TestCase):
+    def compare(self, rho, z, rtol):
+        direct = psfcalc.get_hsym_asym(rho, z, zint=50., use_table=False)
+        table = psfcalc.get_hsym_asym(rho, z, zint=50., use_table=True)
+        for a, b in zip(direct, table):
+            self.assertTrue(np.abs(a - b).max() < rtol * np.abs(a).max())
+
+    def test_grid_is_exact(self):
+        x, y, z = np.meshgrid(*[np.arange(-6, 7.)]*3, indexing='ij')
+        self.compare(np.sqrt(x*x + y*y), z, 1e-13)
+
+    def test_interpolated(self):
+        np.random.seed(10)
+        rho = 30*np.random.rand(5000)
+        z = np.round(10*np.random.randn(5000))
+        self.compare(rho, z, 1e-6)
+
+class ChunkedDirectTestCase(unittest.TestCase):
+    def test_chunks_are_bit_identical(self):
+        x, y, z = np.meshgrid(*[np.arange(-6, 7.)]*3, indexing='ij')
+        rho = np.sqrt(x*x + y*y)
+        full = psfcalc.get_hsym_asym(rho, z, use_table=False)
+        chunked = psfcalc.get_hsym_asym(rho, z, use_table=False, max_mem=1e5)
+        for a, b in zip(full, chunked):
+            self.assertTrue(np.array_equal(a, b))
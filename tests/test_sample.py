@@ -0,0 +1,22 @@
+import unittest
+
+import numpy as np
+
+from peri.mc import sample
+from peri.test import init
+
+class ParallelSampleTestCase(unittest.TestCase):
+    def test_shared_state_matches_recompute(self):
+        st = init.create_many_particle_state(imsize=40, N=8, radius=3.0,
+                sigma=0.05, seed=10)
+        np.random.seed(10)
+        pos = st.obj_get_positions().copy()
+        sample.sample_particles_parallel(st, N=1, nproc=2)
+        self.assertFalse(np.allclose(pos, st.obj_get_positions()))
+
+        model, res = st._model.copy(), st._residuals.copy()
+        logl = st.loglikelihood
+        st.reset()
+        self.assertTrue(np.allclose(model, st._model, rtol=0, atol=1e-12))
+        self.assertTrue(np.allclose(res, st._residuals, rtol=0, atol=1e-12))
+        self.assertTrue(np.allclose(logl, st.loglikelihood, rtol=1e-12))
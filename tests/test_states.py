@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+
+from peri.test import init
+
+class AnalyticGradientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.state = init.create_single_particle_state(imsize=16, radius=3.0,
+                sigma=0.05, seed=10)
+        st = self.state
+        np.random.seed(10)
+        st.update(st.params, np.array(st.values) +
+                0.01*np.random.randn(len(st.params)))
+
+    def test_matches_finite_differences(self):
+        st = self.state
+        params = (['ilm-scale', 'ilm-off', 'ilm-z-1', 'ilm-b0-4', 'ilm-b1-2'] +
+                ['bkg', 'offset', 'psf-sigx'])
+        inds = np.arange(0, st.residuals.size, 5)
+
+        ja, ea = st.gradmodel_analytic(params=params, inds=inds, flat=False,
+                rts=True, dl=1e-6, error=True)
+        jn, en = st.gradmodel_e(params=params, inds=inds, flat=False,
+                rts=True, dl=1e-6)
+
+        scale = np.abs(jn).max(axis=1)[:,None]
+        self.assertTrue(np.allclose(ja / scale, jn / scale, atol=1e-4))
+        self.assertTrue(np.allclose(ea, en, rtol=1e-3, atol=1e-6))
+
+    def test_fallback_for_non_analytic(self):
+        st = self.state
+        self.assertTrue(st.model_gradient('ilm-b0-4') is not None)
+        self.assertTrue(st.model_gradient('psf-sigx') is None)
+        self.assertTrue(st.model_gradient('sph-0-a') is None)
+
+    def test_max_mem_batches(self):
+        st = self.state
+        params = ['ilm-off', 'ilm-z-1', 'ilm-b0-4', 'bkg', 'offset',
+                'sph-0-a']
+        inds = np.arange(0, st.residuals.size, 5)
+        ref = st.gradmodel_analytic(params=params, inds=inds, rts=True)
+        # at least one parameter at a time, however small the memory
+        for max_mem in [1, 1e6]:
+            grad = st.gradmodel_analytic(params=params, inds=inds, rts=True,
+                    max_mem=max_mem)
+            self.assertTrue(np.allclose(grad, ref, rtol=0, atol=1e-12))
+
+    def test_batch_matches_full_image(self):
+        st = self.state
+        params = ['ilm-off', 'ilm-z-1', 'ilm-b0-4', 'ilm-b1-2', 'bkg',
+                'offset', 'sph-0-a']
+        dmodels = st.model_gradients(params)
+        self.assertTrue(dmodels[-1] is None)
+
+        # each derivative through the model over the whole padded image
+        st.set_tile_full()
+        for p, dmodel in zip(params[:-1], dmodels):
+            comp = st.affected_components(p)[0]
+            ref = st.mdl.evaluate(st.comps, 'get',
+                    diffmap={comp.category: comp.gradient(p)})
+            ref = np.broadcast_to(ref, st._model.shape)[st.inner]
+            self.assertTrue(np.allclose(dmodel, ref, rtol=0, atol=1e-12))
+
+class ModelDiffUpdateTestCase(unittest.TestCase):
+    def test_incremental_matches_recompute(self):
+        st = init.create_many_particle_state(imsize=24, N=6, radius=3.0,
+                sigma=0.05, seed=10)
+        np.random.seed(10)
+        params = (st.param_particle_pos(list(range(6))) +
+                st.param_particle_rad(list(range(6))) +
+                ['ilm-b0-3', 'ilm-z-1', 'bkg', 'offset', 'psf-sigx'])
+        for i in range(300):
+            p = params[np.random.randint(len(params))]
+            st.update(p, st.get_values(p) + 0.01*np.random.randn())
+
+        model, res = st._model.copy(), st._residuals.copy()
+        logl = st.loglikelihood
+        st.calculate_model()
+        self.assertTrue(np.allclose(model, st._model, atol=1e-10))
+        self.assertTrue(np.allclose(res, st._residuals, atol=1e-10))
+        self.assertTrue(np.allclose(logl, st.loglikelihood, rtol=1e-10))
+
+class BatchGradientTestCase(unittest.TestCase):
+    def test_batch_matches_serial(self):
+        st = init.create_many_particle_state(imsize=32, N=10, radius=3.0,
+                sigma=0.05, seed=10)
+        params = (st.param_particle_pos(list(range(10))) +
+                st.param_particle_rad(list(range(10))) + ['ilm-b0-3', 'bkg'])
+        self.assertTrue(len(st._grad_param_groups(params)) < len(params))
+
+        slicer = tuple([slice(2, 30)]*3)
+        inds = np.arange(0, st.residuals.size, 3)
+        for kwargs in [{'slicer': slicer}, {'inds': inds}]:
+            js = st.gradmodel(params=params, rts=True, **kwargs)
+            jb = st.gradmodel(params=params, rts=True, batch=True, **kwargs)
+            self.assertTrue(np.allclose(js, jb, rtol=0, atol=5e-12))
+            self.assertTrue(np.allclose(js, st.gradmodel(params=params,
+                rts=True, **kwargs), rtol=0, atol=5e-12))
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from peri import util
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_eviction_by_bytes(self):
+        cache = util.LRUCache(max_bytes=3*800)
+        for i in range(3):
+            cache.put(i, np.zeros(100))
+
+        cache.get(0)
+        cache.put(3, np.zeros(100))
+
+        self.assertEqual(sorted(cache.keys()), [0, 2, 3])
+        self.assertEqual(cache.nbytes, 3*800)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_oversized_not_stored(self):
+        cache = util.LRUCache(max_bytes=100)
+        cache.put('a', np.zeros(100))
+        self.assertNotIn('a', cache)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_save_load(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'cache.pkl')
+            cache = util.LRUCache()
+            cache.put(('a', (4, 4)), np.arange(16.))
+            cache.put(('b', (4, 4)), np.ones(16))
+            cache.save(filename, keys=[('a', (4, 4))])
+
+            other = util.LRUCache()
+            other.load(filename)
+            self.assertEqual(other.keys(), [('a', (4, 4))])
+            self.assertTrue((other.get(('a', (4, 4))) == np.arange(16.)).all())
+        finally:
+            shutil.rmtree(tmpdir)
+
+class MemoizeTestCase(unittest.TestCase):
+    def test_array_arguments(self):
+        class Obj(object):
+            calls = 0
+
+            @util.memoize()
+            def func(self, a):
+                self.calls += 1
+                return a.sum()
+
+        obj = Obj()
+        obj.func(np.zeros(4))
+        obj.func(np.zeros(4))
+        obj.func(np.zeros((2, 2)))
+        self.assertEqual(obj.calls, 2)
+
+        obj._memoize_clear()
+        obj.func(np.zeros(4))
+        self.assertEqual(obj.calls, 3)